@@ -63,7 +63,6 @@ def chunk_file(filepath: Path, chunk_chars: int = DEFAULT_CHUNK_SIZE * 4) -> lis
     if not content.strip():
         return []
 
-    lines = content.splitlines(keepalinenums=False) if hasattr(content, "splitlines") else content.split("\n")
     lines = content.split("\n")
     chunks = []
     current_chunk: list[str] = []
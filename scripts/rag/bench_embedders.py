@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Benchmark RAG embedding backends (torch / onnx / int8) on a fixture corpus.
+
+Reports model load time, corpus encode throughput, single-query latency and
+recall@k against the full-precision torch backend, so a faster backend can be
+chosen for `server.py --embedder` without losing retrieval quality.
+
+The default corpus is this repository's own scripts/ and docs/ trees, chunked
+the same way as scripts/ops/rag_index.py, with a fixed set of queries.
+
+Usage:
+    python3 scripts/rag/bench_embedders.py
+    python3 scripts/rag/bench_embedders.py --backends torch,int8 --k 10 --json
+    python3 scripts/rag/bench_embedders.py --corpus ./src --queries queries.txt
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+# Make scripts.ops / scripts.rag importable
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ops.rag_index import chunk_file, should_index
+from rag.server import EMBED_BACKENDS, EMBED_MODEL_NAME, _load_embedder
+
+REPO_ROOT = Path(__file__).resolve().parents[2]
+DEFAULT_CORPUS = [REPO_ROOT / "scripts", REPO_ROOT / "docs"]
+DEFAULT_QUERIES = [
+    "append usage to the cost ledger",
+    "submit tickets to the batch API",
+    "reconcile batch results with the queue",
+    "model routing aliases for cheap models",
+    "detect duplicate tickets",
+    "validate ticket frontmatter",
+    "wave plan for parallel implementers",
+    "lint fixer for generated code",
+    "prompt caching prefix rules",
+    "budget guard blocks expensive calls",
+    "RAG server search endpoint",
+    "watcher indexes changed files",
+    "project name from backlog.config.json",
+    "classify ticket complexity",
+    "generate commit message from diff",
+    "LiteLLM proxy fallback configuration",
+    "sentinel scans for risky patterns",
+    "start and stop docker services",
+    "chunk files with overlapping lines",
+    "AWS Bedrock credentials setup",
+]
+
+
+def load_corpus(roots: list, max_docs: int) -> list:
+    """Chunk indexable files under roots into at most max_docs documents."""
+    docs = []
+    for root in roots:
+        for path in sorted(Path(root).rglob("*")):
+            if path.is_file() and should_index(path):
+                docs.extend(c["content"] for c in chunk_file(path))
+                if len(docs) >= max_docs:
+                    return docs[:max_docs]
+    return docs
+
+
+def top_k(doc_vecs: np.ndarray, query_vecs: np.ndarray, k: int) -> np.ndarray:
+    """Exact cosine top-k document indices for each query."""
+    docs = doc_vecs / np.linalg.norm(doc_vecs, axis=1, keepdims=True).clip(min=1e-12)
+    queries = query_vecs / np.linalg.norm(query_vecs, axis=1, keepdims=True).clip(min=1e-12)
+    scores = queries @ docs.T
+    return np.argsort(-scores, axis=1)[:, :k]
+
+
+def bench_backend(backend: str, model_name: str, docs: list, queries: list, batch_size: int) -> dict:
+    """Load one backend and time corpus and per-query encoding."""
+    started = time.perf_counter()
+    model = _load_embedder(backend, model_name)
+    load_s = time.perf_counter() - started
+    model.encode(["warm up"])  # first call pays one-off kernel setup
+
+    started = time.perf_counter()
+    doc_vecs = np.asarray(model.encode(docs, batch_size=batch_size), dtype=np.float32)
+    encode_s = time.perf_counter() - started
+
+    latencies, query_vecs = [], []
+    for query in queries:
+        started = time.perf_counter()
+        query_vecs.append(model.encode([query])[0])
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+
+    return {
+        "backend": backend,
+        "load_s": round(load_s, 3),
+        "docs_per_sec": round(len(docs) / encode_s, 1) if encode_s else 0.0,
+        "query_p50_ms": round(statistics.median(latencies), 2),
+        "query_p95_ms": round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))], 2),
+        "doc_vecs": doc_vecs,
+        "query_vecs": np.asarray(query_vecs, dtype=np.float32),
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Benchmark RAG embedding backends")
+    parser.add_argument("--backends", default=",".join(EMBED_BACKENDS),
+                        help="Comma-separated backends to compare (torch is always the reference)")
+    parser.add_argument("--model", default=EMBED_MODEL_NAME, help="sentence-transformers model name")
+    parser.add_argument("--corpus", action="append",
+                        help="Directory to chunk into the corpus (repeatable; default: repo scripts/ and docs/)")
+    parser.add_argument("--queries", help="File with one query per line (default: built-in queries)")
+    parser.add_argument("--max-docs", type=int, default=2000, help="Cap on corpus chunks")
+    parser.add_argument("--k", type=int, default=10, help="k for recall@k")
+    parser.add_argument("--batch-size", type=int, default=64, help="Encode batch size for the corpus")
+    parser.add_argument("--json", action="store_true", help="Print results as JSON")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = [b for b in backends if b not in EMBED_BACKENDS]
+    if unknown:
+        parser.error(f"unknown backend(s): {', '.join(unknown)}")
+    backends = ["torch"] + [b for b in backends if b != "torch"]
+
+    docs = load_corpus(args.corpus or DEFAULT_CORPUS, args.max_docs)
+    if args.queries:
+        queries = [q.strip() for q in Path(args.queries).read_text().splitlines() if q.strip()]
+    else:
+        queries = DEFAULT_QUERIES
+    if not docs or not queries:
+        print("Error: empty corpus or query set", file=sys.stderr)
+        return 1
+    k = min(args.k, len(docs))
+
+    rows, reference = [], None
+    for backend in backends:
+        try:
+            result = bench_backend(backend, args.model, docs, queries, args.batch_size)
+        except Exception as e:
+            if backend == "torch":
+                print(f"Error: reference backend failed: {e}", file=sys.stderr)
+                return 1
+            print(f"[bench] {backend}: skipped ({e})", file=sys.stderr)
+            continue
+        hits = top_k(result.pop("doc_vecs"), result.pop("query_vecs"), k)
+        if reference is None:
+            reference = hits
+        overlap = [len(set(h) & set(r)) / k for h, r in zip(hits, reference)]
+        result[f"recall@{k}"] = round(sum(overlap) / len(overlap), 4)
+        rows.append(result)
+
+    if args.json:
+        print(json.dumps({"model": args.model, "docs": len(docs), "queries": len(queries), "results": rows},
+                         indent=2))
+        return 0
+
+    print(f"model={args.model} docs={len(docs)} queries={len(queries)}")
+    header = ["backend", "load_s", "docs_per_sec", "query_p50_ms", "query_p95_ms", f"recall@{k}"]
+    print("  ".join(f"{h:>13}" for h in header))
+    for row in rows:
+        print("  ".join(f"{row[h]:>13}" for h in header))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,84 @@
+# scripts/rag/chunker.py
+"""Split source files into overlapping, syntax-aware chunks for the RAG index.
+
+Shared by RagClient.index_files and the server's git sync so both produce the
+same ``<project>::<file>::<n>`` documents. Chunks are cut at the last
+definition / heading boundary that fits (falling back to a blank line, then
+to the line limit) and repeat a few short lines of the previous chunk for
+context.
+"""
+
+import re
+from pathlib import Path
+
+MAX_CHUNK_CHARS = 1500
+OVERLAP_LINES = 3
+
+# Lines that start a new top-level unit, by file extension
+_BOUNDARIES = {
+    ".py": r"(async\s+def|def|class)\s|@",
+    ".js": r"(export\s+)?(default\s+)?(async\s+)?(function|class|const|let|var|interface|type)\b",
+    ".go": r"(func|type|var|const)\b",
+    ".rs": r"(pub(\(\w+\))?\s+)?(fn|struct|enum|impl|trait|mod|const|static|type)\b|#\[",
+    ".java": r"\s{0,4}((public|private|protected|static|final|abstract)\s+)*"
+             r"(class|interface|enum|record|[\w<>\[\], ]+\s+\w+\s*\()",
+    ".md": r"#{1,6}\s",
+}
+_BOUNDARIES[".jsx"] = _BOUNDARIES[".ts"] = _BOUNDARIES[".tsx"] = _BOUNDARIES[".js"]
+_BOUNDARY_RES = {ext: re.compile(pattern) for ext, pattern in _BOUNDARIES.items()}
+
+
+def _is_boundary(line: str, boundary) -> bool:
+    if boundary is None:
+        return False
+    if line[:1].isspace() and not boundary.pattern.startswith(r"\s"):
+        return False  # only top-level definitions split chunks
+    return bool(boundary.match(line))
+
+
+def chunk_text(text: str, path: str = "", max_chars: int = MAX_CHUNK_CHARS,
+               overlap_lines: int = OVERLAP_LINES) -> list:
+    """Split text into chunks of at most ~max_chars.
+
+    Returns [{"content", "start_line", "end_line"}] with 1-based inclusive
+    line numbers; an empty or whitespace-only text yields no chunks.
+    """
+    if not text.strip():
+        return []
+    boundary = _BOUNDARY_RES.get(Path(path).suffix.lower())
+    lines = text.split("\n")
+    # Hard-wrap lines longer than a whole chunk so every line fits
+    units = []  # (line_number, text)
+    for number, line in enumerate(lines, 1):
+        while len(line) > max_chars:
+            units.append((number, line[:max_chars]))
+            line = line[max_chars:]
+        units.append((number, line))
+
+    chunks = []
+    start = 0
+    while start < len(units):
+        end, size = start, 0
+        while end < len(units) and size + len(units[end][1]) + 1 <= max_chars:
+            size += len(units[end][1]) + 1
+            end += 1
+        if end < len(units):
+            # Prefer to cut before a definition, else after a blank line, in the back 2/3
+            floor = start + max(1, (end - start) // 3)
+            cut = next((i for i in range(end - 1, floor - 1, -1) if _is_boundary(units[i][1], boundary)), None)
+            if cut is None:
+                cut = next((i + 1 for i in range(end - 1, floor - 1, -1) if not units[i][1].strip()), end)
+            end = max(cut, start + 1)
+        body = "\n".join(text for _, text in units[start:end])
+        if body.strip():
+            chunks.append({"content": body, "start_line": units[start][0], "end_line": units[end - 1][0]})
+        if end >= len(units):
+            break
+        # Overlap for context: at most overlap_lines lines and max_chars // 5
+        # characters, and never more than half this chunk, so each chunk advances
+        budget, back = min(max_chars // 5, len(body) // 2), end
+        while back > start and end - back < overlap_lines and len(units[back - 1][1]) + 1 <= budget:
+            back -= 1
+            budget -= len(units[back][1]) + 1
+        start = max(back, start + 1)
+    return chunks
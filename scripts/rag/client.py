@@ -1,16 +1,390 @@
 # scripts/rag/client.py
+import asyncio
+import hashlib
 import json
 import os
+import random
+import sqlite3
+import threading
+import time
 import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from requests.adapters import HTTPAdapter
+
+try:
+    from .chunker import chunk_text
+except ImportError:  # run as a script: scripts/rag is on sys.path
+    from chunker import chunk_text
+
+INDEX_BATCH_DOCS = 128  # chunks per /index request
+READ_WORKERS = min(16, (os.cpu_count() or 1) * 4)  # parallel file reads in index_files
+CODE_EXTS = {".py", ".ts", ".tsx", ".js", ".jsx", ".go", ".rs", ".java", ".md"}
+IGNORE_DIRS = {".git", "node_modules", "__pycache__", ".mypy_cache", ".ruff_cache", "dist", "build"}
+
+# Transport settings — overridable per client or by env var
+CONNECT_TIMEOUT = float(os.environ.get("RAG_CONNECT_TIMEOUT", "3.05"))
+READ_TIMEOUT = float(os.environ.get("RAG_READ_TIMEOUT", "30"))
+LONG_READ_TIMEOUT = 600.0  # sync / snapshot transfers
+MAX_RETRIES = int(os.environ.get("RAG_MAX_RETRIES", "2"))
+RETRY_BACKOFF = 0.25  # seconds; doubled per attempt, full jitter
+RETRY_BACKOFF_MAX = 4.0
+RETRY_STATUSES = {429, 502, 503, 504}
+POOL_SIZE = 10
+BREAKER_FAILURES = 5  # consecutive failures that open the circuit
+BREAKER_RESET_SECONDS = 30.0  # how long an open circuit fails fast before a trial call
+
+
+# Opt-in on-disk search cache (RagClient(cache=True) or RAG_CLIENT_CACHE=1|<path>)
+CLIENT_CACHE_PATH = os.environ.get("RAG_CLIENT_CACHE_PATH",
+                                   os.path.expanduser("~/.backlog-toolkit/rag/search-cache.sqlite"))
+CLIENT_CACHE_MAX_BYTES = int(os.environ.get("RAG_CLIENT_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+CLIENT_CACHE_CHECK_SECONDS = float(os.environ.get("RAG_CLIENT_CACHE_CHECK_SECONDS", "5"))  # trust a generation this long
+
+
+class RagUnavailableError(requests.exceptions.ConnectionError):
+    """The RAG server is unreachable, or recently was and the circuit is open."""
+
+
+class _CircuitBreaker:
+    """Fails fast after repeated connection failures; lets one trial call through per reset window."""
+
+    def __init__(self, failures: int = BREAKER_FAILURES, reset_seconds: float = BREAKER_RESET_SECONDS):
+        self.failures = failures
+        self.reset_seconds = reset_seconds
+        self._consecutive = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at >= self.reset_seconds:
+                self._opened_at = time.monotonic()  # half-open: one trial, others keep failing fast
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            if self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+
+    @property
+    def is_open(self) -> bool:
+        return self._opened_at is not None
+
+
+class SearchCache:
+    """SQLite cache of search results keyed by request and index generation.
+
+    Entries for an older generation are never returned by get(), only by
+    last_known() when the server is unreachable. Shared safely by threads and
+    by several processes (WAL mode); the least recently used entries are
+    evicted once the stored results exceed max_bytes.
+    """
+
+    def __init__(self, path: str = CLIENT_CACHE_PATH, max_bytes: int = CLIENT_CACHE_MAX_BYTES):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = self.misses = self.stale_hits = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, timeout=5, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute("""CREATE TABLE IF NOT EXISTS entries (
+            key TEXT PRIMARY KEY, request TEXT NOT NULL, results TEXT NOT NULL,
+            size INTEGER NOT NULL, stored_at REAL NOT NULL, used_at REAL NOT NULL)""")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_request ON entries (request, stored_at)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS entries_used ON entries (used_at)")
+
+    @staticmethod
+    def request_key(path: str, payload: dict) -> str:
+        return hashlib.sha256(json.dumps([path, payload], sort_keys=True).encode()).hexdigest()
+
+    @staticmethod
+    def _key(request: str, token: str) -> str:
+        return hashlib.sha256(f"{request}\0{token}".encode()).hexdigest()
+
+    def get(self, request: str, token: str):
+        """Results cached for request at this index generation token, or None."""
+        key = self._key(request, token)
+        with self._lock:
+            row = self._db.execute("SELECT results FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute("UPDATE entries SET used_at = ? WHERE key = ?", (time.time(), key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def last_known(self, request: str):
+        """The most recently stored results for request at any generation, or None."""
+        with self._lock:
+            row = self._db.execute("SELECT results FROM entries WHERE request = ? ORDER BY stored_at DESC LIMIT 1",
+                                   (request,)).fetchone()
+            if row is not None:
+                self.stale_hits += 1
+        return json.loads(row[0]) if row else None
+
+    def put(self, request: str, token: str, results: dict) -> None:
+        data = json.dumps(results)
+        now = time.time()
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?)",
+                             (self._key(request, token), request, data, len(data), now, now))
+            self._evict()
+
+    def _evict(self) -> None:
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Drop least recently used entries down to 90% so eviction is not run on every insert
+        target, doomed = total - int(self.max_bytes * 0.9), []
+        for key, size in self._db.execute("SELECT key, size FROM entries ORDER BY used_at"):
+            if target <= 0:
+                break
+            doomed.append((key,))
+            target -= size
+        self._db.executemany("DELETE FROM entries WHERE key = ?", doomed)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM entries")
+
+    def stats(self) -> dict:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        return {"path": self.path, "entries": entries, "bytes": size, "max_bytes": self.max_bytes,
+                "hits": self.hits, "misses": self.misses, "stale_hits": self.stale_hits}
+
+
+def _open_cache(cache):
+    """Resolve RagClient's cache argument: a SearchCache, True, a path, or None to read RAG_CLIENT_CACHE."""
+    if cache is None:
+        cache = os.environ.get("RAG_CLIENT_CACHE", "")
+        if cache.lower() in ("", "0", "false", "no"):
+            return None
+        if cache.lower() in ("1", "true", "yes"):
+            cache = True
+    if not cache or isinstance(cache, SearchCache):
+        return cache or None
+    return SearchCache(CLIENT_CACHE_PATH if cache is True else cache)
+
+
+# One keep-alive session and breaker per server, shared by every RagClient in the process
+_sessions: dict = {}
+_breakers: dict = {}
+_transport_lock = threading.Lock()
+
+
+def _transport(base_url: str) -> tuple:
+    with _transport_lock:
+        if base_url not in _sessions:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=POOL_SIZE, pool_maxsize=POOL_SIZE)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            _sessions[base_url] = session
+            _breakers[base_url] = _CircuitBreaker()
+        return _sessions[base_url], _breakers[base_url]
+
+
+def _search_payload(project: str, query: str, n: int, filter: dict, mode: str, options: dict) -> dict:
+    payload = {"project": project, "query": query, "n_results": n}
+    if filter:
+        payload["filter"] = filter
+    if mode:
+        payload["mode"] = mode
+    payload.update({k: v for k, v in options.items() if v is not None})
+    return payload
+
+
+def _rel_path(path: str) -> str:
+    """The ``file`` metadata for path: relative to CWD when possible."""
+    p = Path(path)
+    try:
+        return str(p.relative_to(os.getcwd())) if p.is_absolute() else str(p)
+    except ValueError:
+        return str(p)
+
+
+def tree_files(root: str) -> list:
+    """Absolute paths of indexable source files under root, skipping IGNORE_DIRS."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in IGNORE_DIRS]
+        found.extend(os.path.join(dirpath, f) for f in filenames if Path(f).suffix in CODE_EXTS)
+    return found
+
+
+def _file_documents(project: str, path: str, type: str) -> list:
+    """Chunk one file into (id, document, metadata) tuples; None if it is not a readable file."""
+    p = Path(path)
+    rel = _rel_path(path)
+    try:
+        chunks = chunk_text(p.read_text(errors="ignore"), rel)
+    except OSError:  # missing, a directory, or unreadable
+        return None
+    return [(f"{project}::{rel}::{n}", chunk["content"], {
+        "type": type, "file": rel, "project": project, "chunk": n, "chunks": len(chunks),
+        "start_line": chunk["start_line"], "end_line": chunk["end_line"],
+    }) for n, chunk in enumerate(chunks)]
+
+
+def _iter_file_documents(project: str, paths, type: str, workers: int):
+    """Yield (path, documents) in input order, reading up to 2*workers files ahead on a thread pool."""
+    paths = iter(paths)
+    pending = deque()
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        def submit() -> None:
+            path = next(paths, None)
+            if path is not None:
+                pending.append((path, pool.submit(_file_documents, project, path, type)))
+
+        for _ in range(2 * max(1, workers)):
+            submit()
+        while pending:
+            path, future = pending.popleft()
+            submit()
+            yield path, future.result()
+
+
+def _iter_batches(file_documents, batch_size: int, empty: list):
+    """Group (path, documents) into batches of at most batch_size documents.
+
+    Yields (batch, files_completed) as soon as each batch fills; files with no
+    chunks are appended to empty. The final item may carry an empty batch.
+    """
+    batch, completed = [], 0
+    for path, documents in file_documents:
+        if not documents:
+            if documents is not None:
+                empty.append(path)
+            completed += 1
+            continue
+        for document in documents:
+            batch.append(document)
+            if len(batch) >= batch_size:
+                yield batch, completed
+                batch, completed = [], 0
+        completed += 1
+    if batch or completed:
+        yield batch, completed
+
+
+def _index_body(project: str, batch: list) -> dict:
+    return {
+        "project": project,
+        "documents": [doc for _, doc, _ in batch],
+        "ids": [doc_id for doc_id, _, _ in batch],
+        "metadatas": [meta for _, _, meta in batch],
+    }
+
+
+def _add_totals(totals: dict, result: dict) -> None:
+    for key in ("indexed", "skipped_unchanged", "pruned"):
+        totals[key] += result.get(key, 0)
+    totals.update({k: v for k, v in result.items() if k not in totals})
 
 
 class RagClient:
-    def __init__(self, project: str = None, base_url: str = None):
+    def __init__(self, project: str = None, base_url: str = None, connect_timeout: float = None,
+                 read_timeout: float = None, max_retries: int = None, cache=None):
         self.base_url = base_url or os.environ.get("RAG_BASE_URL", "http://localhost:8001")
         self.project = project or self._detect_project()
+        self.cache = _open_cache(cache)
+        self.degraded = False  # True when the last search was answered from the cache while the server was down
+        self._index_token = None  # (epoch, generation) last reported by the server
+        self._index_token_at = 0.0
+        self.connect_timeout = CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        self.read_timeout = READ_TIMEOUT if read_timeout is None else read_timeout
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        self.session, self.breaker = _transport(self.base_url)
+
+    def _request(self, method: str, path: str, retry: bool = True, read_timeout: float = None, **kwargs):
+        """Send a request over the pooled session.
+
+        Idempotent calls (retry=True) are retried up to max_retries times on
+        connection errors, timeouts and 429/502/503/504, with jittered
+        exponential backoff (honouring Retry-After). Raises RagUnavailableError
+        when the server cannot be reached or the circuit breaker is open.
+        """
+        url = f"{self.base_url}{path}"
+        kwargs.setdefault("timeout", (self.connect_timeout, read_timeout or self.read_timeout))
+        if method != "get" and not path.startswith("/search"):
+            self._index_token = None  # our own write: recheck the generation before the next cached search
+        attempts = 1 + (self.max_retries if retry else 0)
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                raise RagUnavailableError(f"RAG server {self.base_url} unavailable (circuit open)")
+            delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt)
+            try:
+                r = getattr(self.session, method)(url, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts:
+                    raise RagUnavailableError(f"RAG server {self.base_url} unreachable: {e}") from e
+                time.sleep(random.uniform(0, delay))
+                continue
+            if r.status_code in RETRY_STATUSES:
+                if r.status_code != 429:
+                    self.breaker.record_failure()
+                if attempt + 1 < attempts:
+                    retry_after = r.headers.get("Retry-After")
+                    time.sleep(float(retry_after) if str(retry_after).isdigit() else random.uniform(0, delay))
+                    continue
+                return r
+            self.breaker.record_success()
+            return r
+
+    def _current_index_token(self):
+        """The project's (epoch, generation), rechecked at most every CLIENT_CACHE_CHECK_SECONDS."""
+        if self._index_token is None or time.monotonic() - self._index_token_at >= CLIENT_CACHE_CHECK_SECONDS:
+            r = self._request("get", f"/projects/{self.project}/stats")
+            stats = r.json() if r.status_code == 200 else {}
+            self._index_token = (stats["epoch"], stats["generation"]) if "epoch" in stats else None
+            self._index_token_at = time.monotonic()
+        return self._index_token
+
+    def _post_search(self, path: str, payload: dict) -> dict:
+        """POST a search, answering from the on-disk cache when enabled.
 
-    def _detect_project(self) -> str:
+        Hits require the server's current index generation; if the server is
+        unreachable the last known results are returned and degraded is set.
+        """
+        if self.cache is None:
+            return self._request("post", path, json=payload).json().get("results", {})
+        request = SearchCache.request_key(path, payload)
+        try:
+            token = self._current_index_token()
+            results = self.cache.get(request, f"{token[0]}:{token[1]}") if token else None
+            if results is None:
+                r = self._request("post", path, json=payload)
+                body = r.json()
+                results = body.get("results", {})
+                # Only cache a result produced at exactly the generation we checked
+                if token and r.status_code == 200 and (body.get("epoch"), body.get("generation")) == token:
+                    self.cache.put(request, f"{token[0]}:{token[1]}", results)
+        except RagUnavailableError:
+            results = self.cache.last_known(request)
+            if results is None:
+                raise
+            self.degraded = True
+            return results
+        self.degraded = False
+        return results
+
+    @staticmethod
+    def _detect_project() -> str:
         """Walk up from CWD looking for backlog.config.json. Returns project.name or CWD basename."""
         path = Path(os.getcwd())
         for p in [path] + list(path.parents):
@@ -23,50 +397,251 @@ class RagClient:
                     pass
         return path.name
 
-    def search(self, query: str, n: int = 5, filter: dict = None) -> dict:
-        payload = {"project": self.project, "query": query, "n_results": n}
-        if filter:
-            payload["filter"] = filter
-        r = requests.post(f"{self.base_url}/search", json=payload)
-        return r.json().get("results", {})
-
-    def index_files(self, paths: list, type: str = "code") -> dict:
-        docs, ids, metas = [], [], []
-        cwd = Path(os.getcwd())
-        for path in paths:
-            p = Path(path)
-            if not p.exists():
-                continue
-            try:
-                rel = str(p.relative_to(cwd)) if p.is_absolute() else str(p)
-            except ValueError:
-                rel = str(p)
-            content = p.read_text(errors="ignore")[:2000]
-            docs.append(content)
-            ids.append(f"{self.project}::{rel}::0")
-            metas.append({"type": type, "file": rel, "project": self.project})
-        if not docs:
-            return {"indexed": 0}
-        r = requests.post(f"{self.base_url}/index", json={
+    def search(self, query: str, n: int = 5, filter: dict = None, mode: str = None, **options) -> dict:
+        """Search the project.
+
+        options are passed through to /search: max_chars, include, snippet
+        (result trimming) and min_score, diversify, mmr_lambda, max_per_file,
+        fetch_k (re-ranking). Options set to None are omitted.
+        """
+        return self._post_search("/search", _search_payload(self.project, query, n, filter, mode, options))
+
+    def search_batch(self, queries: list, n: int = 5, **options) -> dict:
+        """Run several searches in one request. Items are query strings or
+        dicts with query/n_results/filter/id. Returns results keyed by id or query.
+        options (see search) apply to every query unless a query overrides them."""
+        payload = {
             "project": self.project,
-            "documents": docs,
-            "ids": ids,
-            "metadatas": metas,
-        })
-        return r.json()
+            "queries": queries,
+            "n_results": n,
+        }
+        payload.update({k: v for k, v in options.items() if v is not None})
+        return self._post_search("/search/batch", payload)
+
+    _rel_path = staticmethod(_rel_path)
+
+    def index_files(self, paths: list, type: str = "code", batch_size: int = INDEX_BATCH_DOCS,
+                    workers: int = READ_WORKERS, progress=None) -> dict:
+        """Index whole files as overlapping chunks ``<project>::<file>::0..n``.
+
+        Files are read and chunked on a pool of workers threads while earlier
+        batches of at most batch_size documents upload, so memory holds only
+        the current batch and the read-ahead. The server drops stored chunks
+        beyond a file's new chunk count, and files that became empty are
+        removed from the index. progress(files_done, files_total) is called
+        after each batch. Raises requests.HTTPError if the server rejects one.
+        """
+        paths = list(paths)
+        totals = {"indexed": 0, "skipped_unchanged": 0, "pruned": 0}
+        empty, done = [], 0
+        documents = _iter_file_documents(self.project, paths, type, workers)
+        for batch, completed in _iter_batches(documents, batch_size, empty):
+            if batch:
+                r = self._request("post", "/index", json=_index_body(self.project, batch))
+                r.raise_for_status()  # callers such as the watcher must not record rejected files
+                _add_totals(totals, r.json())
+            done += completed
+            if progress:
+                progress(done, len(paths))
+        if empty:
+            totals["pruned"] += self.delete_files(empty).get("removed", 0)
+        return totals
 
     def upsert_file(self, path: str, type: str = "code") -> dict:
         return self.index_files([path], type=type)
 
+    def delete_files(self, paths: list) -> dict:
+        """Remove every indexed chunk of the given files from the project."""
+        if not paths:
+            return {"removed": 0}
+        r = self._request("delete", f"/projects/{self.project}/files",
+                          json={"files": [self._rel_path(p) for p in paths]})
+        r.raise_for_status()
+        return r.json()
+
+    def delete_file(self, path: str) -> dict:
+        return self.delete_files([path])
+
+    def sync(self, repo_path: str = ".", revision: str = "HEAD", full: bool = False) -> dict:
+        """Ask the server to reindex only the files changed since the last synced revision."""
+        r = self._request("post", f"/projects/{self.project}/sync", retry=False, read_timeout=LONG_READ_TIMEOUT,
+                          json={
+                              "repo_path": str(Path(repo_path).resolve()),
+                              "revision": revision,
+                              "full": full,
+                          })
+        return r.json()
+
+    def export_snapshot(self, path: str) -> int:
+        """Download the project's index snapshot to path. Returns bytes written."""
+        written = 0
+        with self._request("get", f"/projects/{self.project}/export", read_timeout=LONG_READ_TIMEOUT,
+                           stream=True) as r:
+            r.raise_for_status()
+            with open(path, "wb") as f:
+                for block in r.iter_content(chunk_size=1 << 20):
+                    f.write(block)
+                    written += len(block)
+        return written
+
+    def import_snapshot(self, path: str, mode: str = "replace") -> dict:
+        """Upload a snapshot file into the project (mode: replace or merge)."""
+        with open(path, "rb") as f:
+            # Not retried: the body is a file stream that cannot be replayed
+            r = self._request("post", f"/projects/{self.project}/import", retry=False,
+                              read_timeout=LONG_READ_TIMEOUT, params={"mode": mode}, data=f,
+                              headers={"Content-Type": "application/octet-stream"})
+        return r.json()
+
     def clear(self) -> dict:
-        r = requests.delete(f"{self.base_url}/projects/{self.project}")
+        r = self._request("delete", f"/projects/{self.project}")
         return r.json()
 
     def stats(self) -> dict:
-        r = requests.get(f"{self.base_url}/projects/{self.project}/stats")
+        r = self._request("get", f"/projects/{self.project}/stats")
         return r.json()
 
 
+class AsyncRagClient:
+    """asyncio client for fanning out many searches or index batches at once.
+
+    Requires aiohttp. Use as an async context manager so the connection pool
+    is closed; at most max_connections requests are in flight, the rest queue
+    for a free connection. Retries and the circuit breaker behave as in
+    RagClient (the breaker is shared with RagClient for the same server).
+
+        async with AsyncRagClient(project="my-api") as rag:
+            results = await rag.search_many(["auth middleware", "token refresh"])
+    """
+
+    def __init__(self, project: str = None, base_url: str = None, max_connections: int = POOL_SIZE,
+                 connect_timeout: float = None, read_timeout: float = None, max_retries: int = None):
+        self.base_url = base_url or os.environ.get("RAG_BASE_URL", "http://localhost:8001")
+        self.project = project or RagClient._detect_project()
+        self.max_connections = max_connections
+        self.connect_timeout = CONNECT_TIMEOUT if connect_timeout is None else connect_timeout
+        self.read_timeout = READ_TIMEOUT if read_timeout is None else read_timeout
+        self.max_retries = MAX_RETRIES if max_retries is None else max_retries
+        _, self.breaker = _transport(self.base_url)
+        self._session = None
+
+    async def __aenter__(self):
+        try:
+            import aiohttp
+        except ImportError as e:
+            raise ImportError("AsyncRagClient requires aiohttp. Run: pip install aiohttp") from e
+        self._aiohttp = aiohttp
+        self._session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(limit=self.max_connections),
+            timeout=aiohttp.ClientTimeout(sock_connect=self.connect_timeout, sock_read=self.read_timeout),
+        )
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    async def close(self) -> None:
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _request(self, method: str, path: str, raise_for_status: bool = False, **kwargs) -> dict:
+        """Send one request and return its JSON body, retrying like RagClient._request.
+
+        With raise_for_status, a final 4xx/5xx response raises
+        aiohttp.ClientResponseError instead of returning the error body.
+        """
+        if self._session is None:
+            raise RuntimeError("AsyncRagClient must be used as 'async with AsyncRagClient(...)'")
+        url = f"{self.base_url}{path}"
+        attempts = 1 + self.max_retries
+        for attempt in range(attempts):
+            if not self.breaker.allow():
+                raise RagUnavailableError(f"RAG server {self.base_url} unavailable (circuit open)")
+            delay = min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * 2 ** attempt)
+            try:
+                async with self._session.request(method, url, **kwargs) as response:
+                    status, retry_after = response.status, response.headers.get("Retry-After")
+                    body = await response.json(content_type=None)
+            except (self._aiohttp.ClientConnectionError, asyncio.TimeoutError) as e:
+                self.breaker.record_failure()
+                if attempt + 1 >= attempts:
+                    raise RagUnavailableError(f"RAG server {self.base_url} unreachable: {e!r}") from e
+                await asyncio.sleep(random.uniform(0, delay))
+                continue
+            if status in RETRY_STATUSES:
+                if status != 429:
+                    self.breaker.record_failure()
+                if attempt + 1 < attempts:
+                    await asyncio.sleep(float(retry_after) if str(retry_after).isdigit()
+                                        else random.uniform(0, delay))
+                    continue
+            else:
+                self.breaker.record_success()
+            if raise_for_status and status >= 400:
+                response.raise_for_status()
+            return body
+
+    async def search(self, query: str, n: int = 5, filter: dict = None, mode: str = None, **options) -> dict:
+        """Search the project (same options as RagClient.search)."""
+        body = await self._request("post", "/search",
+                                   json=_search_payload(self.project, query, n, filter, mode, options))
+        return body.get("results", {})
+
+    async def search_many(self, queries: list, n: int = 5, **options) -> list:
+        """Run searches concurrently; returns one result dict per query, in order.
+
+        Items are query strings or dicts with query plus any search keyword
+        (n, filter, mode, shaping/ranking options) overriding the shared ones.
+        """
+        specs = [{"query": q} if isinstance(q, str) else q for q in queries]
+        return await asyncio.gather(*(self.search(**{"n": n, **options, **spec}) for spec in specs))
+
+    async def index_many(self, paths: list, type: str = "code", batch_size: int = INDEX_BATCH_DOCS,
+                         workers: int = READ_WORKERS) -> dict:
+        """Index files like RagClient.index_files, posting /index batches concurrently.
+
+        Files are read and chunked on worker threads, off the event loop, and
+        each batch is posted as soon as it is ready with at most
+        max_connections uploads in flight.
+        """
+        empty = []
+        batches = _iter_batches(_iter_file_documents(self.project, paths, type, workers), batch_size, empty)
+        totals = {"indexed": 0, "skipped_unchanged": 0, "pruned": 0}
+        in_flight = set()
+
+        def collect(done) -> None:
+            for task in done:
+                _add_totals(totals, task.result())
+
+        try:
+            while True:
+                item = await asyncio.to_thread(next, batches, None)
+                if item is None:
+                    break
+                batch, _ = item
+                if not batch:
+                    continue
+                if len(in_flight) >= self.max_connections:
+                    done, in_flight = await asyncio.wait(in_flight, return_when=asyncio.FIRST_COMPLETED)
+                    collect(done)
+                in_flight.add(asyncio.ensure_future(
+                    self._request("post", "/index", raise_for_status=True,
+                                  json=_index_body(self.project, batch))))
+            if in_flight:
+                done, in_flight = await asyncio.wait(in_flight)
+                collect(done)
+        finally:
+            for task in in_flight:
+                task.cancel()
+            batches.close()
+        if empty:
+            removed = await self._request("delete", f"/projects/{self.project}/files", raise_for_status=True,
+                                          json={"files": [_rel_path(p) for p in empty]})
+            totals["pruned"] += removed.get("removed", 0)
+        return totals
+
+
 if __name__ == "__main__":
     import sys
     cmd = sys.argv[1] if len(sys.argv) > 1 else "stats"
@@ -79,10 +654,27 @@ if __name__ == "__main__":
     if cmd == "upsert" and len(sys.argv) > 2:
         target = sys.argv[2]
         doc_type = "ticket" if "backlog/data" in target else "code"
-        print(c.upsert_file(target, type=doc_type))
+        if os.path.isdir(target):
+            def report(done: int, total: int) -> None:
+                print(f"\r[rag] {done}/{total} files", end="", file=sys.stderr, flush=True)
+
+            result = c.index_files(tree_files(target), type=doc_type, progress=report)
+            print(file=sys.stderr)
+            print(result)
+        else:
+            print(c.upsert_file(target, type=doc_type))
+    elif cmd == "sync":
+        repo = sys.argv[2] if len(sys.argv) > 2 and not sys.argv[2].startswith("--") else "."
+        rev = sys.argv[sys.argv.index("--revision") + 1] if "--revision" in sys.argv else "HEAD"
+        print(c.sync(repo, revision=rev, full="--full" in sys.argv))
+    elif cmd == "export" and len(sys.argv) > 2:
+        print(f"wrote {c.export_snapshot(sys.argv[2])} bytes to {sys.argv[2]}")
+    elif cmd == "import" and len(sys.argv) > 2:
+        print(c.import_snapshot(sys.argv[2], mode="merge" if "--merge" in sys.argv else "replace"))
     elif cmd == "stats":
         print(c.stats())
     elif cmd == "clear":
         print(c.clear())
     else:
-        print(f"Unknown command: {cmd}. Use: upsert <file>, stats, clear")
+        print(f"Unknown command: {cmd}. Use: upsert <file|dir>, sync [repo] [--revision REV] [--full], "
+              f"export <file>, import <file> [--merge], stats, clear")
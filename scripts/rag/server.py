@@ -2,24 +2,61 @@
 """
 RAG Server for Backlog Toolkit
 Provides code search and retrieval via HTTP API
+
+Concurrency model:
+    main() serves the app from a gunicorn ``gthread`` pool (``--workers`` x
+    ``--threads``), falling back to the threaded Werkzeug server when gunicorn
+    is not installed. Within a process all threads share one embedding model,
+    one set of ChromaDB clients and the in-memory caches. Encode calls are
+    serialised on a lock because torch already spreads a single encode across
+    all cores; request threads overlap everything else (HTTP, JSON, ChromaDB).
+    A micro-batching scheduler coalesces encode requests that arrive within a
+    few milliseconds of each other into one encode call.
+    An admission gate bounds in-flight /search and /index work: excess requests
+    wait in a short queue and receive 429 + Retry-After once it is full.
+    Each extra worker process loads its own model and caches; index
+    generations are kept on disk so a write in one worker invalidates the
+    others' result caches, type counters and lexical indexes.
 """
 
 import os
 import sys
+import re
+import json
+import math
+import time
+import heapq
+import fcntl
+import hashlib
+import itertools
+import queue
+import shutil
+import tempfile
+import atexit
+import subprocess
 import argparse
 import logging
-from typing import Optional, Dict, Any
+import threading
+import uuid
+from collections import OrderedDict, Counter
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Hashable
 from pathlib import Path
 
 try:
-    from flask import Flask, jsonify, request
+    from flask import Flask, Response, jsonify, request, g, stream_with_context
     import chromadb
+    import numpy as np
     from sentence_transformers import SentenceTransformer
 except ImportError as e:
     print(f"Error: Missing dependencies. Install with:")
     print(f"  pip install flask chromadb sentence-transformers")
     sys.exit(1)
 
+# chunker.py sits next to this file (also in the container image)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+from chunker import chunk_text
+
 # Setup logging
 logging.basicConfig(
     level=logging.INFO,
@@ -33,23 +70,500 @@ app = Flask(__name__)
 # Per-project ChromaDB base path — can be overridden by env var or test monkeypatch
 BASE_PATH = os.environ.get("RAG_BASE_PATH", os.path.expanduser("~/.backlog-toolkit/rag/chroma"))
 
-# Per-project state: project_name -> client / collection
-_clients: dict = {}
+# Per-project state: project_name -> client / collection, least recently used first
+_clients: OrderedDict = OrderedDict()
 _collections: dict = {}
+_last_used: Dict[str, float] = {}
+_collections_lock = threading.Lock()
+
+# Resident-project limits — idle or least-recently-used projects are closed so a
+# long-running server does not keep every PersistentClient (SQLite + HNSW) alive
+MAX_RESIDENT_PROJECTS = int(os.environ.get("RAG_MAX_RESIDENT_PROJECTS", "16"))
+PROJECT_IDLE_SECONDS = float(os.environ.get("RAG_PROJECT_IDLE_SECONDS", "1800"))
+# Evicted clients are closed after this grace period so requests still holding
+# their collection can finish
+EVICTION_GRACE_SECONDS = 60.0
+_retired_clients: list = []  # (close_after, project, client)
 
-# Embedding model — loaded lazily on first use
+# Embedding model — loaded lazily on first use, shared by all request threads.
+# Backends: torch (full precision), onnx (ONNX Runtime, needs optimum[onnxruntime])
+# and int8 (torch dynamic int8 quantization of the Linear layers).
+EMBED_MODEL_NAME = os.environ.get("RAG_EMBED_MODEL", 'all-MiniLM-L6-v2')
+EMBED_BACKENDS = ("torch", "onnx", "int8")
+EMBED_BACKEND = os.environ.get("RAG_EMBEDDER", "torch")
 _embedder: Optional[SentenceTransformer] = None
+_embedder_lock = threading.Lock()
+_encode_lock = threading.Lock()
+
+# Startup warm-up — when enabled (main --warmup) each worker loads the model,
+# runs a dummy encode and opens the hot projects in the background; /ready
+# answers 503 until that has finished. Without warm-up the server is ready as
+# soon as the model has been loaded lazily.
+_PROCESS_STARTED = time.monotonic()
+_warmup_enabled = False
+_warmup_projects: list = []
+_ready = threading.Event()
+_startup_metrics: Dict[str, Any] = {
+    "model_load_seconds": None,
+    "warmup_encode_seconds": None,
+    "projects_load_seconds": None,
+    "projects_loaded": [],
+    "ready_after_seconds": None,
+    "warmup_error": None,
+}
+
+# Query-embedding cache settings — overridable by env var or CLI flags
+EMBED_CACHE_SIZE = int(os.environ.get("RAG_EMBED_CACHE_SIZE", "4096"))
+EMBED_CACHE_TTL = float(os.environ.get("RAG_EMBED_CACHE_TTL", "86400"))
+EMBED_CACHE_PATH = os.environ.get("RAG_EMBED_CACHE_PATH") or None
+EMBED_CACHE_SAVE_INTERVAL = 60.0
+
+
+class _LRUCache:
+    """Thread-safe LRU cache with an optional TTL (seconds, 0 = never expires)."""
+
+    def __init__(self, max_size: int, ttl: float = 0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict = OrderedDict()  # key -> (stored_at, value)
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value or None, counting the lookup as a hit or miss."""
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and self.ttl and time.time() - item[0] > self.ttl:
+                del self._data[key]
+                item = None
+            if item is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return item[1]
+
+    def put(self, key: Hashable, value: Any, stored_at: Optional[float] = None) -> None:
+        """Store a value, evicting least-recently-used entries beyond max_size."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (time.time() if stored_at is None else stored_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def items(self) -> list:
+        """Return a snapshot of (key, stored_at, value) tuples, oldest first."""
+        with self._lock:
+            return [(k, v[0], v[1]) for k, v in self._data.items()]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+            }
+
+
+_embedding_cache = _LRUCache(EMBED_CACHE_SIZE, EMBED_CACHE_TTL)
+_embedding_cache_saved_at = 0.0
+_embedding_cache_save_lock = threading.Lock()
+
+# Search-result cache, keyed by each project's index generation. Generations
+# live in <BASE_PATH>/.generations/<project>.gen so every worker process sees
+# every write, and only ever increase (also across project deletes and
+# restarts), so a write makes every older entry unreachable and cached hits
+# are never stale. The epoch identifies that directory: if it is wiped,
+# generations restart from 0 under a new epoch.
+RESULT_CACHE_SIZE = int(os.environ.get("RAG_RESULT_CACHE_SIZE", "1024"))
+_result_cache = _LRUCache(RESULT_CACHE_SIZE)
+GENERATIONS_DIR = ".generations"
+_generations_lock = threading.Lock()
+# Generation this process's type counters and lexical index reflect, per project
+_seen_generations: Dict[str, int] = {}
+_index_epochs: Dict[str, str] = {}  # BASE_PATH -> epoch
 
 
 def _get_embedder() -> SentenceTransformer:
     """Return the embedding model, loading it on first call."""
     global _embedder
     if _embedder is None:
-        logger.info("Loading embedding model...")
-        _embedder = SentenceTransformer('all-MiniLM-L6-v2')
+        with _embedder_lock:
+            if _embedder is None:
+                logger.info(f"Loading embedding model {EMBED_MODEL_NAME} ({EMBED_BACKEND})...")
+                started = time.monotonic()
+                _embedder = _load_embedder(EMBED_BACKEND, EMBED_MODEL_NAME)
+                _startup_metrics["model_load_seconds"] = round(time.monotonic() - started, 3)
+                logger.info(f"Embedding model loaded in {_startup_metrics['model_load_seconds']}s")
+                if not _warmup_enabled:
+                    _mark_ready()
     return _embedder
 
 
+def _load_embedder(backend: str, model_name: str) -> SentenceTransformer:
+    """Load model_name with the given embedding backend."""
+    if backend not in EMBED_BACKENDS:
+        raise ValueError(f"unknown embedder backend {backend!r} (expected one of {', '.join(EMBED_BACKENDS)})")
+    if backend == "onnx":
+        # sentence-transformers >= 3.2 exports/loads the ONNX graph itself
+        return SentenceTransformer(model_name, backend="onnx")
+    model = SentenceTransformer(model_name)
+    if backend == "int8":
+        import torch
+        model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+    return model
+
+
+def _embedding_model_id() -> str:
+    """Identify the vectors the current embedder produces (model + backend)."""
+    return f"{EMBED_MODEL_NAME}:{EMBED_BACKEND}"
+
+
+def _encode_direct(texts: list) -> list:
+    """Embed texts with the shared model in one encode call. Returns plain float lists."""
+    model = _get_embedder()
+    _encode_batch_sizes.observe(len(texts))
+    with _encode_lock, _timed("embed"):
+        return model.encode(texts).tolist()
+
+
+def _mark_ready() -> None:
+    """Record how long the process took to become ready and open /ready."""
+    if not _ready.is_set():
+        _startup_metrics["ready_after_seconds"] = round(time.monotonic() - _PROCESS_STARTED, 3)
+        _ready.set()
+
+
+def _warm_up(projects: list) -> None:
+    """Load the model, run a dummy encode and open hot projects, then mark the server ready."""
+    try:
+        _get_embedder()
+        # The first encode pays one-off kernel setup (thread pools, JIT, allocator)
+        started = time.monotonic()
+        _encode_direct(["warm up the embedding model"])
+        _startup_metrics["warmup_encode_seconds"] = round(time.monotonic() - started, 3)
+
+        started = time.monotonic()
+        on_disk = set(_on_disk_projects())
+        for project in projects:
+            if project not in on_disk:
+                logger.warning(f"Warm-up: project {project!r} has no index yet, skipping")
+                continue
+            _get_collection(project).count()
+            _startup_metrics["projects_loaded"].append(project)
+        _startup_metrics["projects_load_seconds"] = round(time.monotonic() - started, 3)
+    except Exception as e:
+        _startup_metrics["warmup_error"] = str(e)
+        logger.error(f"Warm-up failed: {e}")
+        return
+    _mark_ready()
+    logger.info(f"Warm-up complete, ready after {_startup_metrics['ready_after_seconds']}s")
+
+
+def _start_warmup() -> None:
+    """Run _warm_up in a background thread when warm-up is enabled."""
+    if _warmup_enabled:
+        threading.Thread(target=_warm_up, args=(list(_warmup_projects),),
+                         name="rag-warmup", daemon=True).start()
+
+
+def _encode(texts: list) -> list:
+    """Embed texts, coalescing with concurrent callers when the scheduler is enabled."""
+    if _scheduler is not None:
+        return _scheduler.submit(texts)
+    return _encode_direct(texts)
+
+
+class _Histogram:
+    """Thread-safe histogram with fixed upper bounds (Prometheus-style cumulative buckets)."""
+
+    def __init__(self, buckets: list):
+        self.buckets = sorted(buckets)
+        self._counts = [0] * (len(self.buckets) + 1)  # last slot is +Inf
+        self._sum = 0.0
+        self._count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value: float) -> None:
+        with self._lock:
+            i = 0
+            while i < len(self.buckets) and value > self.buckets[i]:
+                i += 1
+            self._counts[i] += 1
+            self._sum += value
+            self._count += 1
+
+    def snapshot(self) -> dict:
+        """Return count, sum, mean and cumulative ``le`` bucket counts."""
+        with self._lock:
+            cumulative, running = {}, 0
+            for bound, n in zip(self.buckets + ["+Inf"], self._counts):
+                running += n
+                cumulative[str(bound)] = running
+            return {
+                "count": self._count,
+                "sum": round(self._sum, 6),
+                "mean": round(self._sum / self._count, 6) if self._count else 0.0,
+                "buckets": cumulative,
+            }
+
+
+# Request metrics — exported in Prometheus text format by /metrics (per process)
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0]
+_request_counts: Counter = Counter()  # (route, method, status) -> requests
+_request_latency: Dict[tuple, _Histogram] = {}  # (route, method) -> seconds
+_stage_latency: Dict[str, _Histogram] = {}  # embed / chroma_query / chroma_write / lexical -> seconds
+_encode_batch_sizes = _Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256, 512])
+_metrics_lock = threading.Lock()
+
+
+def _latency_histogram(registry: dict, key: Hashable) -> _Histogram:
+    with _metrics_lock:
+        hist = registry.get(key)
+        if hist is None:
+            hist = registry[key] = _Histogram(LATENCY_BUCKETS)
+        return hist
+
+
+@contextmanager
+def _timed(stage: str):
+    """Record the wall time of the enclosed block under a pipeline stage."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        _latency_histogram(_stage_latency, stage).observe(time.perf_counter() - started)
+
+
+@app.before_request
+def _start_request_timer():
+    g.rag_started = time.perf_counter()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.pop("rag_started", None)
+    if started is not None:
+        # Label by URL rule, not raw path, so /projects/<name> stays one series
+        route = request.url_rule.rule if request.url_rule else "<unmatched>"
+        with _metrics_lock:
+            _request_counts[(route, request.method, response.status_code)] += 1
+        _latency_histogram(_request_latency, (route, request.method)).observe(time.perf_counter() - started)
+    return response
+
+
+class _EmbedRequest:
+    """One caller's texts waiting in the embedding scheduler."""
+
+    def __init__(self, texts: list):
+        self.texts = texts
+        self.enqueued_at = time.monotonic()
+        self.done = threading.Event()
+        self.result: Optional[list] = None
+        self.error: Optional[BaseException] = None
+
+
+class _EmbeddingScheduler:
+    """Micro-batches encode requests from concurrent request threads.
+
+    A single worker thread takes the first queued request, keeps collecting
+    more for up to max_wait_ms (or until max_batch texts are gathered), runs
+    one encode call for all of them and hands each caller its slice back.
+    """
+
+    def __init__(self, encode_fn, max_batch: int = 64, max_wait_ms: float = 5.0):
+        self.encode_fn = encode_fn
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self.batch_sizes = _Histogram([1, 2, 4, 8, 16, 32, 64, 128, 256])
+        self.queue_wait_ms = _Histogram([1, 2, 5, 10, 25, 50, 100, 250, 1000])
+        self._queue: queue.Queue = queue.Queue()
+        self._carry: Optional[_EmbedRequest] = None
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+
+    def submit(self, texts: list) -> list:
+        """Queue texts for the next batch and block until their vectors are ready."""
+        if not texts:
+            return []
+        self._ensure_started()
+        req = _EmbedRequest(list(texts))
+        self._queue.put(req)
+        req.done.wait()
+        if req.error is not None:
+            raise req.error
+        return req.result
+
+    def _ensure_started(self) -> None:
+        # Started lazily so each gunicorn worker runs its own thread after fork
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._start_lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="embed-scheduler", daemon=True)
+                self._thread.start()
+
+    def _next_batch(self) -> list:
+        first = self._carry or self._queue.get()
+        self._carry = None
+        batch, size = [first], len(first.texts)
+        deadline = time.monotonic() + self.max_wait
+        while size < self.max_batch:
+            remaining = deadline - time.monotonic()
+            try:
+                req = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if size + len(req.texts) > self.max_batch:
+                self._carry = req  # starts the next batch instead of overflowing this one
+                break
+            batch.append(req)
+            size += len(req.texts)
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            started = time.monotonic()
+            texts = [t for req in batch for t in req.texts]
+            self.batch_sizes.observe(len(texts))
+            for req in batch:
+                self.queue_wait_ms.observe((started - req.enqueued_at) * 1000)
+            try:
+                vectors = self.encode_fn(texts)
+                offset = 0
+                for req in batch:
+                    req.result = vectors[offset:offset + len(req.texts)]
+                    offset += len(req.texts)
+            except Exception as e:
+                for req in batch:
+                    req.error = e
+            for req in batch:
+                req.done.set()
+
+    def stats(self) -> dict:
+        return {
+            "max_batch": self.max_batch,
+            "max_wait_ms": self.max_wait * 1000,
+            "queued": self._queue.qsize(),
+            "batch_size": self.batch_sizes.snapshot(),
+            "queue_wait_ms": self.queue_wait_ms.snapshot(),
+        }
+
+
+# Embedding scheduler — configured by main(); None encodes on the calling thread
+EMBED_BATCH_SIZE = int(os.environ.get("RAG_EMBED_BATCH_SIZE", "64"))
+EMBED_BATCH_WAIT_MS = float(os.environ.get("RAG_EMBED_BATCH_WAIT_MS", "5"))
+_scheduler: Optional[_EmbeddingScheduler] = None
+
+
+def _normalize_query(query: str) -> str:
+    """Collapse whitespace so trivially different spellings share a cache entry."""
+    return " ".join(query.split())
+
+
+def _embed_queries(queries: list) -> list:
+    """Embed query strings, serving repeats from the embedding cache.
+
+    Cache misses are encoded together in a single encode call.
+    """
+    keys = [(_embedding_model_id(), _normalize_query(q)) for q in queries]
+    vectors = [_embedding_cache.get(k) for k in keys]
+    missing = [i for i, v in enumerate(vectors) if v is None]
+    if missing:
+        unique = list(dict.fromkeys(keys[i] for i in missing))
+        encoded = _encode([k[1] for k in unique])
+        fresh = dict(zip(unique, encoded))
+        for key, vector in fresh.items():
+            _embedding_cache.put(key, vector)
+        for i in missing:
+            vectors[i] = fresh[keys[i]]
+        if EMBED_CACHE_PATH and time.time() - _embedding_cache_saved_at > EMBED_CACHE_SAVE_INTERVAL:
+            _save_embedding_cache(background=True)
+    return vectors
+
+
+def _save_embedding_cache(background: bool = False) -> None:
+    """Persist the embedding cache to EMBED_CACHE_PATH (atomic replace).
+
+    With background=True (the request path) the entries are snapshotted here
+    and written from a thread, and a save already in progress makes this a
+    no-op. Exit hooks save in the foreground, after any pending save.
+    """
+    global _embedding_cache_saved_at
+    if not EMBED_CACHE_PATH or not _embedding_cache_save_lock.acquire(blocking=not background):
+        return
+    _embedding_cache_saved_at = time.time()
+    model = _embedding_model_id()
+    entries = [[key[1], stored_at, vector] for key, stored_at, vector in _embedding_cache.items()
+               if key[0] == model]
+    if background:
+        threading.Thread(target=_write_embedding_cache, args=(EMBED_CACHE_PATH, model, entries),
+                         name="embed-cache-save", daemon=True).start()
+    else:
+        _write_embedding_cache(EMBED_CACHE_PATH, model, entries)
+
+
+def _write_embedding_cache(path: str, model: str, entries: list) -> None:
+    """Write a cache snapshot, then release the lock taken by _save_embedding_cache."""
+    try:
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        tmp = f"{path}.{os.getpid()}.tmp"  # workers may save concurrently
+        with open(tmp, "w") as f:
+            json.dump({"model": model, "entries": entries}, f)
+        os.replace(tmp, path)
+    except OSError as e:
+        logger.warning(f"Could not save embedding cache: {e}")
+    finally:
+        _embedding_cache_save_lock.release()
+
+
+def _load_embedding_cache() -> int:
+    """Load persisted embeddings for the current model, skipping expired entries."""
+    if not EMBED_CACHE_PATH or not os.path.exists(EMBED_CACHE_PATH):
+        return 0
+    try:
+        with open(EMBED_CACHE_PATH) as f:
+            data = json.load(f)
+    except (OSError, json.JSONDecodeError) as e:
+        logger.warning(f"Could not load embedding cache: {e}")
+        return 0
+    if data.get("model") != _embedding_model_id():
+        return 0
+    now = time.time()
+    loaded = 0
+    for text, stored_at, vector in data.get("entries", []):
+        if _embedding_cache.ttl and now - stored_at > _embedding_cache.ttl:
+            continue
+        _embedding_cache.put((_embedding_model_id(), text), vector, stored_at=stored_at)
+        loaded += 1
+    return loaded
+
+
+def _configure_embedding_cache(size: int, ttl: float, path: Optional[str]) -> None:
+    """Replace the embedding cache with the given limits and warm it from disk."""
+    global _embedding_cache, EMBED_CACHE_PATH
+    _embedding_cache = _LRUCache(size, ttl)
+    EMBED_CACHE_PATH = path
+    loaded = _load_embedding_cache()
+    if path:
+        # Saved on exit by the serving process (see _serve), never by a gunicorn master
+        logger.info(f"Embedding cache: loaded {loaded} entries from {path}")
+
+
 def _get_project(request_data: dict) -> str:
     """Resolve the project name from request header or body, defaulting to 'default'."""
     return (
@@ -61,26 +575,638 @@ def _get_project(request_data: dict) -> str:
 
 def _get_collection(project: str):
     """Return (or lazily create) the ChromaDB collection for the given project."""
-    if project not in _clients:
-        path = os.path.join(BASE_PATH, project)
-        Path(path).mkdir(parents=True, exist_ok=True)
-        _clients[project] = chromadb.PersistentClient(path=path)
-        _collections[project] = _clients[project].get_or_create_collection(
-            name="codebase",
-            metadata={"description": f"Index for project {project}"}
-        )
-    return _collections[project]
+    with _collections_lock:
+        if project not in _clients:
+            path = os.path.join(BASE_PATH, project)
+            Path(path).mkdir(parents=True, exist_ok=True)
+            # Reclaim a client evicted moments ago rather than closing it under a new one
+            retired = [r for r in _retired_clients if r[1] == project]
+            _retired_clients[:] = [r for r in _retired_clients if r[1] != project]
+            _clients[project] = retired[-1][2] if retired else chromadb.PersistentClient(path=path)
+            _collections[project] = _clients[project].get_or_create_collection(
+                name="codebase",
+                metadata={"description": f"Index for project {project}"}
+            )
+        _clients.move_to_end(project)
+        _last_used[project] = time.monotonic()
+        col = _collections[project]
+    _evict_projects()
+    return col
+
+
+def _evict_projects() -> list:
+    """Retire idle projects and the least recently used beyond MAX_RESIDENT_PROJECTS.
+
+    The most recently used project always stays resident. Returns evicted names.
+    """
+    now = time.monotonic()
+    evicted = []
+    with _collections_lock:
+        names = list(_clients)[:-1]
+        for name in names:
+            over_limit = len(_clients) > max(MAX_RESIDENT_PROJECTS, 1)
+            idle = PROJECT_IDLE_SECONDS and now - _last_used.get(name, now) > PROJECT_IDLE_SECONDS
+            if not (over_limit or idle):
+                continue
+            _collections.pop(name, None)
+            _last_used.pop(name, None)
+            _retired_clients.append((now + EVICTION_GRACE_SECONDS, name, _clients.pop(name)))
+            evicted.append(name)
+        due = [c for t, _, c in _retired_clients if t <= now]
+        _retired_clients[:] = [r for r in _retired_clients if r[0] > now]
+    for client in due:
+        _close_client(client)
+    if evicted:
+        for name in evicted:
+            _discard_lexical_index(name)
+        logger.info(f"Evicted idle projects: {', '.join(evicted)}")
+    return evicted
+
+
+def _on_disk_projects() -> list:
+    base = Path(BASE_PATH)
+    if not base.exists():
+        return []
+    return sorted(d.name for d in base.iterdir() if d.is_dir() and not d.name.startswith("."))
+
+
+class _AdmissionGate:
+    """Bounds concurrent requests: up to max_inflight run, up to max_queue more
+    wait (at most queue_timeout seconds) and everything beyond is rejected."""
+
+    def __init__(self, max_inflight: int, max_queue: int, queue_timeout: float):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rejected = 0
+        self._slots = threading.BoundedSemaphore(max_inflight)
+        self._waiting = 0
+        self._lock = threading.Lock()
+
+    def acquire(self) -> bool:
+        """Take a slot, queueing if allowed. Returns False when the server is saturated."""
+        if self._slots.acquire(blocking=False):
+            return True
+        with self._lock:
+            if self._waiting >= self.max_queue:
+                self.rejected += 1
+                return False
+            self._waiting += 1
+        try:
+            admitted = self._slots.acquire(timeout=self.queue_timeout)
+        finally:
+            with self._lock:
+                self._waiting -= 1
+        if not admitted:
+            with self._lock:
+                self.rejected += 1
+        return admitted
+
+    def release(self) -> None:
+        self._slots.release()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "max_inflight": self.max_inflight,
+                "max_queue": self.max_queue,
+                "waiting": self._waiting,
+                "rejected": self.rejected,
+            }
+
+
+# Admission gate — configured by main(); None means unbounded (tests, embedding)
+_admission: Optional[_AdmissionGate] = None
+
+# Cheap endpoints that must answer even when the server is saturated
+_UNGATED_PATHS = {"/health", "/ready", "/metrics", "/stats", "/ui"}
+
+
+@app.before_request
+def _admit_request():
+    """Reject with 429 when the admission gate is saturated."""
+    if _admission is None or request.path in _UNGATED_PATHS:
+        return None
+    if not _admission.acquire():
+        return jsonify({"error": "server busy, retry later"}), 429, {"Retry-After": "1"}
+    g.rag_admitted = True
+    return None
+
+
+@app.teardown_request
+def _release_admission(exc):
+    if g.pop("rag_admitted", False):
+        _admission.release()
+
+
+def _close_client(client, dropping: bool = False) -> None:
+    """Release a PersistentClient's cached system so its files can be dropped or reopened."""
+    try:
+        if hasattr(client, "close"):
+            client.close()
+        elif dropping:
+            # chromadb < 1.0 has no close(); clearing the shared system cache
+            # affects every project, so only do it when files are deleted
+            client.clear_system_cache()
+    except Exception as e:
+        logger.warning(f"Could not close ChromaDB client: {e}")
 
 
 @app.route('/health', methods=['GET'])
 def health():
     """Health check endpoint"""
+    _evict_projects()
     return jsonify({
         "status": "healthy",
-        "projects_loaded": list(_clients.keys())
+        "projects_loaded": list(_clients.keys()),
+        "resident_projects": len(_clients),
+        "max_resident_projects": MAX_RESIDENT_PROJECTS,
+        "on_disk_projects": len(_on_disk_projects()),
     })
 
 
+@app.route('/ready', methods=['GET'])
+def ready():
+    """Readiness check — 503 until the model (and warm-up projects) are loaded."""
+    body = {
+        "status": "ready" if _ready.is_set() else "starting",
+        "warmup": _warmup_enabled,
+        "startup": _startup_metrics,
+    }
+    return jsonify(body), 200 if _ready.is_set() else 503
+
+
+def _empty_results() -> dict:
+    """Return an empty ChromaDB query result with one (empty) row."""
+    return {"documents": [[]], "metadatas": [[]], "ids": [[]], "distances": [[]]}
+
+
+def _generation_path(project: str, suffix: str = ".gen") -> Path:
+    return Path(BASE_PATH) / GENERATIONS_DIR / f"{project}{suffix}"
+
+
+def _index_epoch() -> str:
+    """Return the epoch of BASE_PATH's generation counters, creating it on first use."""
+    epoch = _index_epochs.get(BASE_PATH)
+    if epoch is None:
+        path = Path(BASE_PATH) / GENERATIONS_DIR / "epoch"
+        path.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            with open(path, "x") as f:  # first process wins; the others read its epoch
+                f.write(uuid.uuid4().hex[:16])
+        except FileExistsError:
+            pass
+        epoch = _index_epochs[BASE_PATH] = path.read_text().strip()
+    return epoch
+
+
+def _forget_local_state(project: str) -> None:
+    """Drop this process's type counters and lexical index for a project."""
+    with _counts_lock:
+        _type_counts.pop(project, None)
+    _discard_lexical_index(project)
+
+
+def _get_generation(project: str) -> int:
+    """Return the project's index generation (bumped on every write, by any worker).
+
+    If another worker wrote since this process last looked, its in-memory
+    counters and lexical index are dropped so they are reloaded from disk.
+    """
+    try:
+        generation = int(_generation_path(project).read_text())
+    except (OSError, ValueError):
+        generation = 0
+    with _generations_lock:
+        stale = _seen_generations.get(project) != generation
+        _seen_generations[project] = generation
+    if stale:
+        _forget_local_state(project)
+    return generation
+
+
+def _bump_generation(project: str) -> int:
+    """Advance the project's index generation, invalidating its cached results.
+
+    Call this *after* a write completes so no search can cache pre-write
+    results under the new generation. The counter file is updated under an
+    exclusive file lock and replaced atomically, so readers never see a
+    partial write.
+    """
+    path = _generation_path(project)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(_generation_path(project, ".lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            old = int(path.read_text())
+        except (OSError, ValueError):
+            old = 0
+        tmp = _generation_path(project, f".{os.getpid()}.tmp")
+        tmp.write_text(str(old + 1))
+        os.replace(tmp, path)
+    with _generations_lock:
+        stale = _seen_generations.get(project) != old  # another worker wrote in between
+        _seen_generations[project] = old + 1
+    if stale:
+        _forget_local_state(project)
+    return old + 1
+
+
+def _result_cache_key(project: str, generation: int, spec: dict, n_results: int) -> tuple:
+    """Build the result-cache key for one search spec at a given generation."""
+    return (
+        project,
+        generation,
+        _normalize_query(spec["query"]),
+        n_results,
+        json.dumps(spec.get("filter") or None, sort_keys=True),
+        spec.get("mode") or "vector",
+        json.dumps({k: spec[k] for k in RANKING_OPTIONS if spec.get(k) is not None}, sort_keys=True),
+    )
+
+
+SEARCH_MODES = ("vector", "hybrid")
+# Reciprocal-rank fusion constant (Cormack et al.); dampens the weight of top ranks
+RRF_K = 60
+
+_TOKEN_RE = re.compile(r"[A-Za-z0-9_]+")
+_SUBTOKEN_RE = re.compile(r"[A-Z]+(?![a-z])|[A-Z]?[a-z]+|[0-9]+")
+
+
+def _lexical_tokens(text: str) -> list:
+    """Lowercased identifier tokens plus their camelCase / snake_case parts.
+
+    ``validateToken`` yields validatetoken, validate, token so that both the
+    exact identifier and its words match.
+    """
+    tokens = []
+    for word in _TOKEN_RE.findall(text):
+        tokens.append(word.lower())
+        parts = _SUBTOKEN_RE.findall(word)
+        if len(parts) > 1:
+            tokens.extend(p.lower() for p in parts)
+    return tokens
+
+
+class _LexicalIndex:
+    """In-memory BM25 inverted index over one project's documents."""
+
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[str, int]] = {}  # term -> {doc_id: term frequency}
+        self._doc_terms: Dict[str, list] = {}
+        self._lengths: Dict[str, int] = {}
+        self._total_length = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def add(self, doc_id: str, text: str) -> None:
+        """Index (or re-index) a document."""
+        tf = Counter(_lexical_tokens(text))
+        with self._lock:
+            self._remove(doc_id)
+            for term, n in tf.items():
+                self._postings.setdefault(term, {})[doc_id] = n
+            self._doc_terms[doc_id] = list(tf)
+            self._lengths[doc_id] = sum(tf.values())
+            self._total_length += self._lengths[doc_id]
+
+    def remove(self, doc_id: str) -> None:
+        with self._lock:
+            self._remove(doc_id)
+
+    def _remove(self, doc_id: str) -> None:
+        for term in self._doc_terms.pop(doc_id, []):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(doc_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id, 0)
+
+    def search(self, query: str, k: int) -> list:
+        """Return up to k (doc_id, bm25_score) pairs, best first."""
+        with self._lock:
+            n_docs = len(self._lengths)
+            if not n_docs:
+                return []
+            avg_length = self._total_length / n_docs or 1.0
+            scores: Dict[str, float] = {}
+            for term in set(_lexical_tokens(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+                for doc_id, tf in postings.items():
+                    norm = self.K1 * (1 - self.B + self.B * self._lengths[doc_id] / avg_length)
+                    scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.K1 + 1) / (tf + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+
+# Per-project lexical indexes, built lazily from the collection on the first
+# hybrid search and kept in step by writes while resident. A build pages
+# through the whole collection, so it runs outside _lexical_lock under a
+# per-project lock; writes that land meanwhile are logged in _lexical_builds
+# and replayed over the finished index before it is published.
+_lexical_indexes: Dict[str, _LexicalIndex] = {}
+_lexical_builds: Dict[str, list] = {}  # project -> [(ids, documents or None for a delete)]
+_lexical_build_locks: Dict[str, threading.Lock] = {}
+_lexical_lock = threading.Lock()
+
+
+def _discard_lexical_index(project: str) -> None:
+    """Drop a project's lexical index; a build in progress is not published."""
+    with _lexical_lock:
+        _lexical_indexes.pop(project, None)
+        _lexical_builds.pop(project, None)
+
+
+def _apply_lexical_write(idx: _LexicalIndex, ids: list, documents: Optional[list]) -> None:
+    if documents is None:
+        for doc_id in ids:
+            idx.remove(doc_id)
+    else:
+        for doc_id, doc in zip(ids, documents):
+            idx.add(doc_id, doc)
+
+
+def _get_lexical_index(project: str, col) -> _LexicalIndex:
+    """Return the project's BM25 index, building it from the collection if needed."""
+    with _lexical_lock:
+        idx = _lexical_indexes.get(project)
+        if idx is not None:
+            return idx
+        build_lock = _lexical_build_locks.setdefault(project, threading.Lock())
+    with build_lock:  # concurrent first searches wait for one build
+        with _lexical_lock:
+            idx = _lexical_indexes.get(project)
+            if idx is not None:
+                return idx
+            log = _lexical_builds[project] = []
+        idx = _LexicalIndex()
+        page, offset = 2000, 0
+        try:
+            while True:
+                batch = col.get(include=["documents"], limit=page, offset=offset)
+                for doc_id, doc in zip(batch["ids"], batch["documents"] or []):
+                    idx.add(doc_id, doc or "")
+                if len(batch["ids"]) < page:
+                    break
+                offset += page
+        except Exception:
+            with _lexical_lock:
+                if _lexical_builds.get(project) is log:
+                    del _lexical_builds[project]
+            raise
+        with _lexical_lock:
+            for ids, documents in log:
+                _apply_lexical_write(idx, ids, documents)
+            if _lexical_builds.get(project) is log:  # not discarded meanwhile
+                del _lexical_builds[project]
+                _lexical_indexes[project] = idx
+        return idx
+
+
+def _record_lexical_write(project: str, ids: list, documents: Optional[list]) -> None:
+    with _lexical_lock:
+        idx = _lexical_indexes.get(project)
+        if idx is not None:
+            _apply_lexical_write(idx, ids, documents)
+        log = _lexical_builds.get(project)
+        if log is not None:
+            log.append((list(ids), None if documents is None else list(documents)))
+
+
+def _update_lexical_index(project: str, ids: list, documents: list) -> None:
+    """Apply written documents to the project's lexical index if it is loaded (or building)."""
+    _record_lexical_write(project, ids, documents)
+
+
+def _remove_from_lexical_index(project: str, ids: list) -> None:
+    """Drop deleted documents from the project's lexical index if it is loaded (or building)."""
+    _record_lexical_write(project, ids, None)
+
+
+def _vector_search(col, embedding: list, n: int, where: Optional[dict]) -> dict:
+    query_kwargs = {
+        "query_embeddings": [embedding],
+        "n_results": n,
+    }
+    if where:
+        query_kwargs["where"] = where
+    with _timed("chroma_query"):
+        return col.query(**query_kwargs)
+
+
+def _hybrid_search(project: str, col, query: str, embedding: list, n: int,
+                   where: Optional[dict], count: int) -> dict:
+    """Fuse vector and BM25 rankings with reciprocal-rank fusion.
+
+    Both retrievers contribute a wider candidate pool; the fused top n is
+    returned in Chroma's result shape plus a ``scores`` row. Lexical-only
+    hits have no vector distance (None).
+    """
+    fetch_k = min(max(n * 4, 20), count)
+    vector = _vector_search(col, embedding, fetch_k, where)
+    vector_ids = vector["ids"][0]
+
+    lexical = _get_lexical_index(project, col)
+    with _timed("lexical"):
+        lexical_ids = [doc_id for doc_id, _ in lexical.search(query, fetch_k)]
+    if where and lexical_ids:
+        allowed = set(col.get(ids=lexical_ids, where=where, include=[])["ids"])
+        lexical_ids = [doc_id for doc_id in lexical_ids if doc_id in allowed]
+
+    fused: Dict[str, float] = {}
+    for ranking in (vector_ids, lexical_ids):
+        for rank, doc_id in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (RRF_K + rank)
+    top = sorted(fused, key=fused.get, reverse=True)[:n]
+
+    found = {
+        doc_id: (doc, meta, dist)
+        for doc_id, doc, meta, dist in zip(vector_ids, vector["documents"][0],
+                                           vector["metadatas"][0], vector["distances"][0])
+    }
+    missing = [doc_id for doc_id in top if doc_id not in found]
+    if missing:
+        extra = col.get(ids=missing, include=["documents", "metadatas"])
+        for doc_id, doc, meta in zip(extra["ids"], extra["documents"], extra["metadatas"]):
+            found[doc_id] = (doc, meta, None)
+    top = [doc_id for doc_id in top if doc_id in found]
+
+    return {
+        "ids": [top],
+        "documents": [[found[doc_id][0] for doc_id in top]],
+        "metadatas": [[found[doc_id][1] for doc_id in top]],
+        "distances": [[found[doc_id][2] for doc_id in top]],
+        "scores": [[round(fused[doc_id], 6) for doc_id in top]],
+    }
+
+
+# Re-ranking — min_score / MMR / per-file caps pick the final n results from a
+# wider candidate pool using cosine similarity on the stored embeddings
+RANKING_OPTIONS = ("min_score", "diversify", "mmr_lambda", "max_per_file", "fetch_k")
+MMR_LAMBDA = 0.7  # 1.0 = pure relevance, 0.0 = pure novelty
+
+
+def _parse_ranking(data: dict) -> tuple:
+    """Validate min_score / diversify / mmr_lambda / max_per_file / fetch_k. Returns (options, error)."""
+    options: Dict[str, Any] = {}
+    min_score = data.get("min_score")
+    if min_score is not None:
+        if isinstance(min_score, bool) or not isinstance(min_score, (int, float)) or not -1 <= min_score <= 1:
+            return None, "min_score must be a number between -1 and 1"
+        options["min_score"] = float(min_score)
+    mmr_lambda = data.get("mmr_lambda")
+    if mmr_lambda is not None:
+        if isinstance(mmr_lambda, bool) or not isinstance(mmr_lambda, (int, float)) or not 0 <= mmr_lambda <= 1:
+            return None, "mmr_lambda must be a number between 0 and 1"
+        options["mmr_lambda"] = float(mmr_lambda)
+    elif data.get("diversify"):
+        options["mmr_lambda"] = MMR_LAMBDA
+    for key in ("max_per_file", "fetch_k"):
+        value = data.get(key)
+        if value is not None:
+            if isinstance(value, bool) or not isinstance(value, int) or value <= 0:
+                return None, f"{key} must be a positive integer"
+            options[key] = value
+    return options, None
+
+
+def _candidate_count(n: int, count: int, ranking: dict) -> int:
+    """How many nearest neighbours to fetch so re-ranking still has n to choose from."""
+    if not ranking:
+        return n
+    return min(count, max(n, ranking.get("fetch_k") or max(n * 4, 20)))
+
+
+def _rerank(col, results: dict, query_embedding: list, n: int, ranking: dict) -> dict:
+    """Pick up to n candidates by min_score, MMR and per-file cap.
+
+    Adds a ``similarities`` row (cosine similarity to the query). Without
+    mmr_lambda the candidates keep their original order.
+    """
+    ids = results["ids"][0]
+    if not ids:
+        return results
+    stored = col.get(ids=list(ids), include=["embeddings"])
+    by_id = dict(zip(stored["ids"], stored["embeddings"]))
+    rows = [i for i, doc_id in enumerate(ids) if doc_id in by_id]
+    vectors = np.asarray([by_id[ids[i]] for i in rows], dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True).clip(min=1e-12)
+    query = np.asarray(query_embedding, dtype=np.float32)
+    sims = vectors @ (query / max(float(np.linalg.norm(query)), 1e-12))
+
+    min_score = ranking.get("min_score")
+    candidates = [j for j in range(len(rows)) if min_score is None or sims[j] >= min_score]
+    metas = results.get("metadatas", [[]])[0] or [None] * len(ids)
+    files = [(metas[i] or {}).get("file") for i in rows]
+    cap, lam = ranking.get("max_per_file"), ranking.get("mmr_lambda")
+    per_file: Counter = Counter()
+    selected: list = []
+    while candidates and len(selected) < n:
+        if lam is None or not selected:
+            best = candidates[0] if lam is None else max(candidates, key=lambda j: sims[j])
+        else:
+            redundancy = (vectors[candidates] @ vectors[selected].T).max(axis=1)
+            best = candidates[int(np.argmax(lam * sims[candidates] - (1 - lam) * redundancy))]
+        candidates.remove(best)
+        if cap and files[best] is not None and per_file[files[best]] >= cap:
+            continue
+        per_file[files[best]] += 1
+        selected.append(best)
+
+    picked = [rows[j] for j in selected]
+    reranked = {field: [[results[field][0][i] for i in picked]]
+                for field in ("ids", "documents", "metadatas", "distances", "scores")
+                if results.get(field) is not None}
+    reranked["similarities"] = [[round(float(sims[j]), 6) for j in selected]]
+    return reranked
+
+
+# Result shaping — applied to every response (after the result cache, which
+# always holds full results) to cut payload size and downstream prompt tokens
+RESULT_FIELDS = ("ids", "documents", "metadatas", "distances", "scores", "similarities")
+SNIPPET_LINES = 8
+
+
+def _parse_shaping(data: dict) -> tuple:
+    """Validate max_chars / include / snippet options. Returns (options, error)."""
+    options: Dict[str, Any] = {}
+    max_chars = data.get("max_chars")
+    if max_chars is not None:
+        if isinstance(max_chars, bool) or not isinstance(max_chars, int) or max_chars <= 0:
+            return None, "max_chars must be a positive integer"
+        options["max_chars"] = max_chars
+    include = data.get("include")
+    if include is not None:
+        if not isinstance(include, list) or any(f not in RESULT_FIELDS for f in include):
+            return None, f"include must be a list of {', '.join(RESULT_FIELDS)}"
+        options["include"] = include
+    snippet = data.get("snippet")
+    if snippet is True:
+        options["snippet"] = SNIPPET_LINES
+    elif snippet not in (None, False, 0):
+        if isinstance(snippet, bool) or not isinstance(snippet, int) or snippet < 0:
+            return None, "snippet must be true or a positive number of lines"
+        options["snippet"] = snippet
+    return options, None
+
+
+def _best_window(document: str, terms: set, window: int) -> tuple:
+    """Return (first_line_index, text) of the window of lines with most query-term hits."""
+    lines = document.split("\n")
+    if len(lines) <= window:
+        return 0, document
+    hits = [sum(1 for t in _lexical_tokens(line) if t in terms) for line in lines]
+    best = running = sum(hits[:window])
+    best_start = 0
+    for start in range(1, len(lines) - window + 1):
+        running += hits[start + window - 1] - hits[start - 1]
+        if running > best:
+            best, best_start = running, start
+    return best_start, "\n".join(lines[best_start:best_start + window])
+
+
+def _shape_results(results: dict, query: str, options: dict) -> dict:
+    """Return a trimmed copy of a result row set; never mutates (cached) input.
+
+    With ``snippet`` each document is cut to its best-matching line window and
+    its metadata gains ``snippet_start_line`` / ``snippet_end_line`` (file line
+    numbers when the chunk has ``start_line``, else lines within the document).
+    """
+    if not options:
+        return results
+    shaped = {field: results[field] for field in options.get("include", RESULT_FIELDS) if field in results}
+    if "documents" not in shaped:
+        return shaped
+
+    docs = list(shaped["documents"][0])
+    metas = list(results.get("metadatas", [[]])[0] or [None] * len(docs))
+    if options.get("snippet"):
+        terms = set(_lexical_tokens(query))
+        for i, doc in enumerate(docs):
+            if doc is None:
+                continue
+            start, docs[i] = _best_window(doc, terms, options["snippet"])
+            meta = dict(metas[i] or {})
+            first = meta.get("start_line", 1) + start
+            meta["snippet_start_line"] = first
+            meta["snippet_end_line"] = first + docs[i].count("\n")
+            metas[i] = meta
+        if "metadatas" in shaped:
+            shaped["metadatas"] = [metas]
+    if options.get("max_chars"):
+        docs = [doc[:options["max_chars"]] if doc is not None else None for doc in docs]
+    shaped["documents"] = [docs]
+    return shaped
+
+
 @app.route('/search', methods=['POST'])
 def search():
     """Search for relevant code snippets"""
@@ -91,31 +1217,51 @@ def search():
 
         if not query:
             return jsonify({"error": "query is required"}), 400
+        mode = data.get("mode") or "vector"
+        if mode not in SEARCH_MODES:
+            return jsonify({"error": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+        shaping, error = _parse_shaping(data)
+        if error:
+            return jsonify({"error": error}), 400
+        ranking, error = _parse_ranking(data)
+        if error:
+            return jsonify({"error": error}), 400
 
         project = _get_project(data)
+        generation = _get_generation(project)
+
+        # Identical searches are answered from the result cache until the next write
+        cache_key = _result_cache_key(project, generation, data, n_results)
+        cached = _result_cache.get(cache_key)
+        if cached is not None:
+            return jsonify({"query": query, "project": project, "generation": generation,
+                            "epoch": _index_epoch(), "cached": True, "results": _shape_results(cached, query, shaping)})
+
         col = _get_collection(project)
 
-        # Embed query
-        query_embedding = _get_embedder().encode(query).tolist()
+        # Embed query (served from the embedding cache when repeated)
+        query_embedding = _embed_queries([query])[0]
 
         # Search collection — clamp n_results to available docs
         count = col.count()
+        n = min(n_results, count)
+        fetch_n = _candidate_count(n, count, ranking)
         if count == 0:
-            return jsonify({"query": query, "project": project, "results": {"documents": [[]], "metadatas": [[]], "ids": [[]], "distances": [[]]}})
-
-        safe_n = min(n_results, count)
-        query_kwargs = {
-            "query_embeddings": [query_embedding],
-            "n_results": safe_n,
-        }
-        if data.get("filter"):
-            query_kwargs["where"] = data["filter"]
-        results = col.query(**query_kwargs)
+            results = _empty_results()
+        elif mode == "hybrid":
+            results = _hybrid_search(project, col, query, query_embedding, fetch_n, data.get("filter"), count)
+        else:
+            results = _vector_search(col, query_embedding, fetch_n, data.get("filter"))
+        if ranking and count:
+            results = _rerank(col, results, query_embedding, n, ranking)
+        _result_cache.put(cache_key, results)
 
         return jsonify({
             "query": query,
             "project": project,
-            "results": results
+            "generation": generation,
+            "epoch": _index_epoch(),
+            "results": _shape_results(results, query, shaping)
         })
 
     except Exception as e:
@@ -123,6 +1269,334 @@ def search():
         return jsonify({"error": str(e)}), 500
 
 
+@app.route('/search/batch', methods=['POST'])
+def search_batch():
+    """Run many searches with one embedding call and vectorised collection queries.
+
+    Body: {"project": ..., "n_results": 5, "queries": [{"query": ..., "n_results": ...,
+    "filter": {...}, "id": ...}, ...]}. Plain strings are accepted as queries.
+    Results are keyed by each query's ``id`` (or its text when no id is given).
+    mode, max_chars / include / snippet and the re-ranking options (min_score,
+    diversify, mmr_lambda, max_per_file, fetch_k) may be set at the top level
+    or per query.
+    """
+    try:
+        data = request.get_json() or {}
+        queries = data.get('queries') or []
+        default_n = data.get('n_results', 5)
+
+        if not queries:
+            return jsonify({"error": "queries is required"}), 400
+        if (data.get("mode") or "vector") not in SEARCH_MODES:
+            return jsonify({"error": f"mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+
+        specs, shapings, rankings = [], [], []
+        for i, q in enumerate(queries):
+            if isinstance(q, str):
+                q = {"query": q}
+            if not isinstance(q, dict) or not q.get("query"):
+                return jsonify({"error": f"queries[{i}].query is required"}), 400
+            if (q.get("mode") or "vector") not in SEARCH_MODES:
+                return jsonify({"error": f"queries[{i}].mode must be one of {', '.join(SEARCH_MODES)}"}), 400
+            options, error = _parse_shaping({**data, **q})
+            if error:
+                return jsonify({"error": f"queries[{i}]: {error}"}), 400
+            q = {**{k: data[k] for k in ("mode", *RANKING_OPTIONS) if k in data}, **q}
+            ranking, error = _parse_ranking(q)
+            if error:
+                return jsonify({"error": f"queries[{i}]: {error}"}), 400
+            specs.append(q)
+            shapings.append(options)
+            rankings.append(ranking)
+
+        project = _get_project(data)
+        generation = _get_generation(project)
+        keys = [str(spec.get("id") or spec["query"]) for spec in specs]
+
+        def _shape_batch(raw: dict) -> dict:
+            return {keys[i]: _shape_results(raw[keys[i]], specs[i]["query"], shapings[i])
+                    for i in range(len(specs))}
+
+        cache_keys = [_result_cache_key(project, generation, spec, spec.get("n_results", default_n))
+                      for spec in specs]
+
+        results: Dict[str, Any] = {}
+        pending = []
+        for i, cache_key in enumerate(cache_keys):
+            cached = _result_cache.get(cache_key)
+            if cached is not None:
+                results[keys[i]] = cached
+            else:
+                pending.append(i)
+        if not pending:
+            return jsonify({"project": project, "generation": generation, "epoch": _index_epoch(),
+                            "results": _shape_batch(results)})
+
+        col = _get_collection(project)
+        count = col.count()
+        if count == 0:
+            for i in pending:
+                results[keys[i]] = _empty_results()
+            return jsonify({"project": project, "generation": generation, "epoch": _index_epoch(),
+                            "results": _shape_batch(results)})
+
+        # Embed every uncached query in a single encode call
+        embeddings = dict(zip(pending, _embed_queries([specs[i]["query"] for i in pending])))
+
+        # Hybrid queries fuse per-query rankings, so they run one by one
+        vector_pending = []
+        for i in pending:
+            if specs[i].get("mode") == "hybrid":
+                n = min(specs[i].get("n_results", default_n), count)
+                hits = _hybrid_search(project, col, specs[i]["query"], embeddings[i],
+                                      _candidate_count(n, count, rankings[i]), specs[i].get("filter"), count)
+                if rankings[i]:
+                    hits = _rerank(col, hits, embeddings[i], n, rankings[i])
+                results[keys[i]] = hits
+                _result_cache.put(cache_keys[i], hits)
+            else:
+                vector_pending.append(i)
+
+        # Chroma applies one n_results/where per query call, so group queries by
+        # filter, ask for the largest n in the group and trim each row afterwards.
+        groups: Dict[str, list] = {}
+        for i in vector_pending:
+            groups.setdefault(json.dumps(specs[i].get("filter") or None, sort_keys=True), []).append(i)
+
+        for filter_key, idxs in groups.items():
+            wanted = [min(specs[i].get("n_results", default_n), count) for i in idxs]
+            fetch = [_candidate_count(n, count, rankings[i]) for i, n in zip(idxs, wanted)]
+            query_kwargs = {
+                "query_embeddings": [embeddings[i] for i in idxs],
+                "n_results": max(fetch),
+            }
+            where = json.loads(filter_key)
+            if where:
+                query_kwargs["where"] = where
+            with _timed("chroma_query"):
+                group_results = col.query(**query_kwargs)
+            for row, (i, n, k) in enumerate(zip(idxs, wanted, fetch)):
+                hits = {
+                    field: [group_results[field][row][:k]]
+                    for field in ("ids", "documents", "metadatas", "distances")
+                    if group_results.get(field) is not None
+                }
+                if rankings[i]:
+                    hits = _rerank(col, hits, embeddings[i], n, rankings[i])
+                results[keys[i]] = hits
+                _result_cache.put(cache_keys[i], hits)
+
+        return jsonify({"project": project, "generation": generation, "epoch": _index_epoch(),
+                        "results": _shape_batch(results)})
+
+    except Exception as e:
+        logger.error(f"Batch search error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+# Per-project document counters ({"total": n, "types": {type: n}}), kept in
+# memory and in <project>/.rag-counts.json so /projects never has to open or
+# scan a collection. Missing counters are rebuilt once from the collection.
+COUNTS_FILE = ".rag-counts.json"
+_type_counts: Dict[str, dict] = {}
+_counts_load_locks: Dict[str, threading.Lock] = {}
+_counts_lock = threading.Lock()
+# Writers hold a per-project lock from the existing-ID check through the counter
+# update: a thread lock within this process plus a flock shared with other workers
+_write_locks: Dict[str, threading.RLock] = {}
+_write_lock_files: Dict[str, Any] = {}
+
+
+@contextmanager
+def _project_write_lock(project: str):
+    """Serialise writes to one project across threads and worker processes (reentrant)."""
+    with _counts_lock:
+        lock = _write_locks.setdefault(project, threading.RLock())
+    with lock:
+        if project in _write_lock_files:  # this thread already holds it further up the stack
+            yield
+            return
+        path = _generation_path(project, ".write.lock")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w") as fh:
+            fcntl.flock(fh, fcntl.LOCK_EX)
+            _write_lock_files[project] = fh
+            try:
+                yield
+            finally:
+                del _write_lock_files[project]
+
+
+def _counts_path(project: str) -> Path:
+    return Path(BASE_PATH) / project / COUNTS_FILE
+
+
+def _save_counts(project: str, counts: dict) -> None:
+    path = _counts_path(project)
+    if not path.parent.exists():
+        return
+    tmp = path.with_name(COUNTS_FILE + ".tmp")
+    tmp.write_text(json.dumps(counts))
+    os.replace(tmp, path)
+
+
+def _rebuild_counts(project: str) -> dict:
+    """Tally document types by paging through the collection's metadata."""
+    col = _get_collection(project)
+    counts: dict = {"total": 0, "types": {}}
+    page, offset = 5000, 0
+    while True:
+        batch = col.get(include=["metadatas"], limit=page, offset=offset)
+        for meta in batch["metadatas"] or []:
+            doc_type = (meta or {}).get("type")
+            if doc_type:
+                counts["types"][doc_type] = counts["types"].get(doc_type, 0) + 1
+        counts["total"] += len(batch["ids"])
+        if len(batch["ids"]) < page:
+            return counts
+        offset += page
+
+
+def _get_counts(project: str) -> dict:
+    """Return a project's counters, loading or rebuilding them on first use."""
+    _get_generation(project)  # reload from disk if another worker changed them
+    with _counts_lock:
+        counts = _type_counts.get(project)
+        if counts is not None:
+            return counts
+        load_lock = _counts_load_locks.setdefault(project, threading.Lock())
+    # A rebuild scans the whole collection: hold only this project's lock meanwhile
+    with load_lock:
+        with _counts_lock:
+            counts = _type_counts.get(project)
+            if counts is not None:
+                return counts
+        try:
+            counts = json.loads(_counts_path(project).read_text())
+        except (OSError, json.JSONDecodeError):
+            counts = _rebuild_counts(project)
+            _save_counts(project, counts)
+        with _counts_lock:
+            return _type_counts.setdefault(project, counts)
+
+
+def _adjust_counts(project: str, added: list, removed: list) -> None:
+    """Apply type counter deltas for documents added to / removed from a project.
+
+    An ID overwritten with a new type appears in both lists. Call with the
+    project's write lock held: the deltas are applied to the counts file, which
+    another worker may have updated since this one loaded it. Counters that
+    would go negative have drifted and are rebuilt from the collection instead.
+    """
+    try:
+        counts = json.loads(_counts_path(project).read_text())
+    except (OSError, json.JSONDecodeError):
+        loaded = _get_counts(project)
+        with _counts_lock:
+            counts = {"total": loaded["total"], "types": dict(loaded["types"])}
+    types = counts["types"]
+    for doc_type in removed:
+        if doc_type:
+            types[doc_type] = types.get(doc_type, 0) - 1
+    for doc_type in added:
+        if doc_type:
+            types[doc_type] = types.get(doc_type, 0) + 1
+    counts["total"] += len(added) - len(removed)
+    if counts["total"] < 0 or any(n < 0 for n in types.values()):
+        logger.warning(f"Type counters for {project} drifted, rebuilding from the collection")
+        counts = _rebuild_counts(project)
+    _save_counts(project, counts)
+    with _counts_lock:
+        _type_counts[project] = counts
+
+
+def _content_hash(document: str) -> str:
+    """Hash a document together with the embedder, so switching models re-embeds it."""
+    digest = hashlib.sha256(_embedding_model_id().encode())
+    digest.update(b"\0")
+    digest.update(document.encode("utf-8", errors="replace"))
+    return digest.hexdigest()
+
+
+def _upsert_documents(project: str, col, documents: list, metadatas: Optional[list], ids: list) -> tuple:
+    """Embed and upsert documents whose content changed.
+
+    Each document's metadata gets a ``content_hash`` of its text and the
+    embedding model. Documents whose stored hash already matches are not
+    re-embedded: they are skipped outright, or get a metadata-only update when
+    just their metadata changed.
+    Chunked files (metadata ``file`` + ``chunks``) lose any stored chunk
+    numbered ``chunks`` or higher, so a file that shrank leaves nothing stale.
+    The whole check-write-count sequence runs under the project's write lock.
+    Returns (written, skipped_unchanged, pruned).
+    """
+    with _project_write_lock(project):
+        return _upsert_documents_locked(project, col, documents, metadatas, ids)
+
+
+def _upsert_documents_locked(project: str, col, documents: list, metadatas: Optional[list], ids: list) -> tuple:
+    _get_counts(project)  # load counters before the write so deltas apply to the old state
+    metadatas = metadatas or [None] * len(documents)
+    new_metas = [{**(meta or {}), "content_hash": _content_hash(doc)}
+                 for doc, meta in zip(documents, metadatas)]
+
+    existing = col.get(ids=list(ids), include=["metadatas"])
+    stored = {i: (m or {}) for i, m in zip(existing["ids"], existing["metadatas"] or [])}
+
+    embed_idx, meta_only_idx, skipped = [], [], 0
+    for i, (doc_id, meta) in enumerate(zip(ids, new_metas)):
+        old = stored.get(doc_id)
+        if old is None or old.get("content_hash") != meta["content_hash"]:
+            embed_idx.append(i)
+        elif old != meta:
+            meta_only_idx.append(i)
+        else:
+            skipped += 1
+
+    if embed_idx:
+        docs = [documents[i] for i in embed_idx]
+        embeddings = _encode(docs)
+        # Upsert to collection (idempotent — same ID overwrites existing entry)
+        with _timed("chroma_write"):
+            col.upsert(
+                documents=docs,
+                embeddings=embeddings,
+                metadatas=[new_metas[i] for i in embed_idx],
+                ids=[ids[i] for i in embed_idx]
+            )
+        _update_lexical_index(project, [ids[i] for i in embed_idx], docs)
+    if meta_only_idx:
+        with _timed("chroma_write"):
+            col.update(ids=[ids[i] for i in meta_only_idx], metadatas=[new_metas[i] for i in meta_only_idx])
+
+    changed = embed_idx + meta_only_idx
+    if changed:
+        added = [new_metas[i].get("type") for i in changed]
+        removed = [stored[ids[i]].get("type") for i in changed if ids[i] in stored]
+        _adjust_counts(project, added, removed)
+
+    chunked = {meta["file"]: meta["chunks"] for meta in new_metas
+               if isinstance(meta.get("file"), str) and isinstance(meta.get("chunks"), int)}
+    pruned = sum(_delete_documents(project, col, {"$and": [{"file": f}, {"chunk": {"$gte": n}}]})
+                 for f, n in chunked.items())
+    return len(changed), skipped, pruned
+
+
+def _delete_documents(project: str, col, where: dict) -> int:
+    """Delete every document matching a metadata filter. Returns how many were removed."""
+    with _project_write_lock(project):
+        _get_counts(project)
+        existing = col.get(where=where, include=["metadatas"])
+        ids = existing["ids"]
+        if not ids:
+            return 0
+        with _timed("chroma_write"):
+            col.delete(ids=ids)
+        _remove_from_lexical_index(project, ids)
+        _adjust_counts(project, [], [(m or {}).get("type") for m in existing["metadatas"] or []])
+        return len(ids)
+
+
 @app.route('/index', methods=['POST'])
 def index():
     """Index code snippets"""
@@ -142,20 +1616,15 @@ def index():
         if not ids:
             ids = [f"doc_{i}" for i in range(len(documents))]
 
-        # Embed documents
-        embeddings = _get_embedder().encode(documents).tolist()
-
-        # Upsert to collection (idempotent — same ID overwrites existing entry)
-        col.upsert(
-            documents=documents,
-            embeddings=embeddings,
-            metadatas=metadatas if metadatas else None,
-            ids=ids
-        )
+        indexed, skipped, pruned = _upsert_documents(project, col, documents, metadatas, ids)
+        generation = _bump_generation(project) if indexed or pruned else _get_generation(project)
 
         return jsonify({
-            "indexed": len(documents),
-            "project": project
+            "indexed": indexed,
+            "skipped_unchanged": skipped,
+            "pruned": pruned,
+            "project": project,
+            "generation": generation
         })
 
     except Exception as e:
@@ -163,47 +1632,615 @@ def index():
         return jsonify({"error": str(e)}), 500
 
 
+# Bulk-index jobs: the NDJSON body is spooled to BASE_PATH/.jobs/<id>.ndjson and
+# a background thread embeds it in chunks, persisting progress to <id>.json
+# after every chunk so an interrupted job resumes where it stopped.
+INDEX_JOB_CHUNK_SIZE = int(os.environ.get("RAG_INDEX_JOB_CHUNK_SIZE", "256"))
+MAX_JOB_ERRORS = 100
+_job_queue: queue.Queue = queue.Queue()
+_job_worker: Optional[threading.Thread] = None
+_job_worker_lock = threading.Lock()
+
+
+def _jobs_dir() -> Path:
+    path = Path(BASE_PATH) / ".jobs"
+    path.mkdir(parents=True, exist_ok=True)
+    return path
+
+
+def _load_job(job_id: str) -> Optional[dict]:
+    path = _jobs_dir() / f"{job_id}.json"
+    try:
+        return json.loads(path.read_text())
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def _save_job(job: dict) -> None:
+    path = _jobs_dir() / f"{job['id']}.json"
+    tmp = path.with_suffix(".json.tmp")
+    tmp.write_text(json.dumps(job))
+    os.replace(tmp, path)
+
+
+def _record_job_error(job: dict, where: str, error: Exception) -> None:
+    job["error_count"] += 1
+    if len(job["errors"]) < MAX_JOB_ERRORS:
+        job["errors"].append({"lines": where, "error": str(error)})
+
+
+def _ensure_job_worker() -> None:
+    """Start this process's job thread; on first start, requeue interrupted jobs."""
+    global _job_worker
+    if _job_worker is not None and _job_worker.is_alive():
+        return
+    with _job_worker_lock:
+        if _job_worker is not None and _job_worker.is_alive():
+            return
+        _job_worker = threading.Thread(target=_run_index_jobs, name="index-jobs", daemon=True)
+        _job_worker.start()
+        for path in sorted(_jobs_dir().glob("*.json")):
+            job = _load_job(path.stem)
+            if job and job["status"] in ("queued", "running"):
+                _job_queue.put(job["id"])
+
+
+def _run_index_jobs() -> None:
+    while True:
+        job_id = _job_queue.get()
+        try:
+            _process_index_job(job_id)
+        except Exception as e:
+            logger.error(f"Index job {job_id} crashed: {e}")
+
+
+def _process_index_job(job_id: str) -> None:
+    """Embed and upsert a spooled job chunk by chunk, resuming from docs_done."""
+    lock_file = open(_jobs_dir() / f"{job_id}.lock", "w")
+    try:
+        # Another worker process may already own this job
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return
+
+    try:
+        job = _load_job(job_id)
+        if not job or job["status"] not in ("queued", "running"):
+            return
+        job["status"] = "running"
+        job["started_at"] = job.get("started_at") or time.time()
+        _save_job(job)
+
+        project = job["project"]
+        spool = _jobs_dir() / f"{job_id}.ndjson"
+        resumed_from = job["docs_done"]
+        started = time.monotonic()
+        try:
+            with open(spool) as f:
+                lines = itertools.islice(f, job["docs_done"], None)
+                while True:
+                    chunk = list(itertools.islice(lines, job["chunk_size"]))
+                    if not chunk:
+                        break
+                    first_line = job["docs_done"] + 1
+                    docs, metas, ids = [], [], []
+                    for lineno, line in enumerate(chunk, start=first_line):
+                        try:
+                            item = json.loads(line)
+                            if not item.get("document"):
+                                raise ValueError("document is required")
+                            docs.append(item["document"])
+                            metas.append(item.get("metadata") or {})
+                            ids.append(str(item.get("id") or f"{job_id}_{lineno}"))
+                        except (ValueError, TypeError, AttributeError) as e:
+                            _record_job_error(job, str(lineno), e)
+                    if docs:
+                        try:
+                            # Re-fetched per chunk so a long job keeps its project resident
+                            col = _get_collection(project)
+                            written, skipped, pruned = _upsert_documents(project, col, docs, metas, ids)
+                            job["docs_indexed"] += written
+                            job["docs_skipped"] = job.get("docs_skipped", 0) + skipped
+                            if written or pruned:
+                                _bump_generation(project)
+                        except Exception as e:
+                            _record_job_error(job, f"{first_line}-{first_line + len(chunk) - 1}", e)
+                    job["docs_done"] += len(chunk)
+                    elapsed = time.monotonic() - started
+                    job["docs_per_sec"] = round((job["docs_done"] - resumed_from) / elapsed, 2) if elapsed else 0.0
+                    _save_job(job)
+        except Exception as e:
+            job["status"] = "failed"
+            job["finished_at"] = time.time()
+            _record_job_error(job, "", e)
+            _save_job(job)
+            return
+
+        job["status"] = "done"
+        job["finished_at"] = time.time()
+        _save_job(job)
+        spool.unlink(missing_ok=True)
+    finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+
+@app.route('/index/jobs', methods=['POST'])
+def create_index_job():
+    """Start a background bulk-index job from an NDJSON body.
+
+    Each line is {"id": ..., "document": ..., "metadata": {...}}. The project
+    comes from X-Project or ?project=, the chunk size from ?chunk_size=.
+    """
+    try:
+        project = _get_project({"project": request.args.get("project")})
+        chunk_size = request.args.get("chunk_size", INDEX_JOB_CHUNK_SIZE, type=int)
+        if chunk_size <= 0:
+            return jsonify({"error": "chunk_size must be positive"}), 400
+
+        job_id = uuid.uuid4().hex
+        spool = _jobs_dir() / f"{job_id}.ndjson"
+        total = 0
+        with open(spool, "wb") as f:
+            for line in request.stream:
+                if line.strip():
+                    f.write(line if line.endswith(b"\n") else line + b"\n")
+                    total += 1
+        if total == 0:
+            spool.unlink(missing_ok=True)
+            return jsonify({"error": "request body must contain NDJSON documents"}), 400
+
+        job = {
+            "id": job_id,
+            "project": project,
+            "status": "queued",
+            "chunk_size": chunk_size,
+            "docs_total": total,
+            "docs_done": 0,
+            "docs_indexed": 0,
+            "docs_skipped": 0,
+            "docs_per_sec": 0.0,
+            "error_count": 0,
+            "errors": [],
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+        }
+        _save_job(job)
+        _ensure_job_worker()
+        _job_queue.put(job_id)
+        return jsonify(job), 202, {"Location": f"/index/jobs/{job_id}"}
+
+    except Exception as e:
+        logger.error(f"Index job error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
+@app.route('/index/jobs', methods=['GET'])
+def list_index_jobs():
+    """List bulk-index jobs, newest first."""
+    jobs = [_load_job(p.stem) for p in _jobs_dir().glob("*.json")]
+    jobs = sorted((j for j in jobs if j), key=lambda j: j["created_at"], reverse=True)
+    return jsonify({"jobs": jobs})
+
+
+@app.route('/index/jobs/<job_id>', methods=['GET'])
+def index_job_status(job_id):
+    """Report a bulk-index job's progress."""
+    job = _load_job(job_id)
+    if job is None:
+        return jsonify({"error": f"unknown job {job_id}"}), 404
+    _ensure_job_worker()
+    return jsonify(job)
+
+
+# Git revision sync: POST /projects/<name>/sync diffs the repository against
+# the revision recorded in the collection metadata and re-embeds only the delta.
+# Files are read straight from the git object store, so the working tree may be dirty.
+SYNC_EXTENSIONS = {".py", ".ts", ".tsx", ".js", ".jsx", ".go", ".rs", ".java", ".md"}  # client CODE_EXTS
+_sync_locks: Dict[str, threading.Lock] = {}
+_sync_locks_guard = threading.Lock()
+
+
+def _git(repo: str, *args: str) -> str:
+    """Run a git command in repo and return stdout (raises CalledProcessError)."""
+    return subprocess.run(["git", "-C", repo, *args], check=True, capture_output=True,
+                          text=True, encoding="utf-8", errors="replace").stdout
+
+
+def _sync_indexable(path: str) -> bool:
+    return Path(path).suffix in SYNC_EXTENSIONS
+
+
+def _git_changes(repo: str, old: Optional[str], new: str) -> tuple:
+    """Return (upserts, deletes, renamed) between two revisions; old=None lists the whole tree."""
+    if old is None:
+        paths = [p for p in _git(repo, "ls-tree", "-r", "-z", "--name-only", new).split("\0") if p]
+        return paths, [], 0
+    fields = [f for f in _git(repo, "diff", "--name-status", "-z", "-M", old, new).split("\0") if f]
+    upserts, deletes, renamed = [], [], 0
+    i = 0
+    while i < len(fields):
+        status = fields[i]
+        if status[0] in "RC":
+            src, dst = fields[i + 1], fields[i + 2]
+            i += 3
+            if status[0] == "R":
+                deletes.append(src)
+                renamed += 1
+            upserts.append(dst)
+        else:
+            path = fields[i + 1]
+            i += 2
+            (deletes if status[0] == "D" else upserts).append(path)
+    return upserts, deletes, renamed
+
+
+def _git_read_blobs(repo: str, revision: str, paths: list):
+    """Yield (path, text) for each path at revision via one ``git cat-file --batch``.
+
+    Binary blobs (NUL bytes) and paths missing at the revision are skipped.
+    """
+    proc = subprocess.Popen(["git", "-C", repo, "cat-file", "--batch"],
+                            stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+    try:
+        for path in paths:
+            proc.stdin.write(f"{revision}:{path}\n".encode())
+            proc.stdin.flush()
+            header = proc.stdout.readline().decode().split()
+            if len(header) < 3 or header[1] != "blob":
+                continue  # "<object> missing" or a submodule / tree
+            data = proc.stdout.read(int(header[2]))
+            proc.stdout.read(1)  # trailing newline
+            if b"\0" in data[:8192]:
+                continue
+            yield path, data.decode("utf-8", errors="ignore")
+    finally:
+        proc.stdin.close()
+        proc.wait()
+
+
+def _sync_lock(project: str) -> threading.Lock:
+    with _sync_locks_guard:
+        return _sync_locks.setdefault(project, threading.Lock())
+
+
+def _sync_project(project: str, repo: str, revision: str, full: bool) -> dict:
+    """Bring a project's index up to revision. See sync_project for the response shape."""
+    started = time.monotonic()
+    repo = _git(repo, "rev-parse", "--show-toplevel").strip()  # git paths are relative to the root
+    target = _git(repo, "rev-parse", "--verify", f"{revision}^{{commit}}").strip()
+    col = _get_collection(project)
+    previous = (col.metadata or {}).get("indexed_revision")
+    if previous and not full:
+        try:
+            _git(repo, "cat-file", "-e", f"{previous}^{{commit}}")
+        except subprocess.CalledProcessError:
+            logger.warning(f"Sync {project}: indexed revision {previous} not in {repo}, doing a full sync")
+            previous = None
+    base = None if full else previous
+
+    summary = {"project": project, "from_revision": base, "revision": target, "full": base is None,
+               "files_upserted": 0, "files_deleted": 0, "files_renamed": 0,
+               "indexed": 0, "skipped_unchanged": 0, "removed_docs": 0}
+    if base == target:
+        summary["generation"] = _get_generation(project)
+        summary["seconds"] = round(time.monotonic() - started, 3)
+        return summary
+
+    upserts, deletes, renamed = _git_changes(repo, base, target)
+    upserts = [p for p in upserts if _sync_indexable(p)]
+    deletes = [p for p in deletes if _sync_indexable(p)]
+    if base is None:
+        # Full sync: drop previously synced files that no longer exist in the tree
+        in_tree, stale, offset = set(upserts), set(), 0
+        while True:
+            page = col.get(where={"source": "git"}, include=["metadatas"], limit=1000, offset=offset)
+            if not page["ids"]:
+                break
+            stale.update(m.get("file") for m in page["metadatas"] if m and m.get("file") not in in_tree)
+            offset += len(page["ids"])
+        deletes = sorted(f for f in stale if f)
+
+    # The collection is re-fetched per write so a long sync keeps its project
+    # resident (and never writes through a client closed by eviction)
+    for path in deletes:
+        summary["removed_docs"] += _delete_documents(project, _get_collection(project), {"file": path})
+
+    docs, ids, metas = [], [], []
+
+    def flush() -> None:
+        written, skipped, pruned = _upsert_documents(project, _get_collection(project), docs, metas, ids)
+        summary["indexed"] += written
+        summary["skipped_unchanged"] += skipped
+        summary["removed_docs"] += pruned
+        docs.clear()
+        ids.clear()
+        metas.clear()
+
+    for path, text in _git_read_blobs(repo, target, upserts):
+        summary["files_upserted"] += 1
+        chunks = chunk_text(text, path)
+        if not chunks:
+            summary["removed_docs"] += _delete_documents(project, _get_collection(project), {"file": path})
+            continue
+        for n, chunk in enumerate(chunks):
+            docs.append(chunk["content"])
+            ids.append(f"{project}::{path}::{n}")
+            metas.append({"type": "ticket" if "backlog/data" in path else "code", "file": path,
+                          "project": project, "source": "git", "chunk": n, "chunks": len(chunks),
+                          "start_line": chunk["start_line"], "end_line": chunk["end_line"]})
+        if len(docs) >= INDEX_JOB_CHUNK_SIZE:
+            flush()
+    if docs:
+        flush()
+
+    summary["files_deleted"] = len(deletes)
+    summary["files_renamed"] = renamed
+    col = _get_collection(project)
+    metadata = {k: v for k, v in (col.metadata or {}).items() if not k.startswith("hnsw:")}
+    metadata.update({"indexed_revision": target, "indexed_repo": repo, "indexed_at": time.time()})
+    col.modify(metadata=metadata)
+
+    changed = summary["indexed"] or summary["removed_docs"]
+    summary["generation"] = _bump_generation(project) if changed else _get_generation(project)
+    summary["seconds"] = round(time.monotonic() - started, 3)
+    logger.info(f"Synced {project} to {target[:12]}: {summary['files_upserted']} upserted, "
+                f"{summary['files_deleted']} deleted in {summary['seconds']}s")
+    return summary
+
+
+@app.route('/projects/<name>/sync', methods=['POST'])
+def sync_project(name):
+    """Incrementally reindex a project to a git revision.
+
+    Body: {"repo_path": "/abs/path", "revision": "HEAD", "full": false}. Returns
+    the old and new revision, file counts (upserted / deleted / renamed),
+    documents indexed / skipped / removed, and the new generation.
+    """
+    data = request.get_json(silent=True) or {}
+    repo = data.get("repo_path")
+    if not repo:
+        return jsonify({"error": "repo_path is required"}), 400
+    if not os.path.isdir(repo):
+        return jsonify({"error": f"repo_path not found: {repo}"}), 400
+    lock = _sync_lock(name)
+    if not lock.acquire(blocking=False):
+        return jsonify({"error": f"a sync of {name} is already running"}), 409
+    try:
+        return jsonify(_sync_project(name, repo, data.get("revision") or "HEAD", bool(data.get("full"))))
+    except subprocess.CalledProcessError as e:
+        return jsonify({"error": f"git {' '.join(e.cmd[3:])} failed: {(e.stderr or '').strip()}"}), 400
+    except FileNotFoundError:
+        return jsonify({"error": "git is not installed on the server"}), 500
+    except Exception as e:
+        logger.error(f"Sync error: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        lock.release()
+
+
+# Snapshots: a project index serialised without re-embedding. Layout:
+#   b"RAGSNAP1\n"
+#   {"project", "model", "dim", "count", "metadata", "exported_at"}\n
+#   per page: {"rows": n, "ids": [...], "documents": [...], "metadatas": [...]}\n
+#             then n x dim little-endian float16 vectors (one contiguous block)
+#   {"rows": 0}\n
+SNAPSHOT_MAGIC = b"RAGSNAP1\n"
+SNAPSHOT_PAGE_SIZE = 1000
+
+
+def _snapshot_pages(project: str):
+    """Yield (ids, documents, metadatas, float32 vectors) pages of a project's collection."""
+    offset = 0
+    while True:
+        col = _get_collection(project)  # per page, so a long export keeps the project resident
+        page = col.get(include=["documents", "metadatas", "embeddings"],
+                       limit=SNAPSHOT_PAGE_SIZE, offset=offset)
+        if not page["ids"]:
+            return
+        yield page["ids"], page["documents"], page["metadatas"], np.asarray(page["embeddings"], dtype=np.float32)
+        offset += len(page["ids"])
+
+
+@app.route('/projects/<name>/export', methods=['GET'])
+def export_project(name):
+    """Stream a snapshot of the project's index (vectors as float16, docs, metadata)."""
+    if name not in _on_disk_projects():
+        return jsonify({"error": f"project {name} not found"}), 404
+    col = _get_collection(name)
+    pages = _snapshot_pages(name)
+    first = next(pages, None)
+    header = {
+        "project": name,
+        "model": _embedding_model_id(),
+        "dim": int(first[3].shape[1]) if first else 0,
+        "count": col.count(),
+        "metadata": {k: v for k, v in (col.metadata or {}).items() if not k.startswith("hnsw:")},
+        "exported_at": time.time(),
+    }
+
+    def generate():
+        yield SNAPSHOT_MAGIC + (json.dumps(header) + "\n").encode()
+        page = first
+        while page is not None:
+            ids, documents, metadatas, vectors = page
+            yield (json.dumps({"rows": len(ids), "ids": ids, "documents": documents,
+                               "metadatas": metadatas}) + "\n").encode()
+            yield vectors.astype("<f2").tobytes()
+            page = next(pages, None)
+        yield b'{"rows": 0}\n'
+
+    return Response(stream_with_context(generate()), mimetype="application/octet-stream",
+                    headers={"Content-Disposition": f'attachment; filename="{name}.ragsnap"'})
+
+
+def _snapshot_records(stream, dim: int):
+    """Yield (page, float32 vectors) from a snapshot body positioned after its header.
+
+    Raises ValueError/KeyError if a page is malformed or the stream ends before
+    the closing {"rows": 0} record.
+    """
+    while True:
+        line = stream.readline()
+        if not line:
+            raise ValueError("snapshot truncated (no end record)")
+        page = json.loads(line)
+        rows = page["rows"]
+        if rows == 0:
+            return
+        raw = stream.read(rows * dim * 2)
+        if len(raw) != rows * dim * 2:
+            raise ValueError("snapshot truncated")
+        if not len(page["ids"]) == len(page["documents"]) == len(page["metadatas"]) == rows:
+            raise ValueError("page row count mismatch")
+        yield page, np.frombuffer(raw, dtype="<f2").reshape(rows, dim).astype(np.float32)
+
+
+@app.route('/projects/<name>/import', methods=['POST'])
+def import_project(name):
+    """Load a snapshot produced by /export without re-embedding.
+
+    ?mode=replace (default) replaces the existing index; ?mode=merge upserts
+    into it. Snapshots from a different embedding model are rejected with 409.
+    The body is spooled to disk and checked end to end before the project is
+    touched, so a truncated or corrupt upload leaves the current index intact.
+    """
+    mode = request.args.get("mode", "replace")
+    if mode not in ("replace", "merge"):
+        return jsonify({"error": "mode must be replace or merge"}), 400
+    stream = request.stream
+    if stream.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+        return jsonify({"error": "not a RAG snapshot"}), 400
+    try:
+        header = json.loads(stream.readline())
+    except ValueError:
+        return jsonify({"error": "corrupt snapshot header"}), 400
+    if header.get("model") != _embedding_model_id():
+        return jsonify({"error": f"snapshot was built with {header.get('model')}, "
+                                 f"server embeds with {_embedding_model_id()}"}), 409
+
+    Path(BASE_PATH).mkdir(parents=True, exist_ok=True)
+    with tempfile.TemporaryFile(dir=BASE_PATH) as spool:
+        shutil.copyfileobj(stream, spool, 1 << 20)
+        try:
+            spool.seek(0)
+            dim = header["dim"]
+            for _ in _snapshot_records(spool, dim):
+                pass
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({"error": f"corrupt snapshot: {e}"}), 400
+        spool.seek(0)
+        return _apply_snapshot(name, mode, header, _snapshot_records(spool, dim))
+
+
+def _apply_snapshot(name: str, mode: str, header: dict, records) -> tuple:
+    """Write validated snapshot records into a project (dropping it first for replace)."""
+    imported = 0
+    try:
+        if mode == "replace":
+            _drop_project(name)
+        col = _get_collection(name)
+        for page, vectors in records:
+            rows = page["rows"]
+            metadatas = [meta or {"content_hash": _content_hash(doc)}
+                         for doc, meta in zip(page["documents"], page["metadatas"])]
+            col = _get_collection(name)  # per page, so a long import keeps the project resident
+            with _timed("chroma_write"):
+                col.upsert(ids=page["ids"], documents=page["documents"], metadatas=metadatas,
+                           embeddings=vectors.tolist())
+            imported += rows
+        if header.get("metadata"):
+            metadata = {k: v for k, v in (col.metadata or {}).items() if not k.startswith("hnsw:")}
+            metadata.update(header["metadata"])
+            col.modify(metadata=metadata)
+    except Exception as e:
+        logger.error(f"Import error: {e}")
+        return jsonify({"error": str(e)}), 500
+    finally:
+        # Counters and the lexical index are rebuilt from the collection on next use
+        with _counts_lock:
+            _type_counts.pop(name, None)
+        _counts_path(name).unlink(missing_ok=True)
+        _discard_lexical_index(name)
+        _bump_generation(name)
+
+    return jsonify({"project": name, "mode": mode, "imported": imported,
+                    "document_count": _get_collection(name).count(), "generation": _get_generation(name)})
+
+
 @app.route('/projects', methods=['GET'])
 def list_projects():
-    """List all indexed projects with document counts."""
-    base = Path(BASE_PATH)
+    """List all indexed projects with document counts (served from cached counters)."""
     projects = []
-    if base.exists():
-        for d in sorted(base.iterdir()):
-            if d.is_dir():
-                col = _get_collection(d.name)
-                try:
-                    code_ids = col.get(where={"type": "code"})["ids"]
-                    ticket_ids = col.get(where={"type": "ticket"})["ids"]
-                except Exception:
-                    code_ids, ticket_ids = [], []
-                projects.append({
-                    "name": d.name,
-                    "count": col.count(),
-                    "code_count": len(code_ids),
-                    "ticket_count": len(ticket_ids),
-                })
+    for name in _on_disk_projects():
+        try:
+            counts = _get_counts(name)
+        except Exception as e:
+            logger.warning(f"Could not count documents for {name}: {e}")
+            counts = {"total": 0, "types": {}}
+        projects.append({
+            "name": name,
+            "count": counts["total"],
+            "code_count": counts["types"].get("code", 0),
+            "ticket_count": counts["types"].get("ticket", 0),
+        })
     return jsonify({"projects": projects})
 
 
-@app.route('/projects/<name>', methods=['DELETE'])
-def delete_project(name):
-    """Delete a project's index and all its data."""
-    import shutil
-    if name in _clients:
-        del _clients[name]
-        del _collections[name]
+def _drop_project(name: str) -> None:
+    """Close a project and remove its on-disk index and cached state."""
+    with _collections_lock:
+        _collections.pop(name, None)
+        _last_used.pop(name, None)
+        clients = [_clients.pop(name)] if name in _clients else []
+        # Evicted clients still in their grace period hold the same files open
+        clients += [c for _, n, c in _retired_clients if n == name]
+        _retired_clients[:] = [r for r in _retired_clients if r[1] != name]
+    for client in clients:
+        _close_client(client, dropping=True)
+    with _counts_lock:
+        _type_counts.pop(name, None)
+    _discard_lexical_index(name)
     path = os.path.join(BASE_PATH, name)
     if os.path.exists(path):
         shutil.rmtree(path)
+
+
+@app.route('/projects/<name>', methods=['DELETE'])
+def delete_project(name):
+    """Delete a project's index and all its data."""
+    _drop_project(name)
+    _bump_generation(name)
     return jsonify({"deleted": name})
 
 
+@app.route('/projects/<name>/files', methods=['DELETE'])
+def delete_project_files(name):
+    """Delete every document whose metadata ``file`` is in the body's ``files`` list."""
+    data = request.get_json(silent=True) or {}
+    files = data.get("files")
+    if not isinstance(files, list) or not files or not all(isinstance(f, str) for f in files):
+        return jsonify({"error": "files must be a non-empty list of paths"}), 400
+    if name not in _on_disk_projects():
+        return jsonify({"project": name, "removed": 0, "generation": _get_generation(name)})
+    try:
+        col = _get_collection(name)
+        removed = _delete_documents(name, col, {"file": {"$in": files}})
+        generation = _bump_generation(name) if removed else _get_generation(name)
+        return jsonify({"project": name, "removed": removed, "generation": generation})
+    except Exception as e:
+        logger.error(f"Delete files error: {e}")
+        return jsonify({"error": str(e)}), 500
+
+
 @app.route('/projects/<name>/stats', methods=['GET'])
 def project_stats(name):
     """Get statistics for a specific project."""
     col = _get_collection(name)
-    return jsonify({"name": name, "count": col.count(), "metadata": col.metadata})
+    return jsonify({"name": name, "count": col.count(), "metadata": col.metadata,
+                    "generation": _get_generation(name), "epoch": _index_epoch()})
 
 
 @app.route('/projects/<name>/init', methods=['POST'])
@@ -223,13 +2260,117 @@ def stats():
             "project": project,
             "collection_name": col.name,
             "document_count": col.count(),
-            "metadata": col.metadata
+            "metadata": col.metadata,
+            "generation": _get_generation(project),
+            "epoch": _index_epoch(),
+            "embedding_cache": _embedding_cache.stats(),
+            "result_cache": _result_cache.stats(),
+            "admission": _admission.stats() if _admission else None,
+            "embedding_scheduler": _scheduler.stats() if _scheduler else None,
+            "startup": _startup_metrics,
         })
     except Exception as e:
         logger.error(f"Stats error: {e}")
         return jsonify({"error": str(e)}), 500
 
 
+def _prom_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _prom_metric(lines: list, name: str, kind: str, help_text: str, samples: list) -> None:
+    """Append one metric family; samples are (labels, value) pairs."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        lines.append(f"{name}{_prom_labels(labels)} {value}")
+
+
+def _prom_histogram(lines: list, name: str, help_text: str, series: list) -> None:
+    """Append a histogram family; series are (labels, _Histogram) pairs."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for labels, hist in series:
+        snap = hist.snapshot()
+        for bound, n in snap["buckets"].items():
+            lines.append(f"{name}_bucket{_prom_labels({**labels, 'le': bound})} {n}")
+        lines.append(f"{name}_sum{_prom_labels(labels)} {snap['sum']}")
+        lines.append(f"{name}_count{_prom_labels(labels)} {snap['count']}")
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Prometheus text-format metrics for this worker process."""
+    lines: list = []
+    with _metrics_lock:
+        request_counts = sorted(_request_counts.items())
+        request_latency = sorted(_request_latency.items())
+        stage_latency = sorted(_stage_latency.items())
+
+    _prom_metric(lines, "rag_requests_total", "counter", "HTTP requests by route, method and status.",
+                 [({"route": r, "method": m, "status": s}, n) for (r, m, s), n in request_counts])
+    _prom_histogram(lines, "rag_request_duration_seconds", "HTTP request latency by route.",
+                    [({"route": r, "method": m}, h) for (r, m), h in request_latency])
+    _prom_histogram(lines, "rag_stage_duration_seconds",
+                    "Time spent per pipeline stage (embed, chroma_query, chroma_write, lexical).",
+                    [({"stage": stage}, h) for stage, h in stage_latency])
+    _prom_histogram(lines, "rag_encode_batch_size", "Texts per embedding encode call.",
+                    [({}, _encode_batch_sizes)])
+    if _scheduler is not None:
+        _prom_histogram(lines, "rag_scheduler_batch_size", "Texts per micro-batch formed by the scheduler.",
+                        [({}, _scheduler.batch_sizes)])
+        _prom_histogram(lines, "rag_scheduler_queue_wait_ms", "Time requests waited for their micro-batch.",
+                        [({}, _scheduler.queue_wait_ms)])
+
+    caches = [("embedding", _embedding_cache.stats()), ("result", _result_cache.stats())]
+    _prom_metric(lines, "rag_cache_hits_total", "counter", "Cache hits.",
+                 [({"cache": c}, st["hits"]) for c, st in caches])
+    _prom_metric(lines, "rag_cache_misses_total", "counter", "Cache misses.",
+                 [({"cache": c}, st["misses"]) for c, st in caches])
+    _prom_metric(lines, "rag_cache_hit_ratio", "gauge", "Cache hits / lookups.",
+                 [({"cache": c}, st["hit_ratio"]) for c, st in caches])
+    _prom_metric(lines, "rag_cache_entries", "gauge", "Entries currently cached.",
+                 [({"cache": c}, st["size"]) for c, st in caches])
+
+    if _admission is not None:
+        gate = _admission.stats()
+        _prom_metric(lines, "rag_admission_max_inflight", "gauge", "Concurrent gated requests allowed.",
+                     [({}, gate["max_inflight"])])
+        _prom_metric(lines, "rag_admission_waiting", "gauge", "Gated requests waiting for a slot.",
+                     [({}, gate["waiting"])])
+        _prom_metric(lines, "rag_admission_rejected_total", "counter", "Requests rejected with 429.",
+                     [({}, gate["rejected"])])
+
+    doc_counts = []
+    for name in _on_disk_projects():
+        try:
+            counts = _get_counts(name)
+        except Exception as e:
+            logger.warning(f"Could not count documents for {name}: {e}")
+            continue
+        for doc_type, n in sorted(counts["types"].items()):
+            doc_counts.append(({"project": name, "type": doc_type}, n))
+    _prom_metric(lines, "rag_project_documents", "gauge", "Indexed documents per project and type.", doc_counts)
+    _prom_metric(lines, "rag_resident_projects", "gauge", "Projects currently open in this worker.",
+                 [({}, len(_clients))])
+
+    startup = [({"phase": phase}, _startup_metrics[key]) for phase, key in (
+        ("model_load", "model_load_seconds"), ("warmup_encode", "warmup_encode_seconds"),
+        ("projects_load", "projects_load_seconds"), ("ready", "ready_after_seconds"),
+    ) if _startup_metrics[key] is not None]
+    _prom_metric(lines, "rag_startup_seconds", "gauge", "Startup phase durations.", startup)
+    _prom_metric(lines, "rag_ready", "gauge", "1 once the worker is ready to serve.",
+                 [({}, int(_ready.is_set()))])
+
+    return "\n".join(lines) + "\n", 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+
+
 UI_HTML = """<!DOCTYPE html>
 <html><head><title>RAG UI</title>
 <style>body{font-family:monospace;padding:20px;max-width:900px}
@@ -277,20 +2418,118 @@ def ui():
 
 
 def main():
+    global BASE_PATH, MAX_RESIDENT_PROJECTS, PROJECT_IDLE_SECONDS, EMBED_BACKEND, EMBED_MODEL_NAME
+    global _result_cache, _scheduler, _admission, _warmup_enabled, _warmup_projects
     parser = argparse.ArgumentParser(description="RAG Server for Backlog Toolkit")
     parser.add_argument('--port', type=int, default=8001, help='Port to run on')
     parser.add_argument('--host', default='127.0.0.1', help='Host to bind to')
     parser.add_argument('--db-path', help='ChromaDB base path (overrides RAG_BASE_PATH env var)')
+    parser.add_argument('--embedder', choices=EMBED_BACKENDS, default=EMBED_BACKEND,
+                        help='Embedding backend (see scripts/rag/bench_embedders.py to compare)')
+    parser.add_argument('--model', default=EMBED_MODEL_NAME, help='sentence-transformers model name')
+    parser.add_argument('--embed-cache-size', type=int, default=EMBED_CACHE_SIZE,
+                        help='Max cached query embeddings (0 disables the cache)')
+    parser.add_argument('--embed-cache-ttl', type=float, default=EMBED_CACHE_TTL,
+                        help='Seconds before a cached query embedding expires (0 = never)')
+    parser.add_argument('--embed-cache-path', default=EMBED_CACHE_PATH,
+                        help='File to persist the embedding cache across restarts')
+    parser.add_argument('--result-cache-size', type=int, default=RESULT_CACHE_SIZE,
+                        help='Max cached /search results (0 disables the cache)')
+    parser.add_argument('--embed-batch-size', type=int, default=EMBED_BATCH_SIZE,
+                        help='Max texts coalesced into one encode call (0 disables micro-batching)')
+    parser.add_argument('--embed-batch-wait-ms', type=float, default=EMBED_BATCH_WAIT_MS,
+                        help='How long the scheduler waits for more requests to join a batch')
+    parser.add_argument('--max-projects', type=int, default=MAX_RESIDENT_PROJECTS,
+                        help='Max projects kept open in memory (least recently used are closed)')
+    parser.add_argument('--project-idle-seconds', type=float, default=PROJECT_IDLE_SECONDS,
+                        help='Close projects unused for this long (0 = never)')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='Worker processes (each loads its own model)')
+    parser.add_argument('--threads', type=int, default=8,
+                        help='Request threads per worker')
+    parser.add_argument('--max-inflight', type=int, default=0,
+                        help='Concurrent /search and /index requests per worker (default: threads/2)')
+    parser.add_argument('--max-queue', type=int, default=None,
+                        help='Requests allowed to wait for a slot before 429 (default: remaining threads)')
+    parser.add_argument('--queue-timeout', type=float, default=10.0,
+                        help='Seconds a queued request waits for a slot before 429')
+    parser.add_argument('--warmup', action='store_true',
+                        default=os.environ.get("RAG_WARMUP", "") not in ("", "0", "false"),
+                        help='Load the model and hot projects at startup; /ready answers 503 until done')
+    parser.add_argument('--warmup-projects', default=os.environ.get("RAG_WARMUP_PROJECTS", ""),
+                        help='Comma-separated projects to open during warm-up')
     args = parser.parse_args()
 
     if args.db_path:
-        global BASE_PATH
         BASE_PATH = args.db_path
 
+    EMBED_BACKEND = args.embedder
+    EMBED_MODEL_NAME = args.model
+    MAX_RESIDENT_PROJECTS = args.max_projects
+    PROJECT_IDLE_SECONDS = args.project_idle_seconds
+
+    _configure_embedding_cache(args.embed_cache_size, args.embed_cache_ttl, args.embed_cache_path)
+    _result_cache = _LRUCache(args.result_cache_size)
+
+    if args.embed_batch_size > 0:
+        _scheduler = _EmbeddingScheduler(_encode_direct, args.embed_batch_size, args.embed_batch_wait_ms)
+
+    max_inflight = args.max_inflight or max(1, args.threads // 2)
+    max_queue = args.max_queue if args.max_queue is not None else max(0, args.threads - max_inflight)
+    _admission = _AdmissionGate(max_inflight, max_queue, args.queue_timeout)
+
+    _warmup_enabled = args.warmup
+    _warmup_projects = [p.strip() for p in args.warmup_projects.split(",") if p.strip()]
+
     # Start server — per-project collections are created lazily on first request
-    logger.info(f"Starting RAG server on {args.host}:{args.port}")
+    logger.info(f"Starting RAG server on {args.host}:{args.port} "
+                f"({args.workers} worker(s) x {args.threads} thread(s), "
+                f"{max_inflight} in-flight, queue {max_queue})")
     logger.info(f"ChromaDB base path: {BASE_PATH}")
-    app.run(host=args.host, port=args.port, debug=False)
+    logger.info(f"Embedder: {EMBED_MODEL_NAME} ({EMBED_BACKEND})")
+    if _warmup_enabled:
+        logger.info(f"Warm-up enabled (projects: {', '.join(_warmup_projects) or 'none'})")
+    _serve(args.host, args.port, args.workers, args.threads)
+
+
+def _serve(host: str, port: int, workers: int, threads: int) -> None:
+    """Serve the app from a gunicorn gthread pool, or Werkzeug if gunicorn is missing."""
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        logger.warning("gunicorn not installed — using the threaded Werkzeug server "
+                       "(pip install gunicorn for production serving)")
+        atexit.register(_save_embedding_cache)
+        _start_warmup()
+        _ensure_job_worker()  # resume jobs interrupted by the last shutdown
+        app.run(host=host, port=port, debug=False, threaded=True)
+        return
+
+    if workers > 1:
+        logger.warning(f"{workers} workers: each loads its own embedding model and caches")
+
+    def post_worker_init(worker) -> None:
+        # Warm up inside each worker — torch must not be initialised before fork.
+        # Every worker resumes interrupted jobs; the job lock lets only one run each.
+        _start_warmup()
+        _ensure_job_worker()
+
+    class _GunicornApp(BaseApplication):
+        def load_config(self):
+            self.cfg.set("bind", f"{host}:{port}")
+            self.cfg.set("workers", workers)
+            self.cfg.set("threads", threads)
+            self.cfg.set("worker_class", "gthread")
+            # First request after boot may load the model; don't kill the worker
+            self.cfg.set("timeout", 300)
+            self.cfg.set("post_worker_init", post_worker_init)
+            # Each worker saves the embedding cache it filled; the master's copy is stale
+            self.cfg.set("worker_exit", lambda arbiter, worker: _save_embedding_cache())
+
+        def load(self):
+            return app
+
+    _GunicornApp().run()
 
 
 if __name__ == '__main__':
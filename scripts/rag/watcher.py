@@ -3,17 +3,23 @@
 RAG File Watcher — always-on host-side watcher that indexes file changes
 into the project-aware RAG server.
 
+On startup the watcher diffs the tree against a per-project manifest of
+(mtime, size, sha256) saved after every flush, so files changed while it was
+not running are indexed (and removed files deleted) without a full reindex.
+
 Usage:
     python3 scripts/rag/watcher.py --watch /path/to/project
     python3 scripts/rag/watcher.py  # defaults to CWD
 """
 
 import argparse
+import hashlib
 import json
 import os
 import sys
 import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 # Make scripts.rag importable
@@ -26,10 +32,11 @@ except ImportError:
     print("Error: watchdog not installed. Run: pip install watchdog")
     sys.exit(1)
 
-from rag.client import RagClient
+from rag.client import CODE_EXTS, IGNORE_DIRS, RagClient, tree_files
 
-CODE_EXTS = {".py", ".ts", ".tsx", ".js", ".jsx", ".go", ".rs", ".java", ".md"}
-IGNORE_DIRS = {".git", "node_modules", "__pycache__", ".mypy_cache", ".ruff_cache", "dist", "build"}
+MAX_BATCH_FILES = 100  # files per index/delete request
+MANIFEST_DIR = os.environ.get("RAG_MANIFEST_DIR", os.path.expanduser("~/.backlog-toolkit/rag/manifests"))
+SCAN_WORKERS = min(32, (os.cpu_count() or 1) * 4)
 
 
 def _get_project(watch_dir: str) -> str:
@@ -50,62 +57,238 @@ def _should_ignore(path: str) -> bool:
     return any(part in IGNORE_DIRS for part in parts)
 
 
-class _ChangeHandler(FileSystemEventHandler):
-    def __init__(self, client: RagClient, debounce: float = 2.0):
-        self.client = client
-        self.debounce = debounce
-        self._pending: dict = {}  # path -> action
+def _file_hash(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+class _Manifest:
+    """Persistent record of what has been indexed: relative path -> [mtime, size, sha256]."""
+
+    def __init__(self, path: Path, root: str):
+        self.path = path
+        self.root = root
+        self.files: dict = {}
         self._lock = threading.Lock()
+        try:
+            data = json.loads(path.read_text())
+            if data.get("root") == root:  # a manifest for another checkout is useless here
+                self.files = data.get("files", {})
+        except (OSError, ValueError):
+            pass
 
-    def _schedule(self, path: str, action: str = "upsert") -> None:
+    def _rel(self, path: str) -> str:
+        return os.path.relpath(path, self.root)
+
+    def record(self, paths: list) -> None:
+        """Remember the current stat and hash of indexed paths (missing files are forgotten)."""
+        for path in paths:
+            try:
+                st = os.stat(path)
+                entry = [st.st_mtime, st.st_size, _file_hash(path)]
+            except OSError:
+                entry = None
+            with self._lock:
+                if entry is None:
+                    self.files.pop(self._rel(path), None)
+                else:
+                    self.files[self._rel(path)] = entry
+
+    def forget(self, paths: list) -> None:
         with self._lock:
-            self._pending[path] = action
-        t = threading.Timer(self.debounce, self._flush, args=[path])
-        t.daemon = True
-        t.start()
+            for path in paths:
+                self.files.pop(self._rel(path), None)
 
-    def _flush(self, path: str) -> None:
+    def save(self) -> None:
         with self._lock:
-            action = self._pending.pop(path, None)
-        if not action:
-            return
+            data = json.dumps({"root": self.root, "files": self.files})
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(data)
+        os.replace(tmp, self.path)
+
+
+def _catch_up(manifest: _Manifest, root: str) -> tuple:
+    """Diff the tree against the manifest. Returns (changed paths, deleted paths).
+
+    Files whose mtime and size match the manifest are trusted; the rest are
+    hashed in parallel and only count as changed if their content differs.
+    """
+    files = tree_files(root)
+    known = dict(manifest.files)
+
+    def check(path: str):
         try:
+            st = os.stat(path)
+            entry = known.get(manifest._rel(path))
+            if entry and entry[0] == st.st_mtime and entry[1] == st.st_size:
+                return None
+            if entry and entry[2] == _file_hash(path):
+                return None  # touched but unchanged
+            return path
+        except OSError:
+            return None
+
+    with ThreadPoolExecutor(max_workers=SCAN_WORKERS) as pool:
+        changed = [p for p in pool.map(check, files) if p]
+    present = {manifest._rel(p) for p in files}
+    deleted = [os.path.join(root, rel) for rel in known if rel not in present]
+    return changed, deleted
+
+
+class _ChangeHandler(FileSystemEventHandler):
+    """Collects filesystem events and indexes them from one debounced flusher thread.
+
+    Events only record the latest action per path. Once no event has arrived
+    for ``debounce`` seconds (or ``max_delay`` has passed since the first
+    pending one, so a constant stream still flushes), every pending path is
+    sent in batches of at most ``max_batch`` files per request.
+    """
+
+    def __init__(self, client: RagClient, debounce: float = 2.0, max_batch: int = MAX_BATCH_FILES,
+                 manifest: _Manifest = None):
+        self.client = client
+        self.debounce = debounce
+        self.max_batch = max_batch
+        self.manifest = manifest
+        self.max_delay = debounce * 10
+        self._pending: dict = {}  # path -> action
+        self._first_event = 0.0
+        self._last_event = 0.0
+        self._cond = threading.Condition()
+        self._thread = threading.Thread(target=self._run, name="rag-watcher-flush", daemon=True)
+        self._thread.start()
+
+    def _schedule(self, path: str, action: str = "upsert", overwrite: bool = True) -> None:
+        with self._cond:
+            now = time.monotonic()
+            if not self._pending:
+                self._first_event = now
+            if overwrite or path not in self._pending:
+                self._pending[path] = action
+            self._last_event = now
+            self._cond.notify()
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                while not self._pending:
+                    self._cond.wait()
+                while True:
+                    now = time.monotonic()
+                    wait = min(self._last_event + self.debounce, self._first_event + self.max_delay) - now
+                    if wait <= 0:
+                        break
+                    self._cond.wait(wait)
+                batch, self._pending = self._pending, {}
+            self._flush(batch)
+
+    def _flush(self, batch: dict) -> None:
+        deletes = [path for path, action in batch.items() if action == "delete"]
+        upserts: dict = {}  # doc type -> paths
+        for path, action in batch.items():
             if action == "upsert":
                 doc_type = "ticket" if "backlog/data" in path.replace(os.sep, "/") else "code"
-                self.client.upsert_file(path, type=doc_type)
-                print(f"[watcher] indexed: {path}")
-        except Exception as e:
-            print(f"[watcher] error indexing {path}: {e}")
+                upserts.setdefault(doc_type, []).append(path)
+
+        for i in range(0, len(deletes), self.max_batch):
+            chunk = deletes[i:i + self.max_batch]
+            try:
+                self.client.delete_files(chunk)
+                if self.manifest:
+                    self.manifest.forget(chunk)
+                print(f"[watcher] removed {len(chunk)} file(s)")
+            except Exception as e:
+                print(f"[watcher] error removing {len(chunk)} file(s): {e}")
+        for doc_type, paths in upserts.items():
+            for i in range(0, len(paths), self.max_batch):
+                chunk = paths[i:i + self.max_batch]
+                try:
+                    self.client.index_files(chunk, type=doc_type)
+                    if self.manifest:
+                        self.manifest.record(chunk)
+                    print(f"[watcher] indexed {len(chunk)} {doc_type} file(s)")
+                except Exception as e:
+                    print(f"[watcher] error indexing {len(chunk)} file(s): {e}")
+        if self.manifest:
+            try:
+                self.manifest.save()
+            except OSError as e:
+                print(f"[watcher] could not save manifest: {e}")
+
+    def catch_up(self, root: str) -> None:
+        """Queue everything that changed since the manifest was last saved."""
+        started = time.monotonic()
+        changed, deleted = _catch_up(self.manifest, root)
+        # Live events that arrived meanwhile are newer than the scan, so they win
+        for path in deleted:
+            self._schedule(path, "delete", overwrite=False)
+        for path in changed:
+            self._schedule(path, overwrite=False)
+        print(f"[watcher] catch-up: {len(changed)} changed, {len(deleted)} deleted "
+              f"({time.monotonic() - started:.1f}s)")
+
+    @staticmethod
+    def _tracked(event, path: str) -> bool:
+        return not event.is_directory and Path(path).suffix in CODE_EXTS and not _should_ignore(path)
 
     def on_created(self, event) -> None:
-        if not event.is_directory and Path(event.src_path).suffix in CODE_EXTS:
-            if not _should_ignore(event.src_path):
-                self._schedule(event.src_path)
+        if self._tracked(event, event.src_path):
+            self._schedule(event.src_path)
 
     def on_modified(self, event) -> None:
-        if not event.is_directory and Path(event.src_path).suffix in CODE_EXTS:
-            if not _should_ignore(event.src_path):
-                self._schedule(event.src_path)
+        if self._tracked(event, event.src_path):
+            self._schedule(event.src_path)
+
+    def on_deleted(self, event) -> None:
+        if self._tracked(event, event.src_path):
+            self._schedule(event.src_path, "delete")
+
+    def on_moved(self, event) -> None:
+        # Directory moves are reported per file as well, so only files are handled
+        if self._tracked(event, event.src_path):
+            self._schedule(event.src_path, "delete")
+        if self._tracked(event, event.dest_path):
+            self._schedule(event.dest_path)
+
 
+def start_watcher(watch_dir: str, debounce_seconds: float = 2.0, max_batch: int = MAX_BATCH_FILES,
+                  catch_up: bool = True) -> Observer:
+    """Start watching watch_dir. Returns the Observer (already started).
 
-def start_watcher(watch_dir: str, debounce_seconds: float = 2.0) -> Observer:
-    """Start watching watch_dir. Returns the Observer (already started)."""
+    With catch_up, files changed since the last run are queued from a
+    background scan once the observer is live, so no change is missed.
+    """
     project = _get_project(watch_dir)
+    root = str(Path(watch_dir).resolve())
     client = RagClient(project=project)
-    handler = _ChangeHandler(client, debounce=debounce_seconds)
+    manifest = _Manifest(Path(MANIFEST_DIR) / f"{project}.json", root)
+    handler = _ChangeHandler(client, debounce=debounce_seconds, max_batch=max_batch, manifest=manifest)
     observer = Observer()
     observer.schedule(handler, watch_dir, recursive=True)
     observer.start()
     print(f"[watcher] watching {watch_dir} -> project: {project}")
+    if catch_up:
+        threading.Thread(target=handler.catch_up, args=(root,), name="rag-watcher-scan", daemon=True).start()
     return observer
 
 
 def main() -> None:
     parser = argparse.ArgumentParser(description="RAG file watcher for backlog toolkit")
     parser.add_argument("--watch", default=os.getcwd(), help="Directory to watch (default: CWD)")
+    parser.add_argument("--debounce", type=float, default=2.0,
+                        help="Seconds without events before pending changes are flushed")
+    parser.add_argument("--batch-size", type=int, default=MAX_BATCH_FILES,
+                        help="Max files per index/delete request")
+    parser.add_argument("--no-catch-up", action="store_true",
+                        help="Skip the startup scan for changes made while the watcher was stopped")
     args = parser.parse_args()
 
-    obs = start_watcher(args.watch)
+    obs = start_watcher(args.watch, debounce_seconds=args.debounce, max_batch=args.batch_size,
+                        catch_up=not args.no_catch_up)
     try:
         while obs.is_alive():
             time.sleep(1)
@@ -1282,7 +1282,7 @@ start_rag() {
     fi
 
     # Start RAG server
-    nohup python3 "$rag_server" --port "$RAG_PORT" \
+    nohup python3 "$rag_server" --port "$RAG_PORT" --warmup \
         > "$LOG_DIR/rag.log" 2>&1 &
 
     local pid=$!
@@ -1307,8 +1307,8 @@ start_rag() {
             return 0  # Not critical
         fi
 
-        # Check health
-        if curl -s -m 2 http://localhost:$RAG_PORT/health &> /dev/null; then
+        # Check readiness (model warmed up, not just the port open)
+        if curl -sf -m 2 http://localhost:$RAG_PORT/ready &> /dev/null; then
             echo ""
             log_success "RAG server started successfully (PID: $pid) in ${waited}s"
             return 0
@@ -0,0 +1,76 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from scripts.rag.chunker import chunk_text
+
+
+def _python_source(functions: int = 30) -> str:
+    blocks = []
+    for i in range(functions):
+        body = "\n".join(f"    value_{j} = compute({i}, {j})" for j in range(6))
+        blocks.append(f"def function_{i}(arg):\n{body}\n    return value_0\n")
+    return "\n\n".join(blocks)
+
+
+def test_short_text_is_one_chunk():
+    assert chunk_text("def a(): pass", "a.py") == [{"content": "def a(): pass", "start_line": 1, "end_line": 1}]
+
+
+def test_empty_text_has_no_chunks():
+    assert chunk_text("", "a.py") == []
+    assert chunk_text("\n  \n", "a.py") == []
+
+
+def test_whole_file_is_covered_within_size_limit():
+    source = _python_source()
+    chunks = chunk_text(source, "mod.py", max_chars=600)
+    assert len(chunks) > 3
+    assert all(len(c["content"]) <= 600 for c in chunks)
+    assert chunks[0]["start_line"] == 1
+    assert chunks[-1]["end_line"] == source.count("\n") + 1
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert nxt["start_line"] <= prev["end_line"] + 1  # no gaps
+
+
+def test_python_chunks_start_near_definitions():
+    chunks = chunk_text(_python_source(), "mod.py", max_chars=600, overlap_lines=0)
+    assert all(c["content"].startswith("def ") for c in chunks)
+
+
+def test_overlap_repeats_previous_lines():
+    chunks = chunk_text(_python_source(), "mod.py", max_chars=600, overlap_lines=3)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        assert nxt["start_line"] == prev["end_line"] - 2
+
+
+def test_overlap_is_bounded_in_characters():
+    # Lines of 250 chars: three of them would repeat half of every 1500-char chunk
+    text = "\n".join(f"{i:04d}" + "y" * 246 for i in range(40))
+    chunks = chunk_text(text, "data.txt", max_chars=1500, overlap_lines=3)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        repeated = prev["end_line"] - nxt["start_line"] + 1
+        assert repeated * 251 <= 1500 // 5
+        assert nxt["start_line"] - prev["start_line"] >= (prev["end_line"] - prev["start_line"] + 1) / 2
+
+
+def test_short_chunks_still_advance_by_half():
+    text = "\n".join(["a = 1"] * 6 + ["b" * 90] + ["c = 3"] * 6)
+    lines = text.split("\n")
+    chunks = chunk_text(text, "x.py", max_chars=100, overlap_lines=3)
+    for prev, nxt in zip(chunks, chunks[1:]):
+        shared = "\n".join(lines[nxt["start_line"] - 1:prev["end_line"]])
+        assert len(shared) <= len(prev["content"]) // 2
+
+
+def test_markdown_splits_at_headings():
+    text = "\n\n".join(f"## Section {i}\n" + "\n".join(["text " * 10] * 5) for i in range(10))
+    chunks = chunk_text(text, "doc.md", max_chars=800, overlap_lines=0)
+    assert all(c["content"].startswith("## Section") for c in chunks)
+
+
+def test_long_lines_are_hard_wrapped():
+    chunks = chunk_text("x" * 4000, "blob.js", max_chars=1500)
+    assert [len(c["content"]) for c in chunks] == [1500, 1500, 1000]
+    assert all(c["start_line"] == c["end_line"] == 1 for c in chunks)
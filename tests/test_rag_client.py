@@ -44,7 +44,7 @@ def test_search_sends_project():
     c = RagClient(project="test-proj", base_url="http://localhost:9999")
     mock_response = MagicMock()
     mock_response.json.return_value = {"results": {"documents": [[]]}}
-    with patch("requests.post", return_value=mock_response) as mock_post:
+    with patch("requests.Session.post", return_value=mock_response) as mock_post:
         c.search("auth logic")
         call_kwargs = mock_post.call_args
         body = call_kwargs[1]["json"] if call_kwargs[1] else call_kwargs[0][1]
@@ -57,7 +57,7 @@ def test_search_with_filter():
     c = RagClient(project="proj", base_url="http://localhost:9999")
     mock_response = MagicMock()
     mock_response.json.return_value = {"results": {}}
-    with patch("requests.post", return_value=mock_response) as mock_post:
+    with patch("requests.Session.post", return_value=mock_response) as mock_post:
         c.search("tickets", filter={"type": "ticket"})
         body = mock_post.call_args[1]["json"]
         assert body["filter"] == {"type": "ticket"}
@@ -70,7 +70,7 @@ def test_upsert_file_reads_and_posts(tmp_path):
     c = RagClient(project="proj", base_url="http://localhost:9999")
     mock_response = MagicMock()
     mock_response.json.return_value = {"indexed": 1}
-    with patch("requests.post", return_value=mock_response) as mock_post:
+    with patch("requests.Session.post", return_value=mock_response) as mock_post:
         with patch("os.getcwd", return_value=str(tmp_path)):
             result = c.upsert_file(str(src))
         body = mock_post.call_args[1]["json"]
@@ -78,3 +78,513 @@ def test_upsert_file_reads_and_posts(tmp_path):
         assert len(body["documents"]) == 1
         assert "login" in body["documents"][0]
         assert body["ids"][0].startswith("proj::")
+
+
+def test_search_batch_posts_queries():
+    from scripts.rag.client import RagClient
+    c = RagClient(project="proj", base_url="http://localhost:9999")
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"results": {"a": {}, "b": {}}}
+    with patch("requests.Session.post", return_value=mock_response) as mock_post:
+        results = c.search_batch(["a", {"query": "b", "n_results": 2}], n=3)
+        assert mock_post.call_args[0][0].endswith("/search/batch")
+        body = mock_post.call_args[1]["json"]
+        assert body["project"] == "proj"
+        assert body["n_results"] == 3
+        assert len(body["queries"]) == 2
+    assert set(results) == {"a", "b"}
+
+
+def test_search_with_hybrid_mode():
+    from scripts.rag.client import RagClient
+    c = RagClient(project="proj", base_url="http://localhost:9999")
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"results": {}}
+    with patch("requests.Session.post", return_value=mock_response) as mock_post:
+        c.search("ERR_AUTH_401", mode="hybrid")
+        assert mock_post.call_args[1]["json"]["mode"] == "hybrid"
+        c.search("auth")
+        assert "mode" not in mock_post.call_args[1]["json"]
+
+
+def test_search_sends_shaping_options():
+    from scripts.rag.client import RagClient
+    c = RagClient(project="proj", base_url="http://localhost:9999")
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"results": {}}
+    with patch("requests.Session.post", return_value=mock_response) as mock_post:
+        c.search("auth", max_chars=300, include=["documents", "metadatas"], snippet=True)
+        payload = mock_post.call_args[1]["json"]
+        assert payload["max_chars"] == 300
+        assert payload["include"] == ["documents", "metadatas"]
+        assert payload["snippet"] is True
+        c.search("auth")
+        assert not {"max_chars", "include", "snippet"} & set(mock_post.call_args[1]["json"])
+
+
+def test_search_sends_ranking_options():
+    from scripts.rag.client import RagClient
+    c = RagClient(project="proj", base_url="http://localhost:9999")
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"results": {}}
+    with patch("requests.Session.post", return_value=mock_response) as mock_post:
+        c.search_batch(["a", "b"], min_score=0.3, diversify=True, max_per_file=2)
+        payload = mock_post.call_args[1]["json"]
+        assert payload["min_score"] == 0.3
+        assert payload["diversify"] is True
+        assert payload["max_per_file"] == 2
+
+
+def test_sync_posts_absolute_repo_path(tmp_path):
+    from scripts.rag.client import RagClient
+    c = RagClient(project="proj", base_url="http://localhost:9999")
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"revision": "abc"}
+    with patch("requests.Session.post", return_value=mock_response) as mock_post:
+        assert c.sync(str(tmp_path), revision="main") == {"revision": "abc"}
+        assert mock_post.call_args[0][0] == "http://localhost:9999/projects/proj/sync"
+        payload = mock_post.call_args[1]["json"]
+        assert payload == {"repo_path": str(tmp_path.resolve()), "revision": "main", "full": False}
+
+
+def test_export_and_import_snapshot(tmp_path):
+    from scripts.rag.client import RagClient
+    c = RagClient(project="proj", base_url="http://localhost:9999")
+    download = MagicMock()
+    download.iter_content.return_value = [b"RAGSNAP1\n", b"{}"]
+    download.__enter__.return_value = download
+    target = tmp_path / "proj.ragsnap"
+    with patch("requests.Session.get", return_value=download):
+        assert c.export_snapshot(str(target)) == 11
+    assert target.read_bytes() == b"RAGSNAP1\n{}"
+
+    upload = MagicMock()
+    upload.json.return_value = {"imported": 0}
+    with patch("requests.Session.post", return_value=upload) as mock_post:
+        assert c.import_snapshot(str(target), mode="merge") == {"imported": 0}
+        assert mock_post.call_args[0][0] == "http://localhost:9999/projects/proj/import"
+        assert mock_post.call_args[1]["params"] == {"mode": "merge"}
+
+
+def test_delete_files_sends_relative_paths(tmp_path):
+    from scripts.rag.client import RagClient
+    c = RagClient(project="proj", base_url="http://localhost:9999")
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"removed": 1}
+    with patch("os.getcwd", return_value=str(tmp_path)), \
+            patch("requests.Session.delete", return_value=mock_response) as mock_delete:
+        assert c.delete_file(str(tmp_path / "src" / "a.py")) == {"removed": 1}
+        assert mock_delete.call_args[0][0] == "http://localhost:9999/projects/proj/files"
+        assert mock_delete.call_args[1]["json"] == {"files": [os.path.join("src", "a.py")]}
+
+
+def test_index_files_sends_all_chunks_in_bounded_batches(tmp_path):
+    src = tmp_path / "big.py"
+    src.write_text("\n\n".join(f"def f{i}():\n    return {'x' * 200}" for i in range(60)))
+    from scripts.rag.client import RagClient
+    c = RagClient(project="proj", base_url="http://localhost:9999")
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"indexed": 4, "skipped_unchanged": 0, "pruned": 0}
+    with patch("requests.Session.post", return_value=mock_response) as mock_post, \
+            patch("os.getcwd", return_value=str(tmp_path)):
+        result = c.index_files([str(src)], batch_size=4)
+    bodies = [call[1]["json"] for call in mock_post.call_args_list]
+    assert all(len(b["documents"]) <= 4 for b in bodies)
+    ids = [i for b in bodies for i in b["ids"]]
+    metas = [m for b in bodies for m in b["metadatas"]]
+    assert ids == [f"proj::big.py::{n}" for n in range(len(ids))]
+    assert all(m["chunks"] == len(ids) and m["file"] == "big.py" for m in metas)
+    assert "f59" in bodies[-1]["documents"][-1]  # nothing truncated
+    assert result["indexed"] == 4 * len(bodies)
+
+
+def test_index_files_removes_emptied_files(tmp_path):
+    (tmp_path / "empty.py").write_text("")
+    from scripts.rag.client import RagClient
+    c = RagClient(project="proj", base_url="http://localhost:9999")
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"removed": 3}
+    with patch("requests.Session.post") as mock_post, \
+            patch("requests.Session.delete", return_value=mock_response) as mock_delete, \
+            patch("os.getcwd", return_value=str(tmp_path)):
+        assert c.index_files([str(tmp_path / "empty.py")])["pruned"] == 3
+    mock_post.assert_not_called()
+    assert mock_delete.call_args[1]["json"] == {"files": ["empty.py"]}
+
+
+def _status(code: int, headers: dict = None):
+    response = MagicMock()
+    response.status_code = code
+    response.headers = headers or {}
+    response.json.return_value = {"results": {}}
+    return response
+
+
+def test_requests_share_one_session_with_timeouts():
+    from scripts.rag.client import RagClient
+    a = RagClient(project="a", base_url="http://localhost:9001", connect_timeout=1, read_timeout=5)
+    b = RagClient(project="b", base_url="http://localhost:9001")
+    assert a.session is b.session and a.breaker is b.breaker
+    with patch("requests.Session.post", return_value=_status(200)) as mock_post:
+        a.search("q")
+    assert mock_post.call_args[1]["timeout"] == (1, 5)
+
+
+def test_idempotent_calls_retry_connection_errors_and_503():
+    import requests
+    from scripts.rag.client import RagClient
+    c = RagClient(project="p", base_url="http://localhost:9002", max_retries=2)
+    side_effect = [requests.exceptions.ConnectionError("down"), _status(503), _status(200)]
+    with patch("requests.Session.post", side_effect=side_effect) as mock_post, \
+            patch("scripts.rag.client.time.sleep") as mock_sleep:
+        c.search("q")
+    assert mock_post.call_count == 3
+    assert mock_sleep.call_count == 2
+
+
+def test_retries_honour_retry_after_and_give_up():
+    from scripts.rag.client import RagClient
+    c = RagClient(project="p", base_url="http://localhost:9003", max_retries=1)
+    with patch("requests.Session.get", return_value=_status(429, {"Retry-After": "2"})) as mock_get, \
+            patch("scripts.rag.client.time.sleep") as mock_sleep:
+        c.stats()  # last 429 is handed back to the caller
+    assert mock_get.call_count == 2
+    mock_sleep.assert_called_once_with(2.0)
+
+
+def test_sync_is_not_retried(tmp_path):
+    import requests
+    from scripts.rag.client import RagClient, RagUnavailableError
+    c = RagClient(project="p", base_url="http://localhost:9004", max_retries=3)
+    with patch("requests.Session.post", side_effect=requests.exceptions.Timeout("slow")) as mock_post:
+        with pytest.raises(RagUnavailableError):
+            c.sync(str(tmp_path))
+    assert mock_post.call_count == 1
+
+
+def test_circuit_breaker_fails_fast_then_recovers():
+    import requests
+    from scripts.rag.client import BREAKER_FAILURES, RagClient, RagUnavailableError
+    c = RagClient(project="p", base_url="http://localhost:9005", max_retries=0)
+    with patch("requests.Session.post", side_effect=requests.exceptions.ConnectionError("down")) as mock_post:
+        for _ in range(BREAKER_FAILURES):
+            with pytest.raises(RagUnavailableError):
+                c.search("q")
+        with pytest.raises(RagUnavailableError, match="circuit open"):
+            c.search("q")
+    assert mock_post.call_count == BREAKER_FAILURES
+    c.breaker._opened_at -= c.breaker.reset_seconds  # reset window elapsed: one trial call
+    with patch("requests.Session.post", return_value=_status(200)):
+        c.search("q")
+    assert not c.breaker.is_open
+
+
+def _run_with_server(handlers: dict, scenario):
+    """Serve aiohttp handlers on a free local port and run scenario(base_url)."""
+    import asyncio
+    web = pytest.importorskip("aiohttp.web")
+    from aiohttp.test_utils import TestServer
+
+    async def main():
+        app = web.Application()
+        for (method, path), handler in handlers.items():
+            app.router.add_route(method, path, handler)
+        async with TestServer(app) as server:
+            return await scenario(str(server.make_url("")).rstrip("/"))
+
+    return asyncio.run(main())
+
+
+def test_async_search_many_runs_concurrently_within_pool_limit():
+    import asyncio
+    from aiohttp import web
+    from scripts.rag.client import AsyncRagClient
+    inflight = {"now": 0, "max": 0}
+
+    async def search(request):
+        body = await request.json()
+        inflight["now"] += 1
+        inflight["max"] = max(inflight["max"], inflight["now"])
+        await asyncio.sleep(0.2)
+        inflight["now"] -= 1
+        return web.json_response({"results": {"query": body["query"], "n": body["n_results"]}})
+
+    async def scenario(base_url):
+        async with AsyncRagClient(project="p", base_url=base_url, max_connections=8) as rag:
+            return await rag.search_many([f"q{i}" for i in range(16)] + [{"query": "last", "n": 2}], n=3)
+
+    results = _run_with_server({("POST", "/search"): search}, scenario)
+    assert [r["query"] for r in results] == [f"q{i}" for i in range(16)] + ["last"]
+    assert results[0]["n"] == 3 and results[-1]["n"] == 2
+    assert inflight["max"] == 8
+
+
+def test_async_index_many_posts_batches_and_prunes_empty_files(tmp_path):
+    from aiohttp import web
+    from scripts.rag.client import AsyncRagClient
+    (tmp_path / "a.py").write_text("\n\n".join(f"def f{i}():\n    return {'x' * 200}" for i in range(20)))
+    (tmp_path / "empty.py").write_text("")
+    bodies, deleted = [], []
+
+    async def index(request):
+        body = await request.json()
+        bodies.append(body)
+        return web.json_response({"indexed": len(body["ids"]), "skipped_unchanged": 0, "pruned": 0})
+
+    async def delete(request):
+        deleted.extend((await request.json())["files"])
+        return web.json_response({"removed": 2})
+
+    async def scenario(base_url):
+        async with AsyncRagClient(project="p", base_url=base_url) as rag:
+            return await rag.index_many([str(tmp_path / "a.py"), str(tmp_path / "empty.py")], batch_size=2)
+
+    with patch("os.getcwd", return_value=str(tmp_path)):
+        totals = _run_with_server({("POST", "/index"): index, ("DELETE", "/projects/p/files"): delete}, scenario)
+    ids = sorted((i for b in bodies for i in b["ids"]), key=lambda i: int(i.rsplit("::", 1)[1]))
+    assert all(len(b["ids"]) <= 2 for b in bodies)
+    assert ids == [f"p::a.py::{n}" for n in range(len(ids))]
+    assert totals["indexed"] == len(ids) and totals["pruned"] == 2
+    assert deleted == ["empty.py"]
+
+
+def test_async_client_raises_unavailable_when_server_down():
+    import asyncio
+    import socket
+    pytest.importorskip("aiohttp")
+    from scripts.rag.client import AsyncRagClient, RagUnavailableError
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]  # closed again: nothing listens here
+
+    async def scenario():
+        async with AsyncRagClient(project="p", base_url=f"http://127.0.0.1:{port}", max_retries=0) as rag:
+            await rag.search("q")
+
+    with pytest.raises(RagUnavailableError):
+        asyncio.run(scenario())
+
+
+def test_index_files_reads_in_parallel_and_reports_progress(tmp_path):
+    paths = []
+    for i in range(12):
+        path = tmp_path / f"m{i}.py"
+        path.write_text(f"def f{i}():\n    return {i}\n")
+        paths.append(str(path))
+    paths.append(str(tmp_path / "missing.py"))
+    from scripts.rag.client import RagClient
+    c = RagClient(project="proj", base_url="http://localhost:9999")
+    mock_response = MagicMock()
+    mock_response.json.return_value = {"indexed": 5, "skipped_unchanged": 0, "pruned": 0}
+    progress = []
+    with patch("requests.Session.post", return_value=mock_response) as mock_post, \
+            patch("os.getcwd", return_value=str(tmp_path)):
+        c.index_files(paths, batch_size=5, workers=4, progress=lambda done, total: progress.append((done, total)))
+    ids = [i for call in mock_post.call_args_list for i in call[1]["json"]["ids"]]
+    assert ids == [f"proj::m{i}.py::0" for i in range(12)]  # input order kept
+    assert [len(call[1]["json"]["ids"]) for call in mock_post.call_args_list] == [5, 5, 2]
+    assert [done for done, _ in progress] == sorted(done for done, _ in progress)
+    assert progress[-1] == (13, 13)
+
+
+def test_index_files_streams_batches_before_reading_everything(tmp_path):
+    paths = []
+    for i in range(40):
+        path = tmp_path / f"m{i}.py"
+        path.write_text(f"x = {i}\n")
+        paths.append(str(path))
+    from scripts.rag import client as rc
+    c = rc.RagClient(project="proj", base_url="http://localhost:9999")
+    read, read_at_first_send = [], []
+    real = rc._file_documents
+
+    def tracking(*args):
+        read.append(args[1])
+        return real(*args)
+
+    def post(*args, **kwargs):
+        read_at_first_send.append(len(read))
+        return MagicMock()
+
+    with patch.object(rc, "_file_documents", side_effect=tracking), \
+            patch("requests.Session.post", side_effect=post):
+        c.index_files(paths, batch_size=2, workers=2)
+    assert read_at_first_send[0] < len(paths)  # bounded read-ahead, not the whole tree
+
+
+def test_tree_files_skips_ignored_dirs_and_unknown_extensions(tmp_path):
+    from scripts.rag.client import tree_files
+    (tmp_path / "src").mkdir()
+    (tmp_path / "src" / "a.py").write_text("a = 1")
+    (tmp_path / "src" / "notes.bin").write_text("")
+    (tmp_path / "node_modules").mkdir()
+    (tmp_path / "node_modules" / "dep.js").write_text("")
+    assert tree_files(str(tmp_path)) == [str(tmp_path / "src" / "a.py")]
+
+
+def _json_response(body: dict, code: int = 200):
+    response = MagicMock()
+    response.status_code = code
+    response.headers = {}
+    response.json.return_value = body
+    return response
+
+
+def test_search_cache_hits_until_generation_changes(tmp_path):
+    from scripts.rag import client as rc
+    c = rc.RagClient(project="p", base_url="http://localhost:9006", cache=str(tmp_path / "cache.sqlite"))
+    stats = _json_response({"epoch": "e1", "generation": 3})
+    hit = _json_response({"epoch": "e1", "generation": 3, "results": {"ids": [["a"]]}})
+    with patch("requests.Session.get", return_value=stats) as mock_get, \
+            patch("requests.Session.post", return_value=hit) as mock_post:
+        assert c.search("auth") == {"ids": [["a"]]}
+        assert c.search("auth") == {"ids": [["a"]]}  # served locally
+        assert c.search("auth", n=2) == {"ids": [["a"]]}  # different request: miss
+    assert mock_post.call_count == 2 and mock_get.call_count == 1
+    assert c.cache.stats()["hits"] == 1
+
+    c._index_token_at -= rc.CLIENT_CACHE_CHECK_SECONDS  # recheck: the index moved on
+    newer = _json_response({"epoch": "e1", "generation": 4, "results": {"ids": [["b"]]}})
+    with patch("requests.Session.get", return_value=_json_response({"epoch": "e1", "generation": 4})), \
+            patch("requests.Session.post", return_value=newer) as mock_post:
+        assert c.search("auth") == {"ids": [["b"]]}
+    assert mock_post.call_count == 1
+
+
+def test_search_cache_skips_results_from_another_epoch(tmp_path):
+    from scripts.rag.client import RagClient
+    c = RagClient(project="p", base_url="http://localhost:9009", cache=str(tmp_path / "cache.sqlite"))
+    other = _json_response({"epoch": "e2", "generation": 3, "results": {"ids": [["x"]]}})
+    with patch("requests.Session.get", return_value=_json_response({"epoch": "e1", "generation": 3})), \
+            patch("requests.Session.post", return_value=other) as mock_post:
+        c.search("q")
+        c.search("q")
+    assert mock_post.call_count == 2
+    assert c.cache.stats()["entries"] == 0
+
+
+def test_search_cache_rechecks_generation_after_own_writes(tmp_path):
+    from scripts.rag.client import RagClient
+    c = RagClient(project="p", base_url="http://localhost:9007", cache=str(tmp_path / "cache.sqlite"))
+    with patch("requests.Session.get", return_value=_json_response({"epoch": "e1", "generation": 1})) as mock_get, \
+            patch("requests.Session.post", return_value=_json_response({"epoch": "e1", "generation": 1, "results": {}})), \
+            patch("requests.Session.delete", return_value=_json_response({"removed": 1})):
+        c.search("q")
+        c.delete_file("a.py")
+        c.search("q")
+    assert mock_get.call_count == 2
+
+
+def test_search_cache_serves_last_known_results_when_server_down(tmp_path):
+    import requests
+    from scripts.rag.client import RagClient, RagUnavailableError
+    c = RagClient(project="p", base_url="http://localhost:9008", max_retries=0, cache=str(tmp_path / "cache.sqlite"))
+    with patch("requests.Session.get", return_value=_json_response({"epoch": "e1", "generation": 1})), \
+            patch("requests.Session.post", return_value=_json_response({"epoch": "e1", "generation": 1, "results": {"ids": [["a"]]}})):
+        c.search("q")
+    c._index_token = None
+    with patch("requests.Session.get", side_effect=requests.exceptions.ConnectionError("down")):
+        assert c.search("q") == {"ids": [["a"]]}
+        assert c.degraded
+        with pytest.raises(RagUnavailableError):
+            c.search("never cached")
+
+
+def test_search_cache_evicts_least_recently_used(tmp_path):
+    from scripts.rag.client import SearchCache
+    cache = SearchCache(str(tmp_path / "cache.sqlite"), max_bytes=1000)
+    for i in range(10):
+        cache.put(f"r{i}", "e:1", {"documents": [["x" * 190]]})
+        cache.get("r0", "e:1")  # keep r0 hot
+    stats = cache.stats()
+    assert stats["bytes"] <= 1000
+    assert cache.get("r0", "e:1") is not None
+    assert cache.get("r1", "e:1") is None
+    assert cache.get("r9", "e:1") is not None
+
+
+def test_index_files_raises_when_server_rejects_a_batch(tmp_path):
+    import requests
+    (tmp_path / "a.py").write_text("a = 1\n")
+    from scripts.rag.client import RagClient
+    c = RagClient(project="proj", base_url="http://localhost:9999")
+    rejected = _json_response({"error": "boom"}, code=500)
+    rejected.raise_for_status.side_effect = requests.exceptions.HTTPError("500 Server Error")
+    with patch("requests.Session.post", return_value=rejected), patch("os.getcwd", return_value=str(tmp_path)):
+        with pytest.raises(requests.exceptions.HTTPError):
+            c.index_files([str(tmp_path / "a.py")])
+
+
+def test_async_index_many_raises_on_error_responses(tmp_path):
+    import aiohttp
+    from aiohttp import web
+    from scripts.rag.client import AsyncRagClient
+    (tmp_path / "a.py").write_text("def f(): pass")
+    (tmp_path / "empty.py").write_text("")
+
+    async def rejected(request):
+        return web.json_response({"error": "documents must be a list"}, status=400)
+
+    async def ok(request):
+        return web.json_response({"indexed": 1, "skipped_unchanged": 0, "pruned": 0})
+
+    async def failed(request):
+        return web.json_response({"error": "boom"}, status=500)
+
+    def scenario(path):
+        async def run(base_url):
+            async with AsyncRagClient(project="p", base_url=base_url, max_retries=0) as rag:
+                return await rag.index_many([str(tmp_path / path)])
+        return run
+
+    with patch("os.getcwd", return_value=str(tmp_path)):
+        with pytest.raises(aiohttp.ClientResponseError) as e:
+            _run_with_server({("POST", "/index"): rejected}, scenario("a.py"))
+        assert e.value.status == 400
+        with pytest.raises(aiohttp.ClientResponseError) as e:
+            _run_with_server({("POST", "/index"): ok, ("DELETE", "/projects/p/files"): failed}, scenario("empty.py"))
+        assert e.value.status == 500
+
+
+def test_async_index_many_reads_off_the_event_loop_and_streams(tmp_path):
+    import asyncio
+    import time
+    from aiohttp import web
+    from scripts.rag import client as rc
+    paths = []
+    for i in range(8):
+        (tmp_path / f"m{i}.py").write_text(f"x = {i}\n")
+        paths.append(str(tmp_path / f"m{i}.py"))
+    read, read_at_first_post = [], []
+    real = rc._file_documents
+
+    def slow(*args):
+        time.sleep(0.05)  # slow disk
+        read.append(args[1])
+        return real(*args)
+
+    async def index(request):
+        body = await request.json()
+        read_at_first_post.append(len(read))
+        return web.json_response({"indexed": len(body["ids"]), "skipped_unchanged": 0, "pruned": 0})
+
+    async def scenario(base_url):
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                await asyncio.sleep(0.01)
+                ticks += 1
+
+        tick_task = asyncio.ensure_future(ticker())
+        async with rc.AsyncRagClient(project="p", base_url=base_url, max_connections=2) as rag:
+            totals = await rag.index_many(paths, batch_size=1, workers=1)
+        tick_task.cancel()
+        return totals, ticks
+
+    with patch.object(rc, "_file_documents", side_effect=slow), patch("os.getcwd", return_value=str(tmp_path)):
+        totals, ticks = _run_with_server({("POST", "/index"): index}, scenario)
+    assert totals["indexed"] == 8
+    assert ticks >= 10  # the loop kept running while files were read
+    assert read_at_first_post[0] < len(paths)
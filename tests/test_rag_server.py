@@ -1,6 +1,7 @@
 import pytest
 import sys
 import os
+from contextlib import contextmanager
 
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "scripts", "rag"))
 import server
@@ -13,6 +14,16 @@ def client(tmp_path, monkeypatch):
     monkeypatch.setattr(server, "BASE_PATH", str(tmp_path))
     server._clients.clear()
     server._collections.clear()
+    server._retired_clients.clear()
+    server._embedding_cache.clear()
+    server._result_cache.clear()
+    server._type_counts.clear()
+    server._lexical_indexes.clear()
+    server._lexical_builds.clear()
+    server._seen_generations.clear()
+    server._request_counts.clear()
+    server._request_latency.clear()
+    server._stage_latency.clear()
     with server.app.test_client() as c:
         yield c
 
@@ -124,6 +135,7 @@ def test_project_stats(client):
     data = r.get_json()
     assert data["name"] == "stat-proj"
     assert data["count"] == 1
+    assert data["generation"] >= 1 and data["epoch"]
 
 
 def test_ui_endpoint(client):
@@ -153,3 +165,1115 @@ def test_search_filter_by_type(client):
     # Should return code doc, not the ticket
     assert len(docs) >= 1
     assert all("def login" in d or "pass" in d for d in docs)
+
+
+def _index_mixed(client, project):
+    client.post("/index", json={
+        "project": project,
+        "documents": ["def login(): pass", "def checkout(): pass", "## BUG-001 login ticket"],
+        "ids": [f"{project}::auth.py::0", f"{project}::shop.py::0", f"{project}::BUG-001.md::0"],
+        "metadatas": [{"type": "code"}, {"type": "code"}, {"type": "ticket"}]
+    })
+
+
+def test_search_batch_keyed_by_query(client):
+    _index_mixed(client, "batch")
+    r = client.post("/search/batch", json={
+        "project": "batch",
+        "queries": [
+            "login",
+            {"query": "checkout", "n_results": 1},
+            {"query": "login", "id": "tickets", "filter": {"type": "ticket"}},
+        ],
+    })
+    assert r.status_code == 200
+    data = r.get_json()
+    assert data["project"] == "batch"
+    results = data["results"]
+    assert set(results) == {"login", "checkout", "tickets"}
+    assert len(results["login"]["documents"][0]) == 3
+    assert len(results["checkout"]["documents"][0]) == 1
+    assert results["tickets"]["documents"][0] == ["## BUG-001 login ticket"]
+
+
+def test_search_batch_matches_single_search(client):
+    _index_mixed(client, "batch-eq")
+    single = client.post("/search", json={"project": "batch-eq", "query": "checkout", "n_results": 2})
+    batch = client.post("/search/batch", json={"project": "batch-eq", "queries": ["checkout"], "n_results": 2})
+    assert batch.get_json()["results"]["checkout"]["ids"] == single.get_json()["results"]["ids"]
+
+
+def test_search_batch_empty_project(client):
+    r = client.post("/search/batch", json={"project": "empty", "queries": ["a", "b"]})
+    assert r.status_code == 200
+    assert r.get_json()["results"]["a"]["documents"] == [[]]
+
+
+def test_search_batch_requires_queries(client):
+    r = client.post("/search/batch", json={"project": "alpha", "queries": []})
+    assert r.status_code == 400
+    r = client.post("/search/batch", json={"project": "alpha", "queries": [{"n_results": 3}]})
+    assert r.status_code == 400
+
+
+def test_lru_cache_evicts_and_expires():
+    cache = server._LRUCache(max_size=2, ttl=60)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1  # "a" is now most recent
+    cache.put("c", 3)
+    assert cache.get("b") is None
+    cache.put("old", 4, stored_at=0)
+    assert cache.get("old") is None
+    stats = cache.stats()
+    assert stats["size"] <= 2
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+
+
+def test_repeated_query_hits_embedding_cache(client):
+    client.post("/index", json={"project": "cache", "documents": ["def login(): pass"],
+                                "ids": ["cache::a::0"], "metadatas": [{"type": "code"}]})
+    client.post("/search", json={"project": "cache", "query": "login  flow", "n_results": 1})
+    client.post("/search", json={"project": "cache", "query": " login flow ", "n_results": 2})
+    stats = client.get("/stats", headers={"X-Project": "cache"}).get_json()["embedding_cache"]
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_embedding_cache_persists_to_disk(tmp_path, monkeypatch):
+    path = str(tmp_path / "embeddings.json")
+    monkeypatch.setattr(server, "_embedding_cache", server._LRUCache(10, 0))
+    monkeypatch.setattr(server, "EMBED_CACHE_PATH", path)
+    server._embedding_cache.put((server._embedding_model_id(), "auth middleware"), [0.1, 0.2])
+    server._save_embedding_cache()
+
+    server._configure_embedding_cache(10, 0, path)
+    assert server._embedding_cache.get((server._embedding_model_id(), "auth middleware")) == [0.1, 0.2]
+
+
+def test_embedding_cache_saves_off_the_request_path(tmp_path, monkeypatch):
+    import threading
+    path = tmp_path / "embeddings.json"
+    monkeypatch.setattr(server, "_embedding_cache", server._LRUCache(10, 0))
+    monkeypatch.setattr(server, "EMBED_CACHE_PATH", str(path))
+    monkeypatch.setattr(server, "_embedding_cache_saved_at", 0.0)
+    monkeypatch.setattr(server, "_encode", lambda texts: [[0.5] for _ in texts])
+    release = threading.Event()
+    dump = server.json.dump
+
+    def slow_dump(obj, f):
+        release.wait(5)
+        dump(obj, f)
+
+    monkeypatch.setattr(server.json, "dump", slow_dump)
+    assert server._embed_queries(["auth flow"]) == [[0.5]]  # returns while the write is blocked
+    assert not path.exists()
+    release.set()
+    server._save_embedding_cache()  # waits for the background save, then writes again
+    assert [e[0] for e in server.json.loads(path.read_text())["entries"]] == ["auth flow"]
+
+
+def test_embedding_cache_save_is_not_registered_at_configure(tmp_path, monkeypatch):
+    registered = []
+    monkeypatch.setattr(server.atexit, "register", registered.append)
+    monkeypatch.setattr(server, "_embedding_cache", server._embedding_cache)
+    monkeypatch.setattr(server, "EMBED_CACHE_PATH", server.EMBED_CACHE_PATH)
+    server._configure_embedding_cache(10, 0, str(tmp_path / "embeddings.json"))
+    assert registered == []  # a gunicorn master must not overwrite what its workers saved
+    server._embedding_cache.put((server._embedding_model_id(), "q"), [0.5])
+    server._save_embedding_cache()
+    assert [p.name for p in tmp_path.iterdir()] == ["embeddings.json"]
+
+
+def test_repeated_search_served_from_result_cache(client):
+    _index_mixed(client, "rcache")
+    body = {"project": "rcache", "query": "login", "n_results": 2}
+    first = client.post("/search", json=body).get_json()
+    second = client.post("/search", json=body).get_json()
+    assert "cached" not in first
+    assert second["cached"] is True
+    assert second["results"]["ids"] == first["results"]["ids"]
+    assert second["generation"] == first["generation"]
+    assert second["epoch"] == first["epoch"] == client.get("/projects/rcache/stats").get_json()["epoch"]
+
+
+def test_index_invalidates_result_cache(client):
+    body = {"project": "fresh", "query": "refund payment", "n_results": 5}
+    client.post("/index", json={"project": "fresh", "documents": ["def login(): pass"],
+                                "ids": ["fresh::a::0"], "metadatas": [{"type": "code"}]})
+    before = client.post("/search", json=body).get_json()
+    client.post("/index", json={"project": "fresh", "documents": ["def refund_payment(): pass"],
+                                "ids": ["fresh::b::0"], "metadatas": [{"type": "code"}]})
+    after = client.post("/search", json=body).get_json()
+    assert after["generation"] > before["generation"]
+    assert "cached" not in after
+    assert "fresh::b::0" in after["results"]["ids"][0]
+
+
+def test_delete_project_never_serves_stale_results(client):
+    body = {"project": "gone", "query": "login"}
+    client.post("/index", json={"project": "gone", "documents": ["def login(): pass"],
+                                "ids": ["gone::a::0"], "metadatas": [{"type": "code"}]})
+    assert client.post("/search", json=body).get_json()["results"]["ids"] == [["gone::a::0"]]
+    client.delete("/projects/gone")
+    after = client.post("/search", json=body).get_json()
+    assert after["results"]["ids"] == [[]]
+
+
+def test_writes_by_another_worker_invalidate_caches(client):
+    body = {"project": "shared", "query": "refund payment", "n_results": 5, "mode": "hybrid"}
+    client.post("/index", json={"project": "shared", "documents": ["def login(): pass"],
+                                "ids": ["shared::a::0"], "metadatas": [{"type": "code"}]})
+    before = client.post("/search", json=body).get_json()
+    assert "shared" in server._lexical_indexes
+    # Another worker process writes the collection and bumps the shared generation file
+    col = server._get_collection("shared")
+    doc = "def refund_payment(): pass"
+    col.upsert(ids=["shared::b::0"], documents=[doc], embeddings=server._embed_queries([doc]),
+               metadatas=[{"type": "code"}])
+    server._generation_path("shared").write_text(str(before["generation"] + 1))
+    after = client.post("/search", json=body).get_json()
+    assert after["generation"] == before["generation"] + 1
+    assert "cached" not in after
+    assert "shared::b::0" in after["results"]["ids"][0]
+    assert "shared::b::0" in server._lexical_indexes["shared"]._lengths  # rebuilt, not stale
+    assert client.get("/projects/shared/stats").get_json()["generation"] == after["generation"]
+
+
+def test_search_batch_uses_result_cache(client):
+    _index_mixed(client, "bcache")
+    client.post("/search", json={"project": "bcache", "query": "login", "n_results": 5})
+    r = client.post("/search/batch", json={"project": "bcache", "queries": ["login", "checkout"]})
+    assert set(r.get_json()["results"]) == {"login", "checkout"}
+    assert server._result_cache.stats()["hits"] == 1
+
+
+def test_admission_gate_queues_then_rejects():
+    gate = server._AdmissionGate(max_inflight=1, max_queue=0, queue_timeout=0.01)
+    assert gate.acquire()
+    assert not gate.acquire()
+    gate.release()
+    assert gate.acquire()
+    gate.release()
+    assert gate.stats()["rejected"] == 1
+
+
+def test_saturated_server_returns_429(client, monkeypatch):
+    gate = server._AdmissionGate(max_inflight=1, max_queue=0, queue_timeout=0.01)
+    monkeypatch.setattr(server, "_admission", gate)
+    assert gate.acquire()  # another request holds the only slot
+    r = client.post("/search", json={"project": "busy", "query": "login"})
+    assert r.status_code == 429
+    assert r.headers["Retry-After"] == "1"
+    assert client.get("/health").status_code == 200
+    gate.release()
+    r = client.post("/search", json={"project": "busy", "query": "login"})
+    assert r.status_code == 200
+    # the slot is handed back once the request finishes
+    assert gate.acquire()
+    gate.release()
+
+
+def test_histogram_cumulative_buckets():
+    h = server._Histogram([1, 10])
+    for v in (0.5, 3, 30):
+        h.observe(v)
+    snap = h.snapshot()
+    assert snap["count"] == 3
+    assert snap["buckets"] == {"1": 1, "10": 2, "+Inf": 3}
+
+
+def test_embedding_scheduler_coalesces_concurrent_requests():
+    import threading
+    calls = []
+
+    def fake_encode(texts):
+        calls.append(list(texts))
+        return [[float(len(t))] for t in texts]
+
+    sched = server._EmbeddingScheduler(fake_encode, max_batch=64, max_wait_ms=100)
+    results = {}
+
+    def worker(i):
+        results[i] = sched.submit(["x" * i, "y" * i])
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(1, 9)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert len(calls) < 8
+    for i in range(1, 9):
+        assert results[i] == [[float(i)], [float(i)]]
+    stats = sched.stats()
+    assert stats["batch_size"]["sum"] == 16
+    assert stats["queue_wait_ms"]["count"] == 8
+
+
+def test_embedding_scheduler_respects_max_batch_and_propagates_errors():
+    calls = []
+
+    def fake_encode(texts):
+        calls.append(len(texts))
+        if "boom" in texts:
+            raise ValueError("encode failed")
+        return [[0.0] for _ in texts]
+
+    sched = server._EmbeddingScheduler(fake_encode, max_batch=2, max_wait_ms=0)
+    assert len(sched.submit(["a", "b", "c"])) == 3  # oversized requests run alone
+    with pytest.raises(ValueError):
+        sched.submit(["boom"])
+    assert calls == [3, 1]
+
+
+def test_search_through_scheduler(client, monkeypatch):
+    sched = server._EmbeddingScheduler(server._encode_direct, max_batch=16, max_wait_ms=1)
+    monkeypatch.setattr(server, "_scheduler", sched)
+    _index_mixed(client, "sched")
+    r = client.post("/search", json={"project": "sched", "query": "login"})
+    assert r.status_code == 200
+    stats = client.get("/stats").get_json()["embedding_scheduler"]
+    assert stats["batch_size"]["count"] >= 2
+
+
+def _wait_for_job(client, job_id, timeout=10.0):
+    import time
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        job = client.get(f"/index/jobs/{job_id}").get_json()
+        if job["status"] in ("done", "failed"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError(f"job {job_id} did not finish: {job}")
+
+
+def test_index_job_streams_ndjson_in_chunks(client):
+    import json
+    lines = [json.dumps({"id": f"jobs::f{i}.py::0", "document": f"def handler_{i}(): pass",
+                         "metadata": {"type": "code", "file": f"f{i}.py"}}) for i in range(5)]
+    lines.insert(2, "{not json")
+    r = client.post("/index/jobs?project=jobs&chunk_size=2", data="\n".join(lines) + "\n",
+                    content_type="application/x-ndjson")
+    assert r.status_code == 202
+    job = r.get_json()
+    assert job["docs_total"] == 6
+    assert r.headers["Location"] == f"/index/jobs/{job['id']}"
+
+    job = _wait_for_job(client, job["id"])
+    assert job["status"] == "done"
+    assert job["docs_done"] == 6
+    assert job["docs_indexed"] == 5
+    assert job["error_count"] == 1
+    assert job["errors"][0]["lines"] == "3"
+    assert client.get("/projects/jobs/stats").get_json()["count"] == 5
+    assert any(j["id"] == job["id"] for j in client.get("/index/jobs").get_json()["jobs"])
+
+
+def test_index_job_requires_body(client):
+    r = client.post("/index/jobs?project=jobs", data="\n\n", content_type="application/x-ndjson")
+    assert r.status_code == 400
+
+
+def test_index_job_unknown_id(client):
+    assert client.get("/index/jobs/nope").status_code == 404
+
+
+def test_index_job_resumes_from_progress(client, tmp_path):
+    import json
+    jobs_dir = server._jobs_dir()
+    (jobs_dir / "resume1.ndjson").write_text("\n".join(
+        json.dumps({"id": f"r::{i}", "document": f"doc number {i}"}) for i in range(4)) + "\n")
+    server._save_job({
+        "id": "resume1", "project": "resumed", "status": "running", "chunk_size": 10,
+        "docs_total": 4, "docs_done": 2, "docs_indexed": 2, "docs_per_sec": 0.0,
+        "error_count": 0, "errors": [], "created_at": 0, "started_at": 0, "finished_at": None,
+    })
+    server._process_index_job("resume1")
+    job = server._load_job("resume1")
+    assert job["status"] == "done"
+    assert job["docs_indexed"] == 4
+    ids = server._get_collection("resumed").get()["ids"]
+    assert sorted(ids) == ["r::2", "r::3"]
+    assert not (jobs_dir / "resume1.ndjson").exists()
+
+
+def test_jobs_dir_not_listed_as_project(client):
+    server._jobs_dir()
+    names = [p["name"] for p in client.get("/projects").get_json()["projects"]]
+    assert ".jobs" not in names
+
+
+def test_index_skips_unchanged_documents(client):
+    doc = {"project": "dedup", "documents": ["def foo(): pass", "def bar(): pass"],
+           "ids": ["dedup::foo.py::0", "dedup::bar.py::0"],
+           "metadatas": [{"type": "code"}, {"type": "code"}]}
+    first = client.post("/index", json=doc).get_json()
+    assert first["indexed"] == 2
+    assert first["skipped_unchanged"] == 0
+
+    doc["documents"][1] = "def bar(): return 1"
+    second = client.post("/index", json=doc).get_json()
+    assert second["indexed"] == 1
+    assert second["skipped_unchanged"] == 1
+    assert second["generation"] > first["generation"]
+
+    third = client.post("/index", json=doc).get_json()
+    assert third["indexed"] == 0
+    assert third["skipped_unchanged"] == 2
+    assert third["generation"] == second["generation"]
+
+    stored = server._get_collection("dedup").get(ids=["dedup::bar.py::0"], include=["metadatas", "documents"])
+    assert stored["documents"] == ["def bar(): return 1"]
+    assert stored["metadatas"][0]["content_hash"] == server._content_hash("def bar(): return 1")
+
+
+def test_embedder_switch_reembeds_unchanged_documents(client, monkeypatch):
+    doc = {"project": "switch", "documents": ["def foo(): pass"], "ids": ["switch::foo.py::0"]}
+    assert client.post("/index", json=doc).get_json()["indexed"] == 1
+    assert client.post("/index", json=doc).get_json()["skipped_unchanged"] == 1
+    monkeypatch.setattr(server, "EMBED_BACKEND", "int8")
+    assert client.post("/index", json=doc).get_json()["indexed"] == 1
+
+
+def test_index_metadata_change_without_reembedding(client, monkeypatch):
+    body = {"project": "meta", "documents": ["## BUG-001"], "ids": ["meta::b::0"],
+            "metadatas": [{"type": "code"}]}
+    client.post("/index", json=body)
+    encoded = []
+    monkeypatch.setattr(server, "_encode", lambda texts: encoded.append(texts) or [])
+    body["metadatas"] = [{"type": "ticket"}]
+    r = client.post("/index", json=body).get_json()
+    assert r["indexed"] == 1
+    assert encoded == []
+    meta = server._get_collection("meta").get(ids=["meta::b::0"])["metadatas"][0]
+    assert meta["type"] == "ticket"
+
+
+def test_list_projects_uses_type_counters(client, monkeypatch):
+    _index_mixed(client, "counted")
+    # retype one code doc as a ticket and add a new doc
+    client.post("/index", json={"project": "counted", "documents": ["def checkout(): pass", "def pay(): pass"],
+                                "ids": ["counted::shop.py::0", "counted::pay.py::0"],
+                                "metadatas": [{"type": "ticket"}, {"type": "code"}]})
+
+    def no_scan(*a, **kw):
+        raise AssertionError("/projects must not scan collections")
+
+    monkeypatch.setattr(server, "_rebuild_counts", no_scan)
+    projects = {p["name"]: p for p in client.get("/projects").get_json()["projects"]}
+    assert projects["counted"]["count"] == 4
+    assert projects["counted"]["code_count"] == 2
+    assert projects["counted"]["ticket_count"] == 2
+
+
+def test_type_counters_rebuilt_lazily(client):
+    _index_mixed(client, "rebuilt")
+    server._counts_path("rebuilt").unlink()
+    server._type_counts.clear()
+    projects = {p["name"]: p for p in client.get("/projects").get_json()["projects"]}
+    assert projects["rebuilt"]["code_count"] == 2
+    assert projects["rebuilt"]["ticket_count"] == 1
+    assert server._counts_path("rebuilt").exists()
+
+
+def test_counts_rebuild_does_not_block_other_projects(client, monkeypatch):
+    import threading
+    client.post("/index", json={"project": "small", "documents": ["x"], "ids": ["small::a::0"],
+                                "metadatas": [{"type": "code"}]})
+    started, release = threading.Event(), threading.Event()
+
+    def slow_rebuild(project):
+        started.set()
+        release.wait(5)
+        return {"total": 0, "types": {}}
+
+    monkeypatch.setattr(server, "_rebuild_counts", slow_rebuild)
+    builder = threading.Thread(target=server._get_counts, args=("huge",))
+    builder.start()
+    assert started.wait(5)
+    reader = threading.Thread(target=server._adjust_counts, args=("small", ["code"], []))
+    reader.start()
+    reader.join(1)
+    assert not reader.is_alive()  # another project's counters are not stuck behind the rebuild
+    release.set()
+    builder.join(5)
+    assert server._get_counts("small")["total"] == 2
+
+
+def test_concurrent_index_of_one_new_id_counts_it_once(client, monkeypatch):
+    import json
+    import threading
+    import time
+    encode = server._encode
+
+    def slow_encode(docs):
+        time.sleep(0.2)  # every request passes the existing-ID check before any writes
+        return encode(docs)
+
+    monkeypatch.setattr(server, "_encode", slow_encode)
+    body = {"project": "race", "documents": ["def f(): pass"], "ids": ["race::a::0"],
+            "metadatas": [{"type": "code"}]}
+    threads = [threading.Thread(target=lambda: server.app.test_client().post("/index", json=body))
+               for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    assert server._get_counts("race") == {"total": 1, "types": {"code": 1}}
+    assert json.loads(server._counts_path("race").read_text())["total"] == 1
+
+
+def test_drifted_counters_are_rebuilt_not_clamped(client):
+    import json
+    _index_mixed(client, "drift")
+    server._counts_path("drift").write_text(json.dumps({"total": 0, "types": {"code": 0}}))
+    server._type_counts.clear()
+    assert server._delete_documents("drift", server._get_collection("drift"), {"type": "code"}) == 2
+    counts = server._get_counts("drift")
+    assert counts["total"] == server._get_collection("drift").count()
+    assert counts == {"total": 1, "types": {"ticket": 1}}
+
+
+def test_lru_projects_are_evicted(client, monkeypatch):
+    monkeypatch.setattr(server, "MAX_RESIDENT_PROJECTS", 2)
+    for name in ("p1", "p2", "p3"):
+        client.post("/index", json={"project": name, "documents": [f"def {name}(): pass"],
+                                    "ids": [f"{name}::a::0"], "metadatas": [{"type": "code"}]})
+    assert list(server._clients) == ["p2", "p3"]
+    health = client.get("/health").get_json()
+    assert health["resident_projects"] == 2
+    assert health["on_disk_projects"] == 3
+
+    # an evicted project reopens transparently with its data intact
+    r = client.post("/search", json={"project": "p1", "query": "p1"})
+    assert r.get_json()["results"]["ids"] == [["p1::a::0"]]
+    assert list(server._clients) == ["p3", "p1"]
+
+
+def test_deleting_an_evicted_project_closes_its_retired_client(client, monkeypatch):
+    monkeypatch.setattr(server, "MAX_RESIDENT_PROJECTS", 1)
+    for name in ("p", "q"):
+        client.post("/index", json={"project": name, "documents": [f"def {name}_old(): pass"],
+                                    "ids": [f"{name}::a::0"], "metadatas": [{"type": "code"}]})
+    assert [r[1] for r in server._retired_clients] == ["p"]
+    client.delete("/projects/p")
+    assert server._retired_clients == []
+    r = client.post("/index", json={"project": "p", "documents": ["def p_new(): pass"],
+                                    "ids": ["p::b::0"], "metadatas": [{"type": "code"}]})
+    assert r.status_code == 200
+    found = client.post("/search", json={"project": "p", "query": "p"}).get_json()["results"]["ids"]
+    assert found == [["p::b::0"]]
+
+
+def test_reopened_project_reclaims_its_retired_client(client, monkeypatch):
+    monkeypatch.setattr(server, "MAX_RESIDENT_PROJECTS", 1)
+    client.post("/projects/r1/init")
+    retired = server._clients["r1"]
+    client.post("/projects/r2/init")
+    client.post("/projects/r1/init")
+    assert server._clients["r1"] is retired
+    assert [r[1] for r in server._retired_clients] == ["r2"]
+
+
+def test_idle_projects_are_evicted(client, monkeypatch):
+    import time
+    monkeypatch.setattr(server, "PROJECT_IDLE_SECONDS", 0.05)
+    client.post("/projects/idle-a/init")
+    time.sleep(0.1)
+    client.post("/projects/idle-b/init")
+    assert "idle-a" not in server._clients
+    assert "idle-b" in server._clients
+
+
+def test_lexical_build_does_not_block_other_projects_and_replays_writes(client):
+    import threading
+    started, release = threading.Event(), threading.Event()
+
+    class SlowCollection:
+        def get(self, include, limit, offset):
+            started.set()
+            release.wait(5)
+            return {"ids": ["big::d0", "big::d1"], "documents": ["login handler", "checkout flow"]}
+
+    builder = threading.Thread(target=server._get_lexical_index, args=("big", SlowCollection()))
+    builder.start()
+    assert started.wait(5)
+    server._lexical_indexes["other"] = server._LexicalIndex()
+    writer = threading.Thread(target=server._update_lexical_index, args=("other", ["other::a"], ["refund"]))
+    writer.start()
+    writer.join(1)
+    assert not writer.is_alive()  # another project's write is not stuck behind the build
+    server._update_lexical_index("big", ["big::new"], ["refund payment"])
+    server._remove_from_lexical_index("big", ["big::d0"])
+    release.set()
+    builder.join(5)
+    idx = server._lexical_indexes["big"]
+    assert sorted(doc_id for doc_id, _ in idx.search("refund login checkout", 5)) == ["big::d1", "big::new"]
+    assert len(server._lexical_indexes["other"]) == 1
+
+
+def test_lexical_tokens_split_identifiers():
+    tokens = server._lexical_tokens("validateToken(ERR_AUTH_401)")
+    assert "validatetoken" in tokens
+    assert {"validate", "token", "err_auth_401", "err", "auth", "401"} <= set(tokens)
+
+
+def test_lexical_index_ranks_and_removes():
+    idx = server._LexicalIndex()
+    idx.add("a", "def validate_token(token): raise AuthError")
+    idx.add("b", "def checkout(cart): pass")
+    idx.add("c", "token token token refresh")
+    hits = idx.search("validate_token", 3)
+    assert hits[0][0] == "a"
+    idx.remove("a")
+    assert all(doc_id != "a" for doc_id, _ in idx.search("validate_token", 3))
+    assert len(idx) == 2
+
+
+def test_hybrid_search_finds_exact_identifier(client):
+    docs = [f"def helper_{i}(): return compute_value({i})" for i in range(12)]
+    docs.append("raise AuthError('ERR_AUTH_401: token expired')")
+    client.post("/index", json={
+        "project": "hybrid",
+        "documents": docs,
+        "ids": [f"hybrid::f{i}.py::0" for i in range(len(docs))],
+        "metadatas": [{"type": "code"} for _ in docs],
+    })
+    r = client.post("/search", json={"project": "hybrid", "query": "ERR_AUTH_401", "n_results": 3,
+                                     "mode": "hybrid"})
+    assert r.status_code == 200
+    results = r.get_json()["results"]
+    assert results["ids"][0][0] == "hybrid::f12.py::0"
+    assert len(results["ids"][0]) == 3
+    assert len(results["scores"][0]) == 3
+    assert results["scores"][0] == sorted(results["scores"][0], reverse=True)
+
+
+def test_hybrid_search_respects_filter_and_new_writes(client):
+    _index_mixed(client, "hyb-filter")
+    body = {"project": "hyb-filter", "query": "login", "mode": "hybrid", "filter": {"type": "ticket"}}
+    r = client.post("/search", json=body)
+    assert r.get_json()["results"]["ids"] == [["hyb-filter::BUG-001.md::0"]]
+
+    client.post("/index", json={"project": "hyb-filter", "documents": ["## BUG-002 login_retry loop"],
+                                "ids": ["hyb-filter::BUG-002.md::0"], "metadatas": [{"type": "ticket"}]})
+    body["query"] = "login_retry"
+    ids = client.post("/search", json=body).get_json()["results"]["ids"][0]
+    assert ids[0] == "hyb-filter::BUG-002.md::0"
+
+
+def test_search_rejects_unknown_mode(client):
+    r = client.post("/search", json={"project": "alpha", "query": "x", "mode": "fuzzy"})
+    assert r.status_code == 400
+
+
+def test_search_batch_supports_hybrid(client):
+    _index_mixed(client, "hyb-batch")
+    r = client.post("/search/batch", json={"project": "hyb-batch", "queries": [
+        {"query": "checkout", "mode": "hybrid", "n_results": 1}, "login"]})
+    results = r.get_json()["results"]
+    assert results["checkout"]["ids"] == [["hyb-batch::shop.py::0"]]
+    assert "scores" in results["checkout"]
+    assert "scores" not in results["login"]
+
+
+def test_search_batch_inherits_and_validates_top_level_mode(client):
+    _index_mixed(client, "hyb-top")
+    r = client.post("/search/batch", json={"project": "hyb-top", "mode": "hybrid", "queries": [
+        "checkout", {"query": "login", "mode": "vector"}]})
+    results = r.get_json()["results"]
+    assert "scores" in results["checkout"]
+    assert "scores" not in results["login"]
+    r = client.post("/search/batch", json={"project": "hyb-top", "mode": "bogus", "queries": ["login"]})
+    assert r.status_code == 400
+
+
+def test_load_embedder_rejects_unknown_backend():
+    with pytest.raises(ValueError):
+        server._load_embedder("fp4", server.EMBED_MODEL_NAME)
+
+
+def test_embedding_cache_keyed_by_backend(monkeypatch):
+    monkeypatch.setattr(server, "_embedding_cache", server._LRUCache(10, 0))
+    monkeypatch.setattr(server, "_encode", lambda texts: [[1.0] for _ in texts])
+    server._embed_queries(["auth"])
+    monkeypatch.setattr(server, "EMBED_BACKEND", "int8")
+    server._embed_queries(["auth"])
+    assert server._embedding_cache.stats()["misses"] == 2
+
+
+def test_ready_waits_for_warmup(client, monkeypatch):
+    client.post("/index", json={"project": "hot", "documents": ["def hot(): pass"], "ids": ["hot::0"]})
+    server._clients.clear()
+    server._collections.clear()
+    monkeypatch.setattr(server, "_ready", server.threading.Event())
+    monkeypatch.setattr(server, "_warmup_enabled", True)
+    monkeypatch.setattr(server, "_startup_metrics", dict(server._startup_metrics, projects_loaded=[]))
+
+    r = client.get("/ready")
+    assert r.status_code == 503
+    assert r.get_json()["status"] == "starting"
+
+    server._warm_up(["hot", "missing"])
+    r = client.get("/ready")
+    assert r.status_code == 200
+    startup = r.get_json()["startup"]
+    assert startup["projects_loaded"] == ["hot"]
+    assert startup["warmup_encode_seconds"] is not None
+    assert startup["ready_after_seconds"] is not None
+    assert "hot" in server._clients
+    assert not (server.Path(server.BASE_PATH) / "missing").exists()
+
+
+def test_ready_after_lazy_load_without_warmup(client, monkeypatch):
+    monkeypatch.setattr(server, "_ready", server.threading.Event())
+    monkeypatch.setattr(server, "_embedder", None)
+    assert client.get("/ready").status_code == 503
+    client.post("/search", json={"project": "lazy", "query": "anything"})
+    assert client.get("/ready").status_code == 200
+    assert client.get("/stats").get_json()["startup"]["model_load_seconds"] is not None
+
+
+def test_warmup_failure_keeps_server_unready(client, monkeypatch):
+    monkeypatch.setattr(server, "_ready", server.threading.Event())
+    monkeypatch.setattr(server, "_warmup_enabled", True)
+    monkeypatch.setattr(server, "_startup_metrics", dict(server._startup_metrics))
+
+    def boom(texts):
+        raise RuntimeError("no model")
+    monkeypatch.setattr(server, "_encode_direct", boom)
+    server._warm_up([])
+    r = client.get("/ready")
+    assert r.status_code == 503
+    assert r.get_json()["startup"]["warmup_error"] == "no model"
+
+
+def test_metrics_endpoint_exports_prometheus_text(client):
+    client.post("/index", json={"project": "met", "documents": ["def a(): pass", "# notes"],
+                                "ids": ["met::a", "met::b"],
+                                "metadatas": [{"type": "code"}, {"type": "ticket"}]})
+    client.post("/search", json={"project": "met", "query": "a"})
+    client.get("/projects/met/stats")
+
+    r = client.get("/metrics")
+    assert r.status_code == 200
+    assert r.content_type.startswith("text/plain")
+    body = r.get_data(as_text=True)
+    assert 'rag_requests_total{route="/search",method="POST",status="200"} 1' in body
+    assert 'rag_request_duration_seconds_bucket{route="/projects/<name>/stats",method="GET",le="+Inf"} 1' in body
+    assert 'rag_stage_duration_seconds_count{stage="embed"}' in body
+    assert 'rag_stage_duration_seconds_count{stage="chroma_query"}' in body
+    assert 'rag_stage_duration_seconds_count{stage="chroma_write"}' in body
+    assert 'rag_cache_hit_ratio{cache="result"}' in body
+    assert 'rag_project_documents{project="met",type="code"} 1' in body
+    assert 'rag_project_documents{project="met",type="ticket"} 1' in body
+    assert "# TYPE rag_encode_batch_size histogram" in body
+
+
+def test_prom_labels_escape_values():
+    assert server._prom_labels({}) == ""
+    assert server._prom_labels({"a": 'x"y\\z'}) == '{a="x\\"y\\\\z"}'
+
+
+def _long_doc():
+    lines = [f"# filler line {i}" for i in range(40)]
+    lines[25] = "def refresh_session_token(user):"
+    lines[26] = "    return issue_token(user, refresh=True)"
+    return "\n".join(lines)
+
+
+def test_search_snippet_returns_best_window(client):
+    client.post("/index", json={"project": "snip", "documents": [_long_doc()], "ids": ["snip::0"],
+                                "metadatas": [{"type": "code", "file": "auth.py", "start_line": 100}]})
+    r = client.post("/search", json={"project": "snip", "query": "refresh session token", "snippet": 4})
+    assert r.status_code == 200
+    results = r.get_json()["results"]
+    doc = results["documents"][0][0]
+    assert "refresh_session_token" in doc
+    assert doc.count("\n") == 3
+    meta = results["metadatas"][0][0]
+    assert meta["file"] == "auth.py"
+    assert meta["snippet_start_line"] <= 125 <= meta["snippet_end_line"]
+    assert meta["snippet_end_line"] - meta["snippet_start_line"] == 3
+
+
+def test_search_max_chars_and_include_do_not_touch_cache(client):
+    client.post("/index", json={"project": "trim", "documents": [_long_doc()], "ids": ["trim::0"]})
+    body = {"project": "trim", "query": "session", "max_chars": 50, "include": ["ids", "documents"]}
+    trimmed = client.post("/search", json=body).get_json()["results"]
+    assert set(trimmed) == {"ids", "documents"}
+    assert len(trimmed["documents"][0][0]) == 50
+
+    full = client.post("/search", json={"project": "trim", "query": "session"}).get_json()
+    assert full["cached"] is True
+    assert full["results"]["documents"][0][0] == _long_doc()
+    assert "distances" in full["results"]
+
+
+def test_search_rejects_bad_shaping_options(client):
+    for bad in ({"max_chars": 0}, {"include": ["bogus"]}, {"snippet": -1}, {"include": "documents"}):
+        r = client.post("/search", json={"project": "p", "query": "q", **bad})
+        assert r.status_code == 400
+
+
+def test_search_batch_applies_shaping_per_query(client):
+    client.post("/index", json={"project": "bshape", "documents": [_long_doc()], "ids": ["bshape::0"]})
+    r = client.post("/search/batch", json={
+        "project": "bshape", "max_chars": 20,
+        "queries": ["session", {"query": "token", "id": "full", "max_chars": None, "include": ["ids"]}],
+    })
+    results = r.get_json()["results"]
+    assert len(results["session"]["documents"][0][0]) == 20
+    assert results["full"] == {"ids": [["bshape::0"]]}
+
+
+def _index_near_duplicates(client, project):
+    client.post("/index", json={
+        "project": project,
+        "documents": ["token refresh session handler", "token refresh session handler retry",
+                      "token refresh session handler cache", "token refresh login form"],
+        "ids": [f"{project}::a0", f"{project}::a1", f"{project}::a2", f"{project}::b0"],
+        "metadatas": [{"file": "a.py"}, {"file": "a.py"}, {"file": "a.py"}, {"file": "b.py"}],
+    })
+
+
+def test_search_min_score_drops_weak_matches(client):
+    client.post("/index", json={"project": "thr", "documents": ["alpha beta gamma", "zeta eta theta"],
+                                "ids": ["thr::0", "thr::1"]})
+    loose = client.post("/search", json={"project": "thr", "query": "alpha beta gamma"}).get_json()
+    assert len(loose["results"]["ids"][0]) == 2
+    strict = client.post("/search", json={"project": "thr", "query": "alpha beta gamma",
+                                          "min_score": 0.9}).get_json()
+    assert "cached" not in strict
+    assert strict["results"]["ids"][0] == ["thr::0"]
+    assert strict["results"]["similarities"][0][0] >= 0.9
+
+
+def test_search_max_per_file_caps_chunks(client):
+    _index_near_duplicates(client, "cap")
+    r = client.post("/search", json={"project": "cap", "query": "token refresh session handler",
+                                     "n_results": 3, "max_per_file": 1})
+    metas = r.get_json()["results"]["metadatas"][0]
+    assert sorted(m["file"] for m in metas) == ["a.py", "b.py"]
+
+
+def test_search_mmr_prefers_novel_results(client):
+    _index_near_duplicates(client, "mmr")
+    body = {"project": "mmr", "query": "token refresh session handler", "n_results": 2}
+    plain = client.post("/search", json=body).get_json()["results"]
+    assert [m["file"] for m in plain["metadatas"][0]] == ["a.py", "a.py"]
+    diverse = client.post("/search", json={**body, "mmr_lambda": 0.3}).get_json()["results"]
+    assert diverse["ids"][0][0] == "mmr::a0"
+    assert diverse["metadatas"][0][1]["file"] == "b.py"
+
+
+def test_search_batch_applies_ranking(client):
+    _index_near_duplicates(client, "bmmr")
+    r = client.post("/search/batch", json={
+        "project": "bmmr", "n_results": 3, "max_per_file": 1,
+        "queries": ["token refresh session handler", {"query": "token refresh", "mode": "hybrid"}],
+    })
+    for hits in r.get_json()["results"].values():
+        files = [m["file"] for m in hits["metadatas"][0]]
+        assert sorted(files) == ["a.py", "b.py"]
+
+
+def test_search_rejects_bad_ranking_options(client):
+    for bad in ({"min_score": 2}, {"mmr_lambda": -0.1}, {"max_per_file": 0}, {"fetch_k": "10"}):
+        r = client.post("/search", json={"project": "p", "query": "q", **bad})
+        assert r.status_code == 400
+
+
+def _git_repo(path):
+    import subprocess
+
+    def git(*args):
+        subprocess.run(["git", "-C", str(path), *args], check=True, capture_output=True)
+
+    path.mkdir()
+    git("init", "-q")
+    git("config", "user.email", "t@example.com")
+    git("config", "user.name", "t")
+
+    def commit(files: dict, message: str) -> str:
+        for name, content in files.items():
+            target = path / name
+            if content is None:
+                git("rm", "-q", name)
+                continue
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_text(content)
+            git("add", name)
+        git("commit", "-q", "-m", message)
+        return subprocess.run(["git", "-C", str(path), "rev-parse", "HEAD"],
+                              check=True, capture_output=True, text=True).stdout.strip()
+    return git, commit
+
+
+def _files_in(project):
+    col = server._get_collection(project)
+    return sorted(m["file"] for m in col.get(include=["metadatas"])["metadatas"])
+
+
+def test_sync_indexes_only_git_delta(client, tmp_path):
+    repo = tmp_path / "repo"
+    git, commit = _git_repo(repo)
+    first = commit({"a.py": "def a(): pass", "b.py": "def b(): pass", "notes.bin": "x",
+                    "old.py": "def old_name(): pass"}, "init")
+
+    r = client.post("/projects/gitproj/sync", json={"repo_path": str(repo)})
+    assert r.status_code == 200
+    data = r.get_json()
+    assert data["full"] is True
+    assert data["revision"] == first
+    assert data["files_upserted"] == 3
+    assert _files_in("gitproj") == ["a.py", "b.py", "old.py"]
+
+    git("mv", "old.py", "new.py")
+    second = commit({"a.py": "def a(): return 1", "b.py": None, "c.py": "def c(): pass"}, "change")
+    data = client.post("/projects/gitproj/sync", json={"repo_path": str(repo)}).get_json()
+    assert data["from_revision"] == first
+    assert data["revision"] == second
+    assert data["full"] is False
+    assert data["files_upserted"] == 3  # a.py, c.py, new.py
+    assert data["files_deleted"] == 2  # b.py, old.py
+    assert data["files_renamed"] == 1
+    assert _files_in("gitproj") == ["a.py", "c.py", "new.py"]
+    assert client.get("/projects/gitproj/stats").get_json()["metadata"]["indexed_revision"] == second
+    projects = {p["name"]: p for p in client.get("/projects").get_json()["projects"]}
+    assert projects["gitproj"]["count"] == 3
+
+    again = client.post("/projects/gitproj/sync", json={"repo_path": str(repo)}).get_json()
+    assert again["files_upserted"] == 0
+    assert again["generation"] == data["generation"]
+
+
+def test_long_sync_keeps_its_project_resident(client, tmp_path, monkeypatch):
+    repo = tmp_path / "repo"
+    _, commit = _git_repo(repo)
+    commit({f"m{i}.py": f"def m{i}(): pass" for i in range(4)}, "init")
+    monkeypatch.setattr(server, "MAX_RESIDENT_PROJECTS", 1)
+    monkeypatch.setattr(server, "INDEX_JOB_CHUNK_SIZE", 1)
+    upsert = server._upsert_documents
+    seen = []
+
+    def busy_neighbour(project, col, *args):
+        seen.append(col is server._collections.get(project))  # writing through a resident client
+        server._get_collection("neighbour")  # another request evicts the syncing project
+        return upsert(project, col, *args)
+
+    monkeypatch.setattr(server, "_upsert_documents", busy_neighbour)
+    r = client.post("/projects/busy/sync", json={"repo_path": str(repo)})
+    assert r.status_code == 200
+    assert r.get_json()["indexed"] == 4
+    assert seen == [True] * 4
+
+
+def test_sync_full_removes_files_missing_from_tree(client, tmp_path):
+    repo = tmp_path / "repo"
+    git, commit = _git_repo(repo)
+    first = commit({"a.py": "def a(): pass", "b.py": "def b(): pass"}, "init")
+    client.post("/projects/fullproj/sync", json={"repo_path": str(repo)})
+    commit({"b.py": None}, "drop b")
+    client.post("/index", json={"project": "fullproj", "documents": ["manual"], "ids": ["manual::0"],
+                                "metadatas": [{"file": "scratch.py"}]})
+    data = client.post("/projects/fullproj/sync", json={"repo_path": str(repo), "full": True}).get_json()
+    assert data["full"] is True
+    assert data["files_deleted"] == 1
+    assert data["skipped_unchanged"] == 1
+    assert _files_in("fullproj") == ["a.py", "scratch.py"]
+
+
+def test_sync_rejects_bad_input(client, tmp_path):
+    assert client.post("/projects/p/sync", json={}).status_code == 400
+    assert client.post("/projects/p/sync", json={"repo_path": str(tmp_path / "nope")}).status_code == 400
+    repo = tmp_path / "repo"
+    _, commit = _git_repo(repo)
+    commit({"a.py": "x"}, "init")
+    r = client.post("/projects/p/sync", json={"repo_path": str(repo), "revision": "no-such-rev"})
+    assert r.status_code == 400
+    assert "rev-parse" in r.get_json()["error"]
+
+
+def test_export_import_roundtrip_without_reembedding(client, monkeypatch):
+    _index_mixed(client, "src")
+    snapshot = client.get("/projects/src/export")
+    assert snapshot.status_code == 200
+    blob = snapshot.get_data()
+    assert blob.startswith(server.SNAPSHOT_MAGIC)
+
+    def no_encode(texts):
+        raise AssertionError("import must not re-embed")
+    encode = server._encode_direct
+    monkeypatch.setattr(server, "_encode_direct", no_encode)
+
+    r = client.post("/projects/copy/import", data=blob)
+    assert r.status_code == 200
+    assert r.get_json()["imported"] == r.get_json()["document_count"] == 3
+    monkeypatch.setattr(server, "_encode_direct", encode)
+
+    src = client.post("/search", json={"project": "src", "query": "login", "n_results": 4}).get_json()
+    copy = client.post("/search", json={"project": "copy", "query": "login", "n_results": 4}).get_json()
+    assert copy["results"]["ids"][0] == src["results"]["ids"][0]
+    projects = {p["name"]: p for p in client.get("/projects").get_json()["projects"]}
+    assert projects["copy"]["code_count"] == projects["src"]["code_count"]
+
+
+def test_import_replace_and_merge(client):
+    client.post("/index", json={"project": "snapa", "documents": ["alpha"], "ids": ["a::0"]})
+    client.post("/index", json={"project": "snapb", "documents": ["beta"], "ids": ["b::0"]})
+    blob = client.get("/projects/snapa/export").get_data()
+
+    merged = client.post("/projects/snapb/import?mode=merge", data=blob).get_json()
+    assert merged["document_count"] == 2
+    replaced = client.post("/projects/snapb/import", data=blob).get_json()
+    assert replaced["document_count"] == 1
+
+
+def test_long_import_keeps_its_project_resident(client, monkeypatch):
+    _index_mixed(client, "isrc")
+    monkeypatch.setattr(server, "SNAPSHOT_PAGE_SIZE", 1)
+    blob = client.get("/projects/isrc/export").get_data()
+    monkeypatch.setattr(server, "MAX_RESIDENT_PROJECTS", 1)
+    timed = server._timed
+    resident = []
+
+    @contextmanager
+    def busy_neighbour(stage):
+        if stage == "chroma_write":
+            resident.append("idst" in server._collections)
+            server._get_collection("neighbour")  # another request evicts the importing project
+        with timed(stage):
+            yield
+
+    monkeypatch.setattr(server, "_timed", busy_neighbour)
+    r = client.post("/projects/idst/import", data=blob)
+    assert r.get_json()["document_count"] == 3
+    assert resident == [True] * 3
+
+
+def test_long_export_keeps_its_project_resident(client, monkeypatch):
+    _index_mixed(client, "esrc")
+    monkeypatch.setattr(server, "SNAPSHOT_PAGE_SIZE", 1)
+    monkeypatch.setattr(server, "MAX_RESIDENT_PROJECTS", 1)
+    r = client.get("/projects/esrc/export", buffered=False)
+    resident, chunks = [], []
+    for chunk in r.response:
+        chunks.append(chunk)
+        if chunk.startswith(b'{"rows": 1'):
+            resident.append("esrc" in server._collections)
+            server._get_collection("neighbour")  # another request evicts the exporting project
+    r.close()
+    assert resident == [True] * 3
+    assert client.post("/projects/ecopy/import", data=b"".join(chunks)).get_json()["document_count"] == 3
+
+
+def test_import_rejects_bad_snapshots(client, monkeypatch):
+    client.post("/index", json={"project": "snapc", "documents": ["gamma"], "ids": ["c::0"]})
+    blob = client.get("/projects/snapc/export").get_data()
+    assert client.post("/projects/x/import", data=b"garbage").status_code == 400
+    assert client.post("/projects/x/import", data=blob[:-20]).status_code == 400
+    assert client.post("/projects/x/import?mode=append", data=blob).status_code == 400
+    monkeypatch.setattr(server, "EMBED_BACKEND", "int8")
+    assert client.post("/projects/x/import", data=blob).status_code == 409
+
+
+def test_truncated_import_leaves_existing_index_intact(client):
+    client.post("/index", json={"project": "snapd", "documents": ["delta", "epsilon"],
+                                "ids": ["d::0", "d::1"]})
+    blob = client.get("/projects/snapd/export").get_data()
+    # Cut off only the closing {"rows": 0} record: every page is complete
+    assert blob.endswith(b'{"rows": 0}\n')
+    truncated = blob[:-len(b'{"rows": 0}\n')]
+    assert client.post("/projects/snapd/import", data=truncated).status_code == 400
+    assert client.post("/projects/snapd/import", data=blob[:-40]).status_code == 400
+    projects = {p["name"]: p for p in client.get("/projects").get_json()["projects"]}
+    assert projects["snapd"]["count"] == 2
+
+
+def test_export_unknown_project(client):
+    assert client.get("/projects/nope/export").status_code == 404
+
+
+def test_delete_files_removes_all_chunks_of_a_file(client):
+    client.post("/index", json={
+        "project": "del",
+        "documents": ["def a(): pass", "def a2(): pass", "def b(): pass"],
+        "ids": ["del::a.py::0", "del::a.py::1", "del::b.py::0"],
+        "metadatas": [{"file": "a.py", "type": "code"}, {"file": "a.py", "type": "code"},
+                      {"file": "b.py", "type": "code"}],
+    })
+    before = client.post("/search", json={"project": "del", "query": "def"}).get_json()["generation"]
+    r = client.delete("/projects/del/files", json={"files": ["a.py", "missing.py"]})
+    assert r.status_code == 200
+    assert r.get_json()["removed"] == 2
+    assert r.get_json()["generation"] > before
+
+    ids = client.post("/search", json={"project": "del", "query": "def", "n_results": 5}).get_json()
+    assert ids["results"]["ids"][0] == ["del::b.py::0"]
+    projects = {p["name"]: p for p in client.get("/projects").get_json()["projects"]}
+    assert projects["del"]["code_count"] == 1
+
+
+def test_delete_files_validates_body(client):
+    assert client.delete("/projects/del/files", json={}).status_code == 400
+    assert client.delete("/projects/del/files", json={"files": "a.py"}).status_code == 400
+    assert client.delete("/projects/never/files", json={"files": ["a.py"]}).get_json()["removed"] == 0
+    assert "never" not in [p["name"] for p in client.get("/projects").get_json()["projects"]]
+
+
+def test_index_prunes_chunks_beyond_new_chunk_count(client):
+    def index(n_chunks):
+        return client.post("/index", json={
+            "project": "shrink",
+            "documents": [f"part {i} of the file" for i in range(n_chunks)],
+            "ids": [f"shrink::f.py::{i}" for i in range(n_chunks)],
+            "metadatas": [{"file": "f.py", "type": "code", "chunk": i, "chunks": n_chunks}
+                          for i in range(n_chunks)],
+        }).get_json()
+
+    index(4)
+    client.post("/index", json={"project": "shrink", "documents": ["other"], "ids": ["shrink::g.py::0"],
+                                "metadatas": [{"file": "g.py", "type": "code", "chunk": 0, "chunks": 1}]})
+    result = index(2)
+    assert result["pruned"] == 2
+    assert _files_in("shrink") == ["f.py", "f.py", "g.py"]
+    projects = {p["name"]: p for p in client.get("/projects").get_json()["projects"]}
+    assert projects["shrink"]["code_count"] == 3
+
+
+def test_sync_indexes_whole_files_as_chunks(client, tmp_path):
+    repo = tmp_path / "repo"
+    git, commit = _git_repo(repo)
+    big = "\n\n".join(f"def f{i}():\n    return {'x' * 200}" for i in range(40))
+    commit({"big.py": big}, "init")
+    data = client.post("/projects/chunks/sync", json={"repo_path": str(repo)}).get_json()
+    total = data["indexed"]
+    assert total > 1
+    commit({"big.py": "def f0():\n    return 1\n"}, "shrink")
+    data = client.post("/projects/chunks/sync", json={"repo_path": str(repo)}).get_json()
+    assert data["removed_docs"] == total - 1
+    assert _files_in("chunks") == ["big.py"]
+
+
+def test_serve_resumes_interrupted_jobs_at_startup(monkeypatch):
+    started = []
+    monkeypatch.setitem(sys.modules, "gunicorn.app.base", None)  # Werkzeug fallback
+    monkeypatch.setattr(server.atexit, "register", lambda fn: None)
+    monkeypatch.setattr(server, "_start_warmup", lambda: started.append("warmup"))
+    monkeypatch.setattr(server, "_ensure_job_worker", lambda: started.append("jobs"))
+    monkeypatch.setattr(server.app, "run", lambda **kw: started.append("run"))
+    server._serve("127.0.0.1", 0, 1, 1)
+    assert started == ["warmup", "jobs", "run"]
+
+
+def test_gunicorn_workers_resume_interrupted_jobs(monkeypatch):
+    base = pytest.importorskip("gunicorn.app.base")
+    started = []
+    monkeypatch.setattr(server, "_start_warmup", lambda: started.append("warmup"))
+    monkeypatch.setattr(server, "_ensure_job_worker", lambda: started.append("jobs"))
+    monkeypatch.setattr(base.BaseApplication, "run", lambda self: self.cfg.post_worker_init(None))
+    server._serve("127.0.0.1", 0, 2, 1)
+    assert started == ["warmup", "jobs"]
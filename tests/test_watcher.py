@@ -11,6 +11,15 @@ import pytest
 sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
 
 
+@pytest.fixture(autouse=True)
+def manifest_dir(tmp_path, monkeypatch):
+    """Keep catch-up manifests out of the real ~/.backlog-toolkit."""
+    from scripts.rag import watcher as w
+    path = tmp_path / "manifests"
+    monkeypatch.setattr(w, "MANIFEST_DIR", str(path))
+    return path
+
+
 def test_get_project_from_config(tmp_path):
     cfg = tmp_path / "backlog.config.json"
     cfg.write_text(json.dumps({"project": {"name": "watch-test"}}))
@@ -32,7 +41,7 @@ def test_should_ignore_git(tmp_path):
 
 
 def test_watcher_indexes_new_file(tmp_path):
-    """Watcher should call upsert_file when a new .py file is created."""
+    """Watcher should call index_files when a new .py file is created."""
     cfg = tmp_path / "backlog.config.json"
     cfg.write_text(json.dumps({"project": {"name": "watch-test"}}))
 
@@ -43,7 +52,7 @@ def test_watcher_indexes_new_file(tmp_path):
 
     with patch.object(w, "RagClient") as MockClient:
         instance = MockClient.return_value
-        instance.upsert_file.side_effect = lambda p, **kw: upserted.append(p)
+        instance.index_files.side_effect = lambda paths, **kw: upserted.extend(paths)
 
         obs = w.start_watcher(str(tmp_path), debounce_seconds=0.1)
         time.sleep(0.3)  # let observer start
@@ -69,7 +78,7 @@ def test_watcher_indexes_ticket(tmp_path):
 
     with patch.object(w, "RagClient") as MockClient:
         instance = MockClient.return_value
-        instance.upsert_file.side_effect = lambda p, type="code", **kw: types_seen.append(type)
+        instance.index_files.side_effect = lambda paths, type="code", **kw: types_seen.append(type)
 
         obs = w.start_watcher(str(tmp_path), debounce_seconds=0.1)
         time.sleep(0.3)
@@ -81,3 +90,149 @@ def test_watcher_indexes_ticket(tmp_path):
         obs.join()
 
     assert "ticket" in types_seen, f"types_seen={types_seen}"
+
+
+def test_watcher_removes_deleted_and_renamed_files(tmp_path):
+    """Deleting or renaming a file should remove the old path from the index."""
+    cfg = tmp_path / "backlog.config.json"
+    cfg.write_text(json.dumps({"project": {"name": "delete-test"}}))
+    (tmp_path / "gone.py").write_text("x = 1")
+    (tmp_path / "old.py").write_text("y = 2")
+
+    from scripts.rag import watcher as w
+
+    deleted, upserted = [], []
+
+    with patch.object(w, "RagClient") as MockClient:
+        instance = MockClient.return_value
+        instance.delete_files.side_effect = lambda paths: deleted.extend(Path(p).name for p in paths)
+        instance.index_files.side_effect = lambda paths, **kw: upserted.extend(Path(p).name for p in paths)
+
+        obs = w.start_watcher(str(tmp_path), debounce_seconds=0.1)
+        time.sleep(0.3)
+
+        (tmp_path / "gone.py").unlink()
+        (tmp_path / "old.py").rename(tmp_path / "new.py")
+        time.sleep(0.8)
+
+        obs.stop()
+        obs.join()
+
+    assert sorted(deleted) == ["gone.py", "old.py"], f"deleted={deleted}"
+    assert "new.py" in upserted, f"upserted={upserted}"
+
+
+def test_handler_flushes_bursts_in_bounded_batches(tmp_path):
+    """A burst of events becomes a handful of batched requests from one thread."""
+    from scripts.rag import watcher as w
+
+    client = MagicMock()
+    handler = w._ChangeHandler(client, debounce=0.1, max_batch=100)
+    threads_before = threading.active_count()
+    for i in range(250):
+        handler._schedule(str(tmp_path / f"f{i}.py"))
+    handler._schedule(str(tmp_path / "f0.py"), "delete")  # latest action wins
+    assert threading.active_count() == threads_before
+    time.sleep(0.5)
+
+    sizes = [len(c.args[0]) for c in client.index_files.call_args_list]
+    assert sizes == [100, 100, 49]
+    client.delete_files.assert_called_once_with([str(tmp_path / "f0.py")])
+
+
+def test_handler_flushes_during_constant_event_stream(tmp_path):
+    """max_delay forces a flush even if events never pause for the debounce window."""
+    from scripts.rag import watcher as w
+
+    client = MagicMock()
+    handler = w._ChangeHandler(client, debounce=0.05)
+    handler.max_delay = 0.2
+    deadline = time.monotonic() + 0.6
+    i = 0
+    while time.monotonic() < deadline:
+        handler._schedule(str(tmp_path / f"s{i}.py"))
+        i += 1
+        time.sleep(0.01)
+    assert client.index_files.call_count >= 2
+
+
+def test_catch_up_diffs_tree_against_manifest(tmp_path):
+    from scripts.rag import watcher as w
+
+    root = tmp_path / "repo"
+    root.mkdir()
+    for name in ("keep.py", "edit.py", "gone.py", "touched.py"):
+        (root / name).write_text(f"# {name}")
+    manifest = w._Manifest(tmp_path / "m.json", str(root))
+    manifest.record([str(p) for p in root.iterdir()])
+    manifest.save()
+
+    (root / "edit.py").write_text("# edited, longer content")
+    (root / "gone.py").unlink()
+    (root / "new.py").write_text("# new")
+    os.utime(root / "touched.py", (1, 1))
+    (root / "node_modules").mkdir()
+    (root / "node_modules" / "dep.js").write_text("x")
+
+    changed, deleted = w._catch_up(w._Manifest(tmp_path / "m.json", str(root)), str(root))
+    assert sorted(Path(p).name for p in changed) == ["edit.py", "new.py"]
+    assert [Path(p).name for p in deleted] == ["gone.py"]
+
+
+def test_manifest_for_other_root_is_ignored(tmp_path):
+    from scripts.rag import watcher as w
+
+    (tmp_path / "a.py").write_text("x")
+    manifest = w._Manifest(tmp_path / "m.json", str(tmp_path))
+    manifest.record([str(tmp_path / "a.py")])
+    manifest.save()
+    assert w._Manifest(tmp_path / "m.json", str(tmp_path)).files
+    assert w._Manifest(tmp_path / "m.json", "/elsewhere").files == {}
+
+
+def test_watcher_catches_up_after_restart(tmp_path, manifest_dir):
+    """Changes made while the watcher was down are indexed on the next start."""
+    cfg = tmp_path / "backlog.config.json"
+    cfg.write_text(json.dumps({"project": {"name": "catchup"}}))
+    (tmp_path / "a.py").write_text("a = 1")
+    (tmp_path / "b.py").write_text("b = 1")
+
+    from scripts.rag import watcher as w
+
+    def run() -> tuple:
+        indexed, deleted = [], []
+        with patch.object(w, "RagClient") as MockClient:
+            instance = MockClient.return_value
+            instance.index_files.side_effect = lambda paths, **kw: indexed.extend(Path(p).name for p in paths)
+            instance.delete_files.side_effect = lambda paths: deleted.extend(Path(p).name for p in paths)
+            obs = w.start_watcher(str(tmp_path), debounce_seconds=0.1)
+            time.sleep(0.6)
+            obs.stop()
+            obs.join()
+        return sorted(indexed), sorted(deleted)
+
+    assert run() == (["a.py", "b.py"], [])  # first run: nothing in the manifest yet
+    assert (manifest_dir / "catchup.json").exists()
+    assert run() == ([], [])  # nothing changed while stopped
+
+    (tmp_path / "a.py").write_text("a = 2  # changed while stopped")
+    (tmp_path / "b.py").unlink()
+    assert run() == (["a.py"], ["b.py"])
+
+
+def test_rejected_files_are_not_recorded_in_manifest(tmp_path):
+    """A batch the server rejects is retried by the next catch-up."""
+    import requests
+    from scripts.rag import watcher as w
+
+    (tmp_path / "a.py").write_text("a = 1")
+    manifest = w._Manifest(tmp_path / "m.json", str(tmp_path))
+    rejected = MagicMock(status_code=500)
+    rejected.json.return_value = {"error": "boom"}
+    rejected.raise_for_status.side_effect = requests.exceptions.HTTPError("500 Server Error")
+    handler = w._ChangeHandler(w.RagClient(project="p", base_url="http://localhost:9999"),
+                               debounce=0.1, manifest=manifest)
+    with patch("requests.Session.post", return_value=rejected):
+        handler._flush({str(tmp_path / "a.py"): "upsert"})
+    changed, _ = w._catch_up(w._Manifest(tmp_path / "m.json", str(tmp_path)), str(tmp_path))
+    assert [Path(p).name for p in changed] == ["a.py"]